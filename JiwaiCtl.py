@@ -1,697 +1,32 @@
-import csv
+import argparse
 import datetime
-import hashlib
-import json
 import os
 import sys
-import time
-import winsound
-from logging import DEBUG, ERROR, WARNING, INFO
+from logging import DEBUG, WARNING, INFO
 from logging import getLogger, StreamHandler, Formatter, FileHandler
-from typing import Union, List, Dict, Final
+from typing import Union, List, Final
 
-import pyvisa
-
-import machines_controller.bipolar_power_ctl as visa_bp
-import machines_controller.gauss_ctl as visa_gs
-from machines_controller.bipolar_power_ctl import Current
+from jiwai import Session, sound
+from jiwai.journal import start_queue_logging
+from jiwai.ring import SampleRing, RING_NAME_PREFIX
+from jiwai.telemetry import Telemetry
+from machines_controller.bipolar_power_ctl import BipolarPower, PowerInterlockError
+from machines_controller.current import Current
+from machines_controller.gauss_ctl import GaussMeter
+from machines_controller.visa_trace import ReplayResource
 
 LOGLEVEL = INFO
 LOGFILE = "JiwaiCtl.log"
 PRINT_LOGLEVEL = WARNING
 # PRINT_LOGLEVEL = DEBUG
 
-HELM_Oe2CURRENT_CONST: float = 20.960 / 1000  # ヘルムホルツコイル用磁界電流変換係数 mA換算用
-HELM_MAGNET_FIELD_LIMIT: Final = 150
-ELMG_MAGNET_FIELD_LIMIT: Final = 4150
-
-OECTL_LOOP_LIMIT: int = 12
-OECTL_BASE_COEFFICIENT: float = 0.96
-OECTL_RANGE_COEFFICIENT: float = 0.12
-
-DB_NAME: Final = "setting.db"
-
-MEASURE_RECORD_BASE_DIR: Final = "./logs/"
-MEASURE_RECORD_DIR_NAME: Final = datetime.datetime.now().strftime("%Y%m%d")
-MEASURE_RECORD_DIR: Final = os.path.join(os.path.abspath(MEASURE_RECORD_BASE_DIR), MEASURE_RECORD_DIR_NAME)
-BEEP_HZ = 2000
-BEEP_SHORT = 300
-BEEP_LONG = 1000
-BEEP_DOT = 100
-
-
-def beep_s():
-    winsound.Beep(BEEP_HZ, BEEP_DOT)
-    time.sleep(BEEP_DOT / 1000)
-    winsound.Beep(BEEP_HZ, BEEP_DOT)
-    time.sleep(BEEP_DOT / 1000)
-    winsound.Beep(BEEP_HZ, BEEP_DOT)
-
-
-class MeasureSetting:  #
-    force_demag: bool = False  # 測定前に消磁を強制するかどうか
-    demag_step: int = 15
-    control_mode: str = "oectl"  # 制御モード "oectl":磁界制御, "current":電流制御
-
-    measure_sequence: List[List[Union[int, float]]] = [[]]  # 測定シークエンス
-
-    pre_lock_sec: float = 1.5  # 磁界設定後に状態を記録するまでの時間
-    post_lock_sec: float = 1.5  # 状態を記録してから状態をロックする時間
-
-    pre_block_sec: float = 10  # 測定シークエンスを開始する前に0番目の設定磁界でブロックする時間
-    pre_block_td: datetime.timedelta = datetime.timedelta(seconds=10)
-    post_block_sec: float = 10  # 最後の測定条件で記録してからBG補正用に同じ測定条件でブロックする時間
-    post_block_td: datetime.timedelta = datetime.timedelta(seconds=10)
-    blocking_monitoring_sec: float = 5  # ブロック動作を行っているときにモニタリングを行う間隔
-    blocking_monitoring_td: datetime.timedelta = datetime.timedelta(seconds=5)
-
-    autorange: bool = False
-    use_cache: bool = False
-
-    # 以下状態管理変数
-    verified: bool = False  # 測定シークエンスが検証済みか
-    have_error: bool = False
-    filepath: str = None
-
-    is_cached: bool = False
-    cached_sequence: List[List[int]] = []
-    cached_range: List[List[int]] = []
-
-    @staticmethod
-    def log_key_notfound(key: str, level: int = DEBUG) -> None:
-        logger.log(level, "[{0}] キーが見つかりません".format(key))
-        return
-
-    @staticmethod
-    def log_invalid_value(key: str, val: str, level: int = DEBUG) -> None:
-        logger.log(level, "[{0}] キーの設定値が不正 : 入力値 = {1}".format(key, val))
-        return
-
-    @staticmethod
-    def log_2small_value(key: str, val: Union[int, float], minimum: Union[int, float], level: int = DEBUG) -> None:
-        logger.log(level, "[{0}] キーの設定値が小さい : 最低値 = {2} ,入力値 = {1} = {1}".format(key, val, minimum))
-        return
-
-    @staticmethod
-    def log_use_default(key: str, val: Union[int, float, str]) -> None:
-        logger.warning("[{0}] キーが未定義 初期値を使用 : {1}".format(key, val))
-        return
-
-    def __init__(self, seq_dict: Dict[str, any] = None, filepath: str = None):
-        if seq_dict is None:
-            return
-        if filepath:
-            self.filepath = filepath
-
-        # 必須項目
-        if (key := "connect_to") in seq_dict:
-            mode = seq_dict[key]
-            if not (mode in CONNECT_MAGNET):
-                logger.error("設定ファイルと現在の接続先磁石が不一致")
-                self.have_error = True
-        else:
-            self.log_key_notfound(key, ERROR)
-            self.have_error = True
-
-        if (key := "seq") in seq_dict:
-            self.measure_sequence = seq_dict[key]
-        else:
-            self.log_key_notfound(key, ERROR)
-            self.have_error = True
-
-        if (key := "control") in seq_dict:
-            mode = seq_dict[key]
-            if "oectl" in mode:
-                self.control_mode = "oectl"
-            elif "current" in mode:
-                self.control_mode = "current"
-            else:
-                self.log_invalid_value(key, seq_dict[key], ERROR)
-                self.have_error = True
-        else:
-            self.log_key_notfound(key, ERROR)
-            self.have_error = True
-
-        # options
-        if (key := "use_cache") in seq_dict:
-            try:
-                self.use_cache = bool(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-
-        if (key := "autorange") in seq_dict:
-            try:
-                self.autorange = bool(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-        else:
-            if self.control_mode == "oectl":
-                self.log_use_default(key, self.pre_lock_sec)
-                self.verified = False
-
-        if (key := "demag") in seq_dict:
-            try:
-                self.force_demag = bool(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-        else:
-            self.log_use_default(key, self.force_demag)
-            self.verified = False
-
-        if (key := "demag_step") in seq_dict:
-            try:
-                self.demag_step = int(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-
-            if self.demag_step < 1:
-                self.log_invalid_value(key, seq_dict[key], ERROR)
-                self.have_error = True
-
-        if (key := "pre_lock_sec") in seq_dict:
-            try:
-                val = float(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-                self.verified = False
-            else:
-                if val < 0:
-                    self.log_2small_value(key, val, 0, WARNING)
-                    self.verified = False
-                else:
-                    self.pre_lock_sec = val
-        else:
-            self.log_use_default(key, self.pre_lock_sec)
-
-        if (key := "post_lock_sec") in seq_dict:
-
-            try:
-                val = float(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-                self.verified = False
-            else:
-                if val < 0:
-                    self.log_2small_value(key, val, 0, WARNING)
-                    self.verified = False
-                else:
-                    self.post_lock_sec = val
-        else:
-            self.log_use_default(key, self.post_lock_sec)
-
-        if (key := "pre_block_sec") in seq_dict:
-            minimum = 0.2
-            try:
-                val = float(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-                self.verified = False
-            else:
-                if val < minimum:
-                    self.log_2small_value(key, val, minimum, WARNING)
-                    self.verified = False
-                else:
-                    self.pre_block_sec = val
-                    self.pre_block_td = datetime.timedelta(seconds=val)
-        else:
-            self.log_use_default(key, self.pre_block_sec)
-
-        if (key := "post_block_sec") in seq_dict:
-            minimum = 0.2
-            try:
-                val = float(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-                self.verified = False
-            else:
-                if val < minimum:
-                    self.log_2small_value(key, val, minimum, WARNING)
-                    self.verified = False
-                else:
-                    self.post_block_sec = val
-                    self.post_block_td = datetime.timedelta(seconds=val)
-        else:
-            self.log_use_default(key, self.post_block_sec)
-
-        if (key := "blocking_monitoring_sec") in seq_dict:
-            minimum = 1
-            try:
-                val = float(seq_dict[key])
-            except ValueError:
-                self.log_invalid_value(key, seq_dict[key], WARNING)
-                self.verified = False
-            else:
-                if val < minimum:
-                    self.log_2small_value(key, val, minimum, WARNING)
-                    self.verified = False
-                else:
-                    self.blocking_monitoring_sec = val
-                    self.blocking_monitoring_td = datetime.timedelta(seconds=val)
-        else:
-            self.log_use_default(key, self.blocking_monitoring_sec)
-
-        return
-
-    def measure_lock_record(self, target: Union[float, int], pre_lock_time: float, post_lock_time: float,
-                            start_time: datetime.datetime, save_file: str = None, mes_range: int = None) -> Current:
-        current = None
-        change_range = False
-        if not (mes_range is None):
-            change_range = True
-            now_range = gauss.range_fetch()
-            if mes_range < now_range:
-                gauss.range_set(mes_range)
-                change_range = False
-        if self.control_mode == "current" or (self.is_cached and self.use_cache):
-            current = Current(target, "mA")
-            power.set_iset(current)
-        elif self.control_mode == "oectl":
-            current = magnet_field_ctl(target, self.autorange)
-
-        if change_range:
-            gauss.range_set(mes_range)
-
-        time.sleep(pre_lock_time)
-        status = load_status()
-        status.set_origin_time(start_time)
-        status.target = target
-        print(status)
-        if save_file:
-            save_status(save_file, status)
-
-        if post_lock_time == 0:
-            return current
-        time.sleep(post_lock_time)
-
-        status = load_status()
-        status.set_origin_time(start_time)
-        status.target = target
-        print(status)
-        if save_file:
-            save_status(save_file, status)
-        return current
-
-    def remove_cache(self):
-        self.cached_range = []
-        self.cached_sequence = []
-        self.is_cached = False
-        return
-
-    def measure_process(self, measure_seq: List[Union[int, float]], start_time: datetime.datetime,
-                        save_file: str = None, cached_range: Union[List[int]] = None) -> (List[int], List[int]):
-        """
-        測定シークエンスに従って測定を実施する
-
-        :param cached_range:
-        :param measure_seq: 測定シークエンス intのリスト
-        :param start_time: 測定基準時刻
-        :param save_file: ログファイル名
-        """
-
-        res_current: List[int] = []
-        res_range: List[int] = []
-        pre_block_range = None
-        if cached_range is None:
-            pass
-        else:
-            pre_block_range = cached_range[0]
-        self.measure_lock_record(measure_seq[0], self.pre_lock_sec, 0, start_time, save_file=save_file,
-                                 mes_range=pre_block_range)
-        origin_time = datetime.datetime.now()
-        next_time = origin_time + self.blocking_monitoring_td
-        pre_block_end_time = origin_time + self.pre_block_td
-        last_time = pre_block_end_time - self.blocking_monitoring_td
-
-        logger.debug("pre_block_end_time = {0}".format(pre_block_end_time))
-        logger.debug("last_time = {0}".format(last_time))
-        logger.debug("next_time = {0}".format(next_time))
-        while next_time < last_time:
-            logger.debug("next_time = {0}".format(next_time))
-            while datetime.datetime.now() < next_time:
-                time.sleep(0.2)
-            self.measure_lock_record(measure_seq[0], 0, 0, start_time, save_file=save_file, mes_range=pre_block_range)
-            next_time = next_time + self.blocking_monitoring_td
-        else:
-            while datetime.datetime.now() < pre_block_end_time:
-                time.sleep(0.2)
-            self.measure_lock_record(measure_seq[0], 0, 0, start_time, save_file)
-
-        lx = len(measure_seq)
-        loop = 0
-        for target in measure_seq:
-            if cached_range is None:
-                mes_range = None
-            else:
-                mes_range = cached_range[loop]
-            c: Current
-            loop += 1
-            if loop == 1:
-                c = self.measure_lock_record(target, 0, self.post_lock_sec, start_time, save_file, mes_range)
-            elif loop == lx:
-                c = self.measure_lock_record(target, self.pre_lock_sec, 0, start_time, save_file, mes_range)
-            else:
-                c = self.measure_lock_record(target, self.pre_lock_sec, self.post_lock_sec, start_time, save_file,
-                                             mes_range)
-            res_current.append(c.mA())
-            res_range.append(gauss.range_fetch())
-
-        origin_time = datetime.datetime.now()
-        next_time = origin_time + self.blocking_monitoring_td
-        post_block_end_time = origin_time + self.post_block_td
-        last_time = post_block_end_time - self.blocking_monitoring_td
-
-        post_block_range = None
-        if cached_range is None:
-            pass
-        else:
-            post_block_range = cached_range[-1]
-        while next_time < last_time:
-            while datetime.datetime.now() < next_time:
-                time.sleep(0.2)
-            self.measure_lock_record(measure_seq[-1], 0, 0, start_time, save_file, post_block_range)
-            next_time = next_time + self.blocking_monitoring_td
-        else:
-            while datetime.datetime.now() < post_block_end_time:
-                time.sleep(0.2)
-            self.measure_lock_record(measure_seq[-1], 0, 0, start_time, save_file, post_block_range)
-
-        return res_current, res_range
-
-    def measure(self) -> None:
-        """
-        測定プログラム
-        """
-        if not self.verified:
-            print("設定ファイルの検証を行ってください。")
-            return
-        if self.force_demag:
-            oe_mode = True
-            if self.control_mode == "current":
-                oe_mode = False
-            print("消磁中")
-            demag(self.demag_step, oe_mode)
-            print("消磁完了")
-            winsound.Beep(BEEP_HZ, BEEP_DOT)
-            time.sleep(BEEP_DOT / 1000)
-            winsound.Beep(BEEP_HZ, BEEP_DOT)
-
-        if self.use_cache and self.is_cached:
-            sequence = self.cached_sequence
-        else:
-            sequence = self.measure_sequence
-        i = 0
-        for seq in sequence:
-            print("測定シーケンスに入ります Y/n s(kip)")
-            r = input(">>>>>").lower()
-            if r == "n":
-                break
-            if r == "s":
-                continue
-            file = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".log"
-            file, start_time = gen_csv_header(file)
-            if self.use_cache and self.is_cached and self.autorange:
-                self.measure_process(seq, start_time, save_file=file, cached_range=self.cached_range[i])
-
-            else:
-                self.measure_process(seq, start_time, save_file=file)
-            print("測定完了")
-            winsound.Beep(BEEP_HZ, BEEP_DOT)
-            time.sleep(BEEP_DOT / 1000)
-            winsound.Beep(BEEP_HZ, BEEP_DOT)
-
-        gauss.range_set(0)
-        power.set_iset(Current(0, "mA"))
-        return
-
-    def measure_test(self) -> None:
-        """
-        測定設定ファイルを検証する
-        """
-        if self.have_error:
-            logger.error("設定ファイルに致命的な問題あり")
-            self.verified = False
-            return
-        if self.force_demag:
-            oe_mode = True
-            if self.control_mode == "current":
-                oe_mode = False
-            print("消磁中")
-            demag(self.demag_step, oe_mode)
-            print("消磁完了")
-        sequence: List[List[Union[int, float, Current]]]
-        cache_lr: List[List[int]] = []
-        cache_lc: List[List[int]] = []
-        if self.is_cached and self.use_cache:
-            print("cached")
-            sequence = self.cached_sequence
-        else:
-            sequence = self.measure_sequence
-        i = 0
-        for seq in sequence:
-            start_time = datetime.datetime.now()
-            print("測定開始:", start_time.strftime('%Y-%m-%d %H:%M:%S'))
-            try:
-                if self.use_cache and self.is_cached and self.autorange:
-                    cache_c, cache_r = self.measure_process(seq, start_time, cached_range=self.cached_range[i])
-                else:
-                    cache_c, cache_r = self.measure_process(seq, start_time)
-            except ValueError:
-                logger.error("測定値指定が不正です")
-                self.verified = False
-                return
-            i += 1
-            if self.use_cache and (not self.is_cached):
-                cache_lc.append(cache_c)
-                cache_lr.append(cache_r)
-
-        self.verified = True
-        if self.use_cache and (not self.is_cached):
-            self.is_cached = True
-            self.cached_sequence = cache_lc
-            self.cached_range = cache_lr
-
-        print("測定設定は検証されました。")
-        gauss.range_set(0)
-        power.set_iset(Current(0, "mA"))
-        return
-
-
-class SettingDB:
-    filepath: str = ""
-    db: Dict[str, int] = dict()
-    seq: MeasureSetting = MeasureSetting(None, None)
-    now_hash: str = None
-    loading_setting_path: str = None
-
-    cached_seq: Dict[str, List[List[int]]] = dict()
-    cached_range: Dict[str, List[List[int]]] = dict()
-
-    def __init__(self, filename: str):
-        self.filepath = "./" + filename
-        self.load_db()
-        return
-
-    def load_db(self) -> None:
-        if not os.path.exists(self.filepath):
-            return
-        try:
-            with open(self.filepath, "r") as f:
-                self.db = json.load(f)
-        except json.JSONDecodeError:
-            os.remove(self.filepath)
-            logger.warning("setting DB was broken!")
-            return
-        return
-
-    def save_db(self):
-        with open(self.filepath, mode='w', encoding="utf-8")as f:
-            json.dump(self.db, f)
-
-    def hash_check(self, filepath):
-        m = hashlib.sha512()
-        with open(filepath, 'rb') as f:
-            m.update(f.read())
-        self.now_hash = m.hexdigest()
-        return self.now_hash
-
-    def load_measure_sequence(self, filename: str, abspath: bool = False):
-        self.save_cache()
-        if not abspath:
-            json_path = os.path.abspath("./measure_sequence/" + filename)
-            self.loading_setting_path = json_path
-        else:
-            json_path = filename
-
-        if not os.path.exists(json_path):
-            logger.error("File not found! : {0} ".format(filename))
-            return
-
-        try:
-            with open(json_path, "r") as f:
-                seq = json.load(f)
-        except json.JSONDecodeError:
-            logger.error("設定ファイルの読み込み失敗 JSONファイルの構造を確認 ")
-            return
-        self.seq = MeasureSetting(seq)
-        self.hash_check(json_path)
-        if (key := self.now_hash) in self.db:
-            if self.db[key]:
-                logger.info("検証済み設定ファイル {0}".format(json_path))
-                self.seq.verified = True
-            else:
-                logger.info("設定ファイルの変更検知 {0}".format(json_path))
-        else:
-            logger.info("新しい設定ファイル {0}".format(json_path))
-        if self.seq.verified:
-            print("設定ファイルは検証済み")
-            if self.seq.use_cache:
-                self.load_cache()
-        else:
-            print("設定ファイルに未検証の要素有り. test 実行必須")
-        return
-
-    def multi_load(self, args: List[str]):
-        if len(args) == 0:
-            print("引数が与えられていない")
-            return
-
-        for p in args:
-            print("loading : {0}".format(p))
-            self.load_measure_sequence(p)
-            if self.seq.have_error:
-                raise ValueError
-
-        for p in args:
-            print("testing : {0}".format(p))
-            self.load_measure_sequence(p)
-            if not self.seq.verified or (self.seq.use_cache and (not self.seq.is_cached)):
-                self.seq.measure_test()
-
-            if not self.seq.verified:
-                raise ValueError
-            if not (key := self.now_hash) in self.db:
-                self.db[key] = True
-
-        print("読み込み完了")
-        winsound.Beep(BEEP_HZ, BEEP_LONG)
-        return
-
-    def reload_measure_sequence(self):
-        self.seq.remove_cache()
-        self.load_measure_sequence(self.loading_setting_path, True)
-        return
-
-    def seq_verified(self, b: bool):
-        self.seq.verified = b
-        self.db[self.now_hash] = b
-        self.save_db()
-        return
-
-    def save_cache(self):
-        if (not self.seq.verified) or (not self.seq.use_cache) or (not self.seq.is_cached):
-            return
-
-        self.cached_seq[self.now_hash] = self.seq.cached_sequence
-        self.cached_range[self.now_hash] = self.seq.cached_range
-        return
-
-    def load_cache(self):
-        if not self.seq.verified:
-            return
-        if not (self.now_hash in self.cached_seq):
-            return
-
-        self.seq.cached_sequence = self.cached_seq[self.now_hash]
-        self.seq.cached_range = self.cached_range[self.now_hash]
-        self.seq.is_cached = True
-        print("測定キャッシュ読み込み完了")
-        return
-
-
-DB = SettingDB(DB_NAME)
-
-
-class StatusList:
-    iset: float = 0.0
-    iout: float = 0.0
-    field: float = 0.0
-    vout: float = 0.0
-    target: float = 0.0
-    diff_second: int = 0
-
-    def __str__(self):
-        fm = "{:03} sec, ISET= {:>+7.3f} A, IOUT= {:>+7.3f} A, Field= {:>+7.1f} G, VOUT= {:>+7.3f} V, Target= {:>+5}"
-        return fm.format(self.diff_second, self.iset, self.iout, self.field, self.vout, self.target)
-
-    def set_origin_time(self, start_time: datetime.datetime) -> None:
-        """
-        経過時間表示のための基準時刻を設定する
-
-        :param start_time: 基準時刻
-        """
-        loadtime = datetime.datetime.now()
-        self.diff_second = (loadtime - start_time).seconds
-
-    def out_tuple(self) -> tuple:
-        return self.diff_second, self.iset, self.iout, self.field, self.vout, self.target
-
-
-def load_status(iout=True, iset=True, vout=True, field=True) -> StatusList:
-    """
-    各ステータスをまとめて取得する
-
-    --------
-    :return: StatusList
-    """
-    result = StatusList()
-    if iout:
-        result.iout = power.iout_fetch().A()
-    if iset:
-        result.iset = power.iset_fetch().A()
-    if vout:
-        result.vout = power.vout_fetch()
-    if field:
-        result.field = gauss.magnetic_field_fetch()
-    return result
-
-
-def gen_csv_header(filename: str) -> (str, datetime.datetime):
-    """
-    ログのヘッダを書き込む
+TRACE_BASE_DIR: Final = os.path.join(os.path.abspath("./logs/"), "traces")
+POWER_TRACE_NAME: Final = "power.trace.jsonl"
+GAUSS_TRACE_NAME: Final = "gauss.trace.jsonl"
 
-    :param filename:
-    :return: 基準時刻
-    """
-    os.makedirs(MEASURE_RECORD_DIR, exist_ok=True)
-    file_path = os.path.join(MEASURE_RECORD_DIR, filename)
-    print("測定条件等メモ記入欄")
-    memo = input("memo :")
-    start_time = datetime.datetime.now()
-    with open(file_path, mode='a', encoding="utf-8")as f:
-        writer = csv.writer(f, lineterminator='\n')
-        writer.writerow(["開始時刻", start_time.strftime('%Y-%m-%d_%H-%M-%S')])
-        writer.writerow(["memo", memo])
-        writer.writerow(["#####"])
-        writer.writerow(["経過時間[sec]", "設定電流:ISET[A]", "出力電流:IOUT[A]", "磁界:H[Gauss]", "出力電圧:VOUT[V]", "設定値[G or I]"])
-    return file_path, start_time
-
-
-def save_status(filename: str, status: StatusList) -> None:
-    """
-    ファイルにステータスを追記する
-
-    --------
-    :type status: StatusList
-    :param filename: 書き込むファイル名
-    :param status: 書き込むデータ
-    :return: None
-    """
-    result = status.out_tuple()
+logger = getLogger(__name__)
 
-    with open(filename, mode='a', encoding="utf-8")as f:
-        writer = csv.writer(f, lineterminator='\n')
-        writer.writerow(result)
-    return
+session: Session = None
 
 
 def power_ctl(cmd: List[str]) -> None:
@@ -705,18 +40,18 @@ def power_ctl(cmd: List[str]) -> None:
         return
     req = cmd[0]
     if req == "status":
-        print("ISET=" + str(power.iset_fetch()) + "\tIOUT=" + str(power.iout_fetch()) + "\tVOUT=" + str(
-            power.vout_fetch()) + "V")
+        print("ISET=" + str(session.power.iset_fetch()) + "\tIOUT=" + str(session.power.iout_fetch()) + "\tVOUT=" + str(
+            session.power.vout_fetch()) + "V")
         return
     elif req == "iout":
-        print("IOUT=" + str(power.iout_fetch()))
+        print("IOUT=" + str(session.power.iout_fetch()))
         return
 
     elif req == "iout":
-        print("IOUT=" + str(power.vout_fetch()) + "V")
+        print("IOUT=" + str(session.power.vout_fetch()) + "V")
         return
     elif req == "iset":
-        print("ISET=" + str(power.iset_fetch()))
+        print("ISET=" + str(session.power.iset_fetch()))
         if len(cmd) == 1:
             return
         if len(cmd) >= 4:
@@ -729,7 +64,7 @@ def power_ctl(cmd: List[str]) -> None:
             print("Command Value is Missing."
                   "ex) 400 mA or 4.2 A")
             return
-        power.set_iset(current)
+        session.power.set_iset(current)
         return
 
     else:
@@ -742,179 +77,6 @@ def power_ctl(cmd: List[str]) -> None:
         return
 
 
-def get_suitable_range(field: Union[int, float]) -> int:
-    field = abs(field)
-    if abs(field) >= 2700:
-        return 0
-    elif abs(field) >= 270:
-        return 1
-    elif abs(field) >= 27:
-        return 2
-    else:
-        return 3
-
-
-def magnet_field_ctl(target: int, auto_range: bool = False) -> Current:
-    """
-    磁界制御を行う
-    電磁石の場合は1 Oe -> 1 mA換算で電流を変化させる
-    ヘルムホルツコイルの場合は磁界-電流変換式を用いる
-
-    目標磁界に対応した電流値を最後に返す
-
-    :param target: ターゲット磁界(Oe)
-    :param auto_range: オートレンジを使用するか(電磁石のみ有効)
-    :return: 最終電流
-
-    :raise ValueError: 目標磁界が出力制限を超過する場合は命令を発行せずに例外を投げる
-    """
-    if CONNECT_MAGNET == "ELMG":  # 電磁石制御部
-        if target > ELMG_MAGNET_FIELD_LIMIT:
-            logger.error("磁界制御入力値過大")
-            print("最大磁界4.1kOe")
-            raise ValueError
-        now_range = gauss.range_fetch()
-        next_range = 0
-
-        if auto_range:
-            next_range = get_suitable_range(target)
-
-            if now_range == next_range:  # レンジを変えないとき
-                auto_range = False
-                pass
-            elif now_range < next_range:  # レンジを下げる方向
-                pass
-            else:  # レンジを上げる
-                gauss.range_set(next_range)
-                now_range = next_range
-                auto_range = False
-                time.sleep(0.1)
-        now_field = gauss.magnetic_field_fetch()
-
-        field_up: int
-        if target - now_field > 0:
-            field_up = 1
-        else:
-            field_up = -1
-
-        loop_limit = OECTL_LOOP_LIMIT
-        while True:
-            while True:  # 磁界の一致を待つ
-                palfield = gauss.magnetic_field_fetch()
-                if palfield == now_field:
-                    break
-                now_field = palfield
-                time.sleep(0.2)
-
-            if auto_range:  # レンジを下げる処理
-                r = get_suitable_range(now_field)
-
-                if next_range == 0:
-                    auto_range = False
-
-                if r == now_range:
-                    pass
-                if r > now_range:
-                    if r == next_range:
-                        gauss.range_set(next_range)
-                        now_range = r
-                        auto_range = False
-                    elif r < next_range:
-                        gauss.range_set(r)
-                        now_range = r
-                    else:
-                        pass
-                else:
-                    pass
-
-            while True:  # 磁界の一致を待つ
-                palfield = gauss.magnetic_field_fetch()
-                if palfield == now_field:
-                    break
-                now_field = palfield
-                time.sleep(0.2)
-
-            if loop_limit == 0:
-                break
-            loop_limit -= 1
-
-            diff_field = target - now_field
-
-            if field_up == 1 and diff_field <= 1:
-                break
-            if field_up == -1 and diff_field >= -1:
-                break
-
-            elmg_const = OECTL_BASE_COEFFICIENT - OECTL_RANGE_COEFFICIENT * now_range
-
-            # 次の設定値を算出
-            now_current = power.iset_fetch()
-            diff_current = Current(diff_field * elmg_const, "mA")
-            if abs(diff_current) < Current(2, "mA"):
-                if diff_current > 0:
-                    diff_current = Current(2, "mA")
-                else:
-                    diff_current = Current(-2, "mA")
-
-            next_current = now_current + diff_current
-            power.set_iset(next_current)
-
-            continue
-
-        # 初期差分算出
-        last_current = power.iset_fetch()
-        now_field = gauss.magnetic_field_fetch()
-        diff_field = target - now_field
-        if abs(diff_field) >= 1:
-            last_current = last_current + Current(diff_field * 0.9, "mA")
-        last_current = last_current + Current(-(4 - now_range) * field_up, "mA")
-        return last_current
-
-    elif CONNECT_MAGNET == "HELM":  # ヘルムホルツコイル制御部
-        return magnet_field_ctl_helmholtz(target)
-    else:
-        raise ValueError
-
-
-def magnet_field_ctl_helmholtz(target: int) -> Current:
-    if CONNECT_MAGNET == "HELM":  # ヘルムホルツコイル制御部
-        if target > HELM_MAGNET_FIELD_LIMIT:
-            logger.error("磁界制御入力値過大")
-            print("最大磁界200Oe")
-            raise ValueError
-        target_current = Current(int(target / HELM_Oe2CURRENT_CONST), "mA")
-        power.set_iset(target_current)
-        return target_current
-    else:
-        raise ValueError
-
-
-def demag(step: int = 15, field_mode: bool = True):
-    if CONNECT_MAGNET == "ELMG" and field_mode:
-        max_current = magnet_field_ctl(4000, True).mA()
-    elif CONNECT_MAGNET == "ELMG" and (not field_mode):
-        max_current = 4300
-        power.set_iset(Current(max_current, "mA"))
-    elif CONNECT_MAGNET == "HELM":
-        max_current = magnet_field_ctl(100, True).mA()
-    else:
-        raise ValueError
-    time.sleep(1.0)
-    flag = 1
-    max_current = float(max_current)
-    for i in range(0, step):
-        print("Step: " + str(i + 1) + "/" + str(step) + "...", end="", flush=True)
-        flag = flag * -1
-        x = 1 - (float(i) / float(step))
-        nc = flag * max_current * (x ** 2)
-        power.set_iset(Current(nc, "mA"))
-        time.sleep(1.0)
-        print("!")
-
-    power.set_iset(Current(0, "mA"))
-    return
-
-
 def demag_cmd(cmd: List[str]) -> None:
     if len(cmd) == 0:
         step = 15
@@ -925,11 +87,9 @@ def demag_cmd(cmd: List[str]) -> None:
             print("step数の指定が不正です。")
             return
     print("消磁開始")
-    demag(step, field_mode=True)
+    session.demag(step, field_mode=True)
     print("消磁終了")
-    winsound.Beep(BEEP_HZ, BEEP_DOT)
-    time.sleep(BEEP_DOT / 1000)
-    winsound.Beep(BEEP_HZ, BEEP_DOT)
+    sound.beep_double()
     return
 
 
@@ -943,13 +103,13 @@ def current_demag_cmd(cmd: List[str]) -> None:
             print("step数の指定が不正です。")
             return
     print("消磁開始")
-    demag(step, field_mode=False)
+    session.demag(step, field_mode=False)
     print("消磁終了")
     return
 
 
 def print_status():
-    print(load_status())
+    print(session.load_status())
     return
 
 
@@ -968,7 +128,7 @@ def Oe_cmd(cmd: List[str], auto_range: bool = False) -> None:
     except ValueError:
         print("ValeError!")
         return
-    magnet_field_ctl(target, auto_range=auto_range)
+    session.magnet_field_ctl(target, auto_range=auto_range)
     return
 
 
@@ -982,7 +142,7 @@ def gauss_cmd(cmd: List[str]) -> None:
         return
     req = cmd[0]
     if req == "status":
-        res = gauss.readable_magnetic_field_fetch()
+        res = session.gauss.readable_magnetic_field_fetch()
         print(res)
         return
     elif req == "range":
@@ -992,9 +152,9 @@ def gauss_cmd(cmd: List[str]) -> None:
             except ValueError:
                 print("ValueError")
                 return
-            gauss.range_set(range_index)
+            session.gauss.range_set(range_index)
         else:
-            res = gauss.range_fetch()
+            res = session.gauss.range_fetch()
             print("Gauss range is " + str(res))
             return
     else:
@@ -1007,6 +167,33 @@ def gauss_cmd(cmd: List[str]) -> None:
         return
 
 
+def watchdog_cmd(cmd: List[str]) -> None:
+    """
+    監視スレッド関連のコマンド
+
+    :param cmd:入力コマンド文字列
+    """
+    if session.watchdog is None:
+        print("Watchdog is not running")
+        return
+    if len(cmd) == 0 or cmd[0] == "status":
+        if session.watchdog.tripped:
+            print("Watchdog tripped : " + session.watchdog.reason)
+        else:
+            print("Watchdog is running")
+        return
+    elif cmd[0] == "reset":
+        session.watchdog.reset()
+        print("Watchdog reset")
+        return
+    else:
+        print("""
+        status\t監視状態表示
+        reset\t異常検知後に原因を取り除いてから出力を再許可する
+        """)
+        return
+
+
 def cmdlist():
     print("""
     quit\t通常終了
@@ -1015,10 +202,12 @@ def cmdlist():
     multi_load \t ./measure_sequence以下のFileNameの測定定義ファイルを複数読み込みテストする 
     test\t読み込んだ測定定義ファイルを検証する
     measure\t測定動作を行う
+    resume\t中断した測定をチェックポイントから再開する
     demag\t消磁動作
 
     status\t電源,磁界の状態を表示
     gaussctl\tガウスメーター制御コマンド群
+    watchdog\t監視スレッドの状態表示と異常検知後の再許可
     powerctl\tバイポーラ電源制御コマンド群
     oectl 目標値 (単位)\t磁界制御
     """)
@@ -1029,72 +218,78 @@ def main() -> None:
     while True:
         request = input(">>>").lstrip(" ").lower().split(" ")
         cmd = request[0]
-        if cmd in {"h", "help", "c", "cmd", "command"}:
-            cmdlist()
-            continue
-        elif cmd in {"quit", "exit", "end"}:
-            break
-        elif cmd in {"status"}:
-            print_status()
-            continue
-        elif cmd in {"powerctl"}:
-            power_ctl(request[1:])
-            continue
-        elif cmd in {"gaussctl"}:
-            gauss_cmd(request[1:])
-            continue
-        elif cmd in {"oectl"}:
-            Oe_cmd(request[1:], auto_range)
-            continue
-        elif cmd in {"autorange"}:
-            auto_range = not auto_range
-            print("Auto Range is " + str(auto_range))
+        try:
+            if cmd in {"h", "help", "c", "cmd", "command"}:
+                cmdlist()
+                continue
+            elif cmd in {"quit", "exit", "end"}:
+                break
+            elif cmd in {"status"}:
+                print_status()
+                continue
+            elif cmd in {"powerctl"}:
+                power_ctl(request[1:])
+                continue
+            elif cmd in {"gaussctl"}:
+                gauss_cmd(request[1:])
+                continue
+            elif cmd in {"watchdog"}:
+                watchdog_cmd(request[1:])
+                continue
+            elif cmd in {"oectl"}:
+                Oe_cmd(request[1:], auto_range)
+                continue
+            elif cmd in {"autorange"}:
+                auto_range = not auto_range
+                print("Auto Range is " + str(auto_range))
 
-        elif cmd in {"current_demag"}:
-            current_demag_cmd(request[1:])
-            continue
-        elif cmd in {"demag"}:
-            demag_cmd(request[1:])
-            continue
-        elif cmd in {"load"}:
-            DB.load_measure_sequence(request[1])
-            continue
-        elif cmd in {"reload"}:
-            DB.reload_measure_sequence()
-            continue
-        elif cmd in {"multi_load"}:
-            try:
-                DB.multi_load(request[1:])
-            except ValueError:
-                logger.error("異常のある測定ファイルが含まれているため続行不能")
-            continue
-        elif cmd in {"test"}:
-            DB.seq.measure_test()
-            if DB.seq.verified:
-                DB.seq_verified(True)
-            else:
-                DB.seq_verified(False)
-            continue
-        elif cmd in {"measure"}:
-            DB.seq.measure()
-            continue
+            elif cmd in {"current_demag"}:
+                current_demag_cmd(request[1:])
+                continue
+            elif cmd in {"demag"}:
+                demag_cmd(request[1:])
+                continue
+            elif cmd in {"load"}:
+                session.db.load_measure_sequence(request[1])
+                continue
+            elif cmd in {"reload"}:
+                session.db.reload_measure_sequence()
+                continue
+            elif cmd in {"multi_load"}:
+                try:
+                    session.db.multi_load(request[1:])
+                except ValueError:
+                    logger.error("異常のある測定ファイルが含まれているため続行不能")
+                continue
+            elif cmd in {"test"}:
+                session.db.seq.measure_test()
+                if session.db.seq.verified:
+                    session.db.seq_verified(True)
+                else:
+                    session.db.seq_verified(False)
+                continue
+            elif cmd in {"measure"}:
+                session.db.seq.measure()
+                continue
+            elif cmd in {"resume"}:
+                try:
+                    session.db.resume_measure()
+                except ValueError:
+                    logger.error("測定の再開に失敗")
+                continue
 
-        else:
-            print("""invalid command\nPlease type "h" or "help" """)
+            else:
+                print("""invalid command\nPlease type "h" or "help" """)
+                continue
+        except PowerInterlockError:  # 監視スレッドの停止後もwatchdog resetを打てるようにプロンプトは続ける
+            sound.beep_long()
+            logger.error("監視スレッドが異常を検知したため出力を拒否 : {0}".format(session.watchdog.reason))
             continue
 
 
 def search_magnet() -> None:
-    global CONNECT_MAGNET
     while True:
-        power.set_iset(Current(400, "mA"))
-        time.sleep(0.3)
-        resistance: float = power.vout_fetch() / power.iout_fetch().A()
-        if resistance > 4:
-            now = "ELMG"
-        else:
-            now = "HELM"
-        power.allow_output(False)
+        now = session.detect_magnet()
         print("接続先を入力してください。"
               "電磁石=>\"ELMG\"\tヘルムホルツ=>\"HELM\"")
         answer = input(">>>")
@@ -1117,97 +312,123 @@ def search_magnet() -> None:
         else:
             logger.error("接続先が不一致か入力内容が不正")
             print("接続先を強制するには\"Force\"と入力してください")
-    power.allow_output(True)
-    if now == "ELMG":
-        print("Support Magnet Field is +-4kOe")
-        power.CURRENT_CHANGE_LIMIT = Current(200, "mA")
-        CONNECT_MAGNET = "ELMG"
-        power.set_iset(Current(500, "mA"))
-        time.sleep(0.5)
-        resistance = power.vout_fetch() / power.iout_fetch().A()
-        power.MAGNET_RESISTANCE = resistance
-        return
-    else:
-        print("Support Magnet Field is +-100Oe")
-        power.CURRENT_CHANGE_DELAY = 0.3
-        CONNECT_MAGNET = "HELM"
-        power.set_iset(Current(400, "mA"))
-        time.sleep(0.2)
-        resistance = power.vout_fetch() / power.iout_fetch().A()
-        power.MAGNET_RESISTANCE = resistance
-        gauss.range_set(2)
-        return
+    session.connect(now)
+    return
 
 
-def setup_logger(log_folder, modname=__name__):
-    lg = getLogger(modname)
-    lg.setLevel(DEBUG)
+def setup_logger(log_folder, modnames=(__name__, "jiwai")):
+    """
+    ログの出力先を設定する スクリプトとして起動したときだけ呼ぶ
+    出力は専用スレッドで行うので,ログを書いても制御ループは待たない
 
+    :return: 終了時にstop()するQueueListener
+    """
     sh = StreamHandler()
     sh.setLevel(PRINT_LOGLEVEL)
     formatter = Formatter('%(name)s : %(levelname)s : %(message)s')
     sh.setFormatter(formatter)
-    lg.addHandler(sh)
 
     fh = FileHandler(log_folder)  # fh = file handler
     fh.setLevel(LOGLEVEL)
     fh_formatter = Formatter('%(asctime)s : %(filename)s : %(name)s : %(lineno)d : %(levelname)s : %(message)s')
     fh.setFormatter(fh_formatter)
-    lg.addHandler(fh)
-    return lg
-
-
-logger = setup_logger(LOGFILE)
-
+    return start_queue_logging([sh, fh], modnames)
 
-def init() -> None:
-    gauss.range_set(0)
-    power.set_iset(Current(0, "mA"))
 
-
-CONNECT_MAGNET = ""
-
-if __name__ == '__main__':
-    while True:
-        try:
-            gauss = visa_gs.GaussMeter()
-        except pyvisa.Error:
-            logger.error("ガウスメーター接続失敗")
-            ans = input("R:リトライ. f:無視. q:終了 >")
-            if ans in {"f", "F"}:
-                break
-            elif ans in {"q", "Q"}:
-                sys.exit(1)
-            else:
-                continue
-        else:
-            break
+def open_device(name: str, factory):
+    """
+    装置に接続する 失敗したら利用者にリトライ・無視・終了を問い合わせる
+    """
+    import pyvisa
     while True:
         try:
-            power = visa_bp.BipolarPower()
+            return factory()
         except pyvisa.Error:
-            logger.error("バイポーラ電源接続失敗")
+            logger.error("{0}接続失敗".format(name))
             ans = input("R:リトライ. f:無視. q:終了 >")
             if ans in {"f", "F"}:
-                break
+                return None
             elif ans in {"q", "Q"}:
                 sys.exit(1)
-            else:
-                continue
-        else:
-            break
-    gauss.range_set(0)
-    power.allow_output(True)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="磁歪測定装置制御")
+    parser.add_argument("--record", nargs="?", const="", default=None, metavar="DIR",
+                        help="装置との通信をトレースファイルに記録する 省略時は logs/traces/日時 以下")
+    parser.add_argument("--replay", default=None, metavar="DIR",
+                        help="記録したトレースファイルの応答で装置を置き換える")
+    parser.add_argument("--loose", action="store_true",
+                        help="再生時にコマンドの不一致を許す(制御コード変更後の比較用)")
+    parser.add_argument("--ring", action="store_true",
+                        help="記録した状態を共有メモリ jiwai_default に書き込む(python -m jiwai.ring で表示)")
+    parser.add_argument("--telemetry", action="store_true",
+                        help="測定の進行を127.0.0.1:8766に配信する(python -m jiwai.telemetry で表示)")
+    parser.add_argument("--watch", action="store_true",
+                        help="measure_sequence を監視し,編集された設定ファイルを裏で読み直して検証状態を表示する")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="イベントジャーナル logs/journal_YYYYMMDD.jsonl を書かない(python -m jiwai.journal で検索)")
+    return parser.parse_args()
+
+
+def trace_paths(args: argparse.Namespace) -> (Union[str, None], Union[str, None]):
+    """
+    記録するトレースファイルのパスを返す 記録しない場合はNone
+    """
+    if args.record is None:
+        return None, None
+    trace_dir = args.record or os.path.join(TRACE_BASE_DIR, datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
+    os.makedirs(trace_dir, exist_ok=True)
+    logger.info("通信を記録 : {0}".format(trace_dir))
+    return os.path.join(trace_dir, POWER_TRACE_NAME), os.path.join(trace_dir, GAUSS_TRACE_NAME)
+
+
+if __name__ == '__main__':
+    log_listener = setup_logger(LOGFILE)
+    args = parse_args()
+    power_trace, gauss_trace = trace_paths(args)
+    gauss_resource = None
+    power_resource = None
+    if args.replay:
+        gauss_resource = ReplayResource(os.path.join(args.replay, GAUSS_TRACE_NAME), strict=not args.loose)
+        power_resource = ReplayResource(os.path.join(args.replay, POWER_TRACE_NAME), strict=not args.loose)
+    session = Session()
+    session.gauss = open_device("ガウスメーター", lambda: GaussMeter(resource=gauss_resource, trace_path=gauss_trace))
+    session.power = open_device("バイポーラ電源", lambda: BipolarPower(resource=power_resource, trace_path=power_trace))
+    session.gauss.range_set(0)
+    session.power.allow_output(True)
     search_magnet()
-    init()
+    session.init()
+    if args.ring:
+        session.ring = SampleRing.create(RING_NAME_PREFIX + "default")
+        session.echo_status = False  # 表示は python -m jiwai.ring に任せる
+    telemetry = None
+    if args.telemetry:
+        telemetry = Telemetry()
+        telemetry.start()
+        session.attach_telemetry(telemetry.channel())
+    if not args.no_journal:
+        journal = session.open_journal()
+        for modname in (__name__, "jiwai"):
+            getLogger(modname).addHandler(journal.error_handler())
+    if args.watch:
+        session.db.watch_sequences()
+    if not args.replay:  # 再生時は監視スレッドの通信回数が記録と一致しない
+        session.start_watchdog()
     try:
         main()
+    except PowerInterlockError:
+        sound.beep_long()
+        sound.beep_s()
+        logger.critical("監視スレッドが異常を検知したため停止 : {0}".format(session.watchdog.reason))
     except Exception as e:
-        winsound.Beep(BEEP_HZ, BEEP_LONG)
-        beep_s()
-        beep_s()
+        sound.beep_long()
+        sound.beep_s()
+        sound.beep_s()
         logger.critical(e, exc_info=True)
 
     finally:
-        init()
-        power.allow_output(False)
+        session.close()
+        if telemetry is not None:
+            telemetry.stop()
+        log_listener.stop()
@@ -0,0 +1,268 @@
+"""
+シミュレーションした装置で制御経路のベンチマークを行う
+
+待ち時間は仮想時計で進めるので実時間はかからず,乱数の種を固定しているので毎回同じ結果になる.
+結果は benchmarks/results/latest.json に書き出し, benchmarks/baseline.json と比べて
+収束が遅くなったり精度が落ちたりした項目を回帰として報告する.
+
+    python benchmarks/bench_control.py          # 実行してbaselineと比較 回帰があれば終了コード1
+    python benchmarks/bench_control.py --save   # 結果をbaselineとして保存
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Union, Callable
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from machines_controller import simulator  # noqa: E402
+
+CLOCK = simulator.VirtualClock()
+time.sleep = CLOCK.sleep
+
+import jiwai.session  # noqa: E402
+import jiwai.setting  # noqa: E402
+import jiwai.status  # noqa: E402
+import machines_controller.bipolar_power_ctl as visa_bp  # noqa: E402
+import machines_controller.gauss_ctl as visa_gs  # noqa: E402
+from jiwai import MeasureSetting, Session, plan_transition  # noqa: E402
+from machines_controller.bipolar_power_ctl import Current  # noqa: E402
+
+VIRTUAL_DATETIME = CLOCK.datetime_module()
+for module in (jiwai.session, jiwai.setting, jiwai.status):
+    module.datetime = VIRTUAL_DATETIME
+for module in (jiwai.setting, jiwai.status):
+    module.time = CLOCK.time_module()
+
+WORK_DIR = tempfile.mkdtemp(prefix="jiwai_bench_")  # ログ・設定DBを作業用フォルダに閉じ込める
+SESSION: Session = None
+
+BASELINE_FILE = os.path.join(REPO_DIR, "benchmarks", "baseline.json")
+RESULT_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+SEQUENCE_FILE = os.path.join(REPO_DIR, "measure_sequence", "test_seq.json")
+SEED = 20201010
+SETTLE_SEC = 2.0  # 制御後に真の磁界を評価するまでの待ち時間
+
+# 指標ごとの許容悪化 (相対, 絶対) 値はすべて小さいほど良い
+TOLERANCE: Dict[str, tuple] = {
+    "time_per_point_sec": (0.05, 0.05),
+    "round_trips_per_point": (0.05, 0.5),
+    "oectl_iterations_per_point": (0.05, 0.1),
+    "mean_abs_field_error": (0.10, 0.5),
+    "max_abs_field_error": (0.10, 1.0),
+}
+
+ELMG_TARGETS: List[int] = [4000, 2000, 500, 100, 0, -20, -100, -500, -2000, -4000, 0]
+HELM_TARGETS: List[int] = [100, 50, 10, 0, -10, -50, -100, 0]
+RAMP_TARGETS: List[int] = [4000, -4000, 1500, 0]
+
+
+def setup_rig(magnet: str, seed: int = SEED) -> simulator.SimulatedMagnet:
+    """
+    Session.connectと同じ初期設定でシミュレーション装置に接続する
+    """
+    global SESSION
+    rig = simulator.SimulatedMagnet(CLOCK, seed, magnet)
+    SESSION = Session(WORK_DIR,
+                      power_factory=lambda: visa_bp.BipolarPower(resource=simulator.SimulatedPowerResource(rig)),
+                      gauss_factory=lambda: visa_gs.GaussMeter(resource=simulator.SimulatedGaussResource(rig)),
+                      ask=lambda prompt: "")
+    SESSION.connect_magnet = magnet
+    SESSION.power.MAGNET_RESISTANCE = rig.resistance
+    SESSION.power.allow_output(True)
+    if magnet == "ELMG":
+        SESSION.power.CURRENT_CHANGE_LIMIT = Current(200, "mA")
+        SESSION.gauss.range_set(0)
+    else:
+        SESSION.power.CURRENT_CHANGE_DELAY = 0.3
+        SESSION.gauss.range_set(2)
+    SESSION.stats.reset()
+    return rig
+
+
+def round_trips() -> int:
+    return sum(stat.count for stat in SESSION.stats.by_command().values())
+
+
+def oectl_iterations() -> int:
+    return SESSION.stats.to_dict()["events"].get("oectl_iteration", 0)
+
+
+def summarize(points: int, elapsed: float, calls: int, iterations: int,
+              errors: List[float]) -> Dict[str, Union[int, float, None]]:
+    result = {
+        "points": points,
+        "time_per_point_sec": elapsed / points,
+        "round_trips_per_point": calls / points,
+        "oectl_iterations_per_point": iterations / points,
+        "mean_abs_field_error": None,
+        "max_abs_field_error": None,
+    }
+    if errors:
+        result["mean_abs_field_error"] = sum(abs(e) for e in errors) / len(errors)
+        result["max_abs_field_error"] = max(abs(e) for e in errors)
+    return result
+
+
+def run_points(targets: List[int], action: Callable[[int], None],
+               error: Callable[[int], float]) -> Dict[str, Union[int, float, None]]:
+    elapsed = 0.0
+    calls = 0
+    iterations = 0
+    errors = []
+    for target in targets:
+        start, calls0, iterations0 = CLOCK.time(), round_trips(), oectl_iterations()
+        action(target)
+        elapsed += CLOCK.time() - start
+        calls += round_trips() - calls0
+        iterations += oectl_iterations() - iterations0
+        CLOCK.sleep(SETTLE_SEC)
+        errors.append(error(target))
+    return summarize(len(targets), elapsed, calls, iterations, errors)
+
+
+def bench_oectl(magnet: str, targets: List[int], auto_range: bool) -> Dict[str, Union[int, float, None]]:
+    rig = setup_rig(magnet)
+    return run_points(targets, lambda t: SESSION.magnet_field_ctl(t, auto_range), lambda t: rig.true_field() - t)
+
+
+def bench_ramp() -> Dict[str, Union[int, float, None]]:
+    rig = setup_rig("ELMG")
+    return run_points(RAMP_TARGETS, lambda t: SESSION.power.set_iset(Current(t, "mA")), lambda t: rig.iout() - t)
+
+
+def bench_demag() -> Dict[str, Union[int, float, None]]:
+    rig = setup_rig("ELMG")
+    start = CLOCK.time()
+    SESSION.demag(15, field_mode=True)
+    elapsed = CLOCK.time() - start
+    CLOCK.sleep(SETTLE_SEC)
+    return summarize(1, elapsed, round_trips(), oectl_iterations(), [rig.true_field()])
+
+
+def load_setting(**overrides) -> MeasureSetting:
+    with open(SEQUENCE_FILE, "r") as f:
+        return MeasureSetting(dict(json.load(f), **overrides), SEQUENCE_FILE, SESSION)
+
+
+def bench_measure_test() -> Dict[str, Union[int, float, None]]:
+    setup_rig("ELMG")
+    setting = load_setting()
+    points = sum(len(seq) for seq in setting.measure_sequence)
+    start = CLOCK.time()
+    setting.measure_test()
+    if not setting.verified:
+        raise RuntimeError("measure_test failed")
+    return summarize(points, CLOCK.time() - start, round_trips(), oectl_iterations(), [])
+
+
+def bench_measure_process(**overrides) -> Dict[str, Union[int, float, None]]:
+    """
+    measureと同様にサブシークエンスを順に測定し,記録された磁界と設定値の差を評価する
+
+    :param overrides: test_seq.jsonに上書きする設定
+    """
+    setup_rig("ELMG")
+    setting = load_setting(**overrides)
+    points = 0
+    errors = []
+    start = CLOCK.time()
+    prev_seq = None
+    for i, seq in enumerate(setting.measure_sequence):
+        save_file = os.path.join(WORK_DIR, "bench_{0}.log".format(i))
+        transition = plan_transition(prev_seq, seq, setting.transition_tolerance)
+        setting.measure_process(seq, VIRTUAL_DATETIME.datetime.now(), save_file=save_file, transition=transition)
+        prev_seq = seq
+        points += len(seq)
+        with open(save_file, "r", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                errors.append(float(row[3]) - float(row[5]))
+    return summarize(points, CLOCK.time() - start, round_trips(), oectl_iterations(), errors)
+
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, Union[int, float, None]]]] = {
+    "oectl_elmg": lambda: bench_oectl("ELMG", ELMG_TARGETS, False),
+    "oectl_elmg_autorange": lambda: bench_oectl("ELMG", ELMG_TARGETS, True),
+    "oectl_helm": lambda: bench_oectl("HELM", HELM_TARGETS, False),
+    "set_iset_ramp": bench_ramp,
+    "demag": bench_demag,
+    "measure_test": bench_measure_test,
+    "measure_process": bench_measure_process,
+    "measure_process_settle": lambda: bench_measure_process(lock_mode="settle"),
+}
+
+
+def run_all(names: List[str]) -> Dict[str, Dict[str, Union[int, float, None]]]:
+    results = {}
+    for name in names:
+        with contextlib.redirect_stdout(io.StringIO()):  # 測定値の表示を抑える
+            results[name] = BENCHMARKS[name]()
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    """
+    baselineより許容値を超えて悪化した指標を列挙する
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for key, (rel, absolute) in TOLERANCE.items():
+            now, base = metrics.get(key), baseline[name].get(key)
+            if now is None or base is None:
+                continue
+            if now > base * (1 + rel) + absolute:
+                regressions.append("{0}.{1}: {2:.3f} -> {3:.3f}".format(name, key, base, now))
+    return regressions
+
+
+def format_results(results: Dict[str, dict]) -> str:
+    lines = ["{:<22}{:>7}{:>11}{:>13}{:>12}{:>11}{:>11}".format(
+        "benchmark", "points", "sec/point", "trips/point", "iter/point", "mean err", "max err")]
+    for name, m in results.items():
+        mean_err = "-" if m["mean_abs_field_error"] is None else "{:.2f}".format(m["mean_abs_field_error"])
+        max_err = "-" if m["max_abs_field_error"] is None else "{:.2f}".format(m["max_abs_field_error"])
+        lines.append("{:<22}{:>7}{:>11.2f}{:>13.1f}{:>12.2f}{:>11}{:>11}".format(
+            name, m["points"], m["time_per_point_sec"], m["round_trips_per_point"],
+            m["oectl_iterations_per_point"], mean_err, max_err))
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="制御経路のベンチマーク")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="実行するベンチマーク 省略時は全て")
+    parser.add_argument("--save", action="store_true", help="結果をbaselineとして保存する")
+    args = parser.parse_args()
+
+    results = run_all(args.names)
+    print(format_results(results))
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    with open(os.path.join(RESULT_DIR, "latest.json"), mode='w', encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, mode='w', encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1)
+        print("baselineを保存しました")
+        return 0
+    regressions = compare(results, baseline)
+    for r in regressions:
+        print("[Regression]\t" + r)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+磁歪測定装置の制御ライブラリ
+
+import時には装置・ログ・設定DBに触れない. 装置はSessionが最初に使うときに開く.
+
+    from jiwai import Session
+    session = Session(base_dir=".")
+    session.connect("ELMG")
+    session.magnet_field_ctl(1000)
+"""
+import importlib
+
+from jiwai.checkpoint import Checkpoint
+from jiwai.sequence import TransitionPlan, plan_transition
+from jiwai.status import StatusList
+
+__all__ = ["Checkpoint", "MeasureCancelledError", "MeasureSetting", "Session", "SettingDB", "StatusList",
+           "TransitionPlan", "plan_transition"]
+
+# Session等は全サブモジュールを読み込むので,使われたときに読み込む
+# (python -m jiwai.daemon 等の起動時にパッケージが先に実行モジュールを読み込まないようにする)
+_LAZY: dict = {
+    "Session": "jiwai.session",
+    "MeasureCancelledError": "jiwai.session",
+    "MeasureSetting": "jiwai.setting",
+    "SettingDB": "jiwai.setting",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name]), name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
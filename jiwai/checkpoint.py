@@ -0,0 +1,82 @@
+import datetime
+import json
+import os
+from logging import getLogger
+from typing import Union, Final
+
+RESUME_MARKER: Final = "#####resume"
+CHECKPOINT_NAME: Final = "checkpoint.json"
+
+logger = getLogger(__name__)
+
+
+class Checkpoint:
+    """
+    測定の進行状況 測定点ごとに書き出して中断後の再開に使う
+    """
+    setting_path: str = None  # 測定設定ファイル
+    seq_hash: str = None  # 測定設定ファイルのハッシュ
+    log_file: str = None  # 記録中のログファイル
+    start_time: datetime.datetime = None  # 測定基準時刻
+    sequence_index: int = 0  # サブシークエンス番号
+    point_index: int = -1  # 記録を終えた測定点 -1ならプリブロックのみ完了
+    completed: bool = False  # ポストブロックまで完了したか
+    current: int = 0  # 収束した電流値[mA]
+    gauss_range: int = 0  # ガウスメーターのレンジ
+    file_offset: int = 0  # 記録済みのログファイルサイズ
+
+    def __str__(self):
+        return "{0} seq={1} point={2} completed={3}".format(self.log_file, self.sequence_index, self.point_index,
+                                                             self.completed)
+
+    def save(self, filepath: str) -> None:
+        """
+        途中で落ちても壊れないように一時ファイル経由で書き出す
+        """
+        data = {
+            "setting_path": self.setting_path,
+            "seq_hash": self.seq_hash,
+            "log_file": self.log_file,
+            "start_time": self.start_time.isoformat(),
+            "sequence_index": self.sequence_index,
+            "point_index": self.point_index,
+            "completed": self.completed,
+            "current": self.current,
+            "gauss_range": self.gauss_range,
+            "file_offset": self.file_offset,
+        }
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, mode='w', encoding="utf-8")as f:
+            json.dump(data, f)
+        os.replace(tmp_path, filepath)
+        return
+
+    @classmethod
+    def load(cls, filepath: str) -> Union["Checkpoint", None]:
+        if not os.path.exists(filepath):
+            return None
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            checkpoint = cls()
+            checkpoint.setting_path = data["setting_path"]
+            checkpoint.seq_hash = data["seq_hash"]
+            checkpoint.log_file = data["log_file"]
+            checkpoint.start_time = datetime.datetime.fromisoformat(data["start_time"])
+            checkpoint.sequence_index = int(data["sequence_index"])
+            checkpoint.point_index = int(data["point_index"])
+            checkpoint.completed = bool(data["completed"])
+            checkpoint.current = int(data["current"])
+            checkpoint.gauss_range = int(data["gauss_range"])
+            checkpoint.file_offset = int(data["file_offset"])
+        except (json.JSONDecodeError, KeyError, ValueError):
+            logger.error("チェックポイントファイルが壊れています : {0}".format(filepath))
+            return None
+        return checkpoint
+
+    @staticmethod
+    def remove(filepath: str) -> None:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return
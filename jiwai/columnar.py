@@ -0,0 +1,239 @@
+"""
+測定ログ(CSV)を列ごとの固定長バイナリに変換する
+
+1つのログを1つの .jwc に変換し,さらに月ごとに全測定をつないだデータセットを作る.
+.jwc は列をfloat64の連続領域として並べたファイルで,mmapで開くと解析なしに列をmemoryviewとして読める.
+ヘッダ・測定の一覧は同じ名前の .json に置く.
+
+    python -m jiwai.columnar convert logs columnar --workers 4
+    python -m jiwai.columnar info columnar/202010.jwc
+
+    data = ColumnarFile("columnar/202010.jwc")
+    field = data.column("field")
+    for run in data.runs:
+        print(run["memo"], max(field[run["offset"]:run["offset"] + run["rows"]]))
+"""
+import argparse
+import concurrent.futures
+import csv
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+from typing import Any, Dict, Iterable, List, Tuple, Final
+
+from jiwai.checkpoint import RESUME_MARKER
+from jiwai.status import LOG_COLUMNS, LEGACY_LOG_COLUMNS, read_header
+
+COLUMNAR_MAGIC: Final = b"JWCF"
+COLUMNAR_SUFFIX: Final = ".jwc"
+# magic, 列数, 行数
+COLUMNAR_HEADER: Final = struct.Struct("<4sIQ")
+
+
+def write_columnar(filepath: str, columns: Dict[str, array], meta: Dict[str, Any]) -> None:
+    """
+    列をLOG_COLUMNSの順に書き出し,metaを同じ名前の .json に書く
+
+    :param columns: 列名ごとの同じ長さのarray('d')
+    """
+    rows = len(columns[LOG_COLUMNS[0]])
+    with open(filepath, mode='wb') as f:
+        f.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, len(LOG_COLUMNS), rows))
+        for name in LOG_COLUMNS:
+            columns[name].tofile(f)
+    with open(os.path.splitext(filepath)[0] + ".json", mode='w', encoding="utf-8") as f:
+        json.dump(dict(meta, columns=LOG_COLUMNS, rows=rows), f, ensure_ascii=False)
+
+
+class ColumnarFile:
+    """
+    .jwc を読み取り専用でmmapする
+
+    column()が返すmemoryviewを使い終えてからclose()する
+    """
+
+    def __init__(self, filepath: str) -> None:
+        self.filepath = filepath
+        with open(os.path.splitext(filepath)[0] + ".json", mode='r', encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        self.runs: List[Dict[str, Any]] = self.meta.get("runs", [])
+        with open(filepath, mode='rb') as f:
+            self.__mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # 列を追加する前に変換したファイルは列が少ない
+        self.columns: Tuple[str, ...] = tuple(self.meta.get("columns", LOG_COLUMNS))
+        magic, ncolumns, self.rows = COLUMNAR_HEADER.unpack_from(self.__mm, 0)
+        if magic != COLUMNAR_MAGIC or ncolumns != len(self.columns):
+            self.__mm.close()
+            raise ValueError("not a columnar log : {0}".format(filepath))
+
+    def column(self, name: str) -> memoryview:
+        """
+        :param name: columnsの列名
+        :raise ValueError: ファイルにない列
+        """
+        offset = COLUMNAR_HEADER.size + self.columns.index(name) * self.rows * 8
+        return memoryview(self.__mm)[offset:offset + self.rows * 8].cast("d")
+
+    def close(self) -> None:
+        self.__mm.close()
+
+
+def parse_log(filepath: str) -> Tuple[Dict[str, str], Dict[str, array], Dict[str, Any]]:
+    """
+    ログを列ごとに読む 中断した測定の途中までのログも読める
+    以前のログにない列(応答時刻・ロック時間),読み取らなかった値の時刻はnanとする
+
+    :return: (ヘッダ, 列, 問題の報告) 報告は skipped 読めなかった行数, partial 最後の行が途中で切れている
+    :raise ValueError: ヘッダが壊れている
+    """
+    columns = {name: array("d") for name in LOG_COLUMNS}
+    report = {"skipped": 0, "partial": False}
+    with open(filepath, mode='rb') as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            report["partial"] = f.read(1) != b"\n"
+    last_appended = False
+    with open(filepath, mode='r', encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = read_header(reader)
+        for row in reader:
+            if not row or row[0] == RESUME_MARKER:
+                continue
+            last_appended = False
+            try:
+                values = [float(v) if v else math.nan for v in row]
+            except ValueError:
+                report["skipped"] += 1
+                continue
+            if len(values) in LEGACY_LOG_COLUMNS:
+                values += [math.nan] * (len(LOG_COLUMNS) - len(values))
+            if len(values) != len(LOG_COLUMNS):
+                report["skipped"] += 1
+                continue
+            for name, v in zip(LOG_COLUMNS, values):
+                columns[name].append(v)
+            last_appended = True
+    if report["partial"]:  # 途中で切れた最後の行は数値が欠けている可能性があるので捨てる
+        if last_appended:
+            for c in columns.values():
+                c.pop()
+        elif report["skipped"]:
+            report["skipped"] -= 1
+    return header, columns, report
+
+
+def convert_log(src: str, dst: str) -> Dict[str, Any]:
+    """
+    1つのログを .jwc に変換する プロセスプールから呼ぶ
+
+    :return: 変換の報告 失敗した場合は error に理由
+    """
+    report: Dict[str, Any] = {"src": src, "dst": dst, "rows": 0, "error": None}
+    try:
+        header, columns, problems = parse_log(src)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        report["error"] = repr(e)
+        return report
+    report.update(problems, rows=len(columns[LOG_COLUMNS[0]]))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    write_columnar(dst, columns, {"header": header, "source": src})
+    return report
+
+
+def convert_logs(record_base_dir: str, out_dir: str, workers: int = None) -> List[Dict[str, Any]]:
+    """
+    record_base_dir/YYYYMMDD/*.log を out_dir/YYYYMMDD/*.jwc に変換する 変換済みで元より新しいものは飛ばす
+
+    :param workers: プロセス数 省略時はCPU数
+    :return: 変換したログの報告
+    """
+    jobs = []
+    for src in sorted(glob.glob(os.path.join(record_base_dir, "*", "*.log"))):
+        rel = os.path.relpath(src, record_base_dir)
+        dst = os.path.join(out_dir, os.path.splitext(rel)[0] + COLUMNAR_SUFFIX)
+        if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+            continue
+        jobs.append((src, dst))
+    if not jobs:
+        return []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(convert_log, *zip(*jobs), chunksize=max(1, len(jobs) // 64)))
+
+
+def month_of(filepath: str) -> str:
+    """
+    out_dir/YYYYMMDD/*.jwc の月 "YYYYMM"
+    """
+    return os.path.basename(os.path.dirname(filepath))[:6]
+
+
+def build_monthly(out_dir: str, months: Iterable[str] = None) -> List[str]:
+    """
+    out_dir/YYYYMMDD/*.jwc を月ごとに1つのデータセット out_dir/YYYYMM.jwc につなぐ
+
+    データセットの runs に各測定のヘッダ,先頭の行 offset,行数 rows を持つ
+    :param months: 作り直す月 "YYYYMM" 省略時はすべて
+    :return: 作ったデータセット
+    """
+    targets: Dict[str, List[str]] = {}
+    for filepath in sorted(glob.glob(os.path.join(out_dir, "*", "*" + COLUMNAR_SUFFIX))):
+        targets.setdefault(month_of(filepath), []).append(filepath)
+    if months is not None:
+        months = set(months)
+        targets = {m: files for m, files in targets.items() if m in months}
+    result = []
+    for month, files in targets.items():
+        columns = {name: array("d") for name in LOG_COLUMNS}
+        runs = []
+        for filepath in files:
+            part = ColumnarFile(filepath)
+            runs.append(dict(part.meta["header"], path=os.path.relpath(filepath, out_dir),
+                             offset=len(columns[LOG_COLUMNS[0]]), rows=part.rows))
+            for name in LOG_COLUMNS:
+                if name not in part.columns:
+                    columns[name].extend([math.nan] * part.rows)
+                    continue
+                view = part.column(name)
+                columns[name].frombytes(view.tobytes())
+                view.release()
+            part.close()
+        dataset = os.path.join(out_dir, month + COLUMNAR_SUFFIX)
+        write_columnar(dataset, columns, {"month": month, "runs": runs})
+        result.append(dataset)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="測定ログの列形式への変換")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("convert", help="ログを変換して月ごとのデータセットを作る")
+    p.add_argument("logs", help="日付ごとのログフォルダを置くフォルダ")
+    p.add_argument("out", help="出力先")
+    p.add_argument("--workers", type=int, default=None)
+    p = sub.add_parser("info", help="変換したファイルの内容を表示する")
+    p.add_argument("file")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        reports = convert_logs(args.logs, args.out, args.workers)
+        for r in reports:
+            if r["error"]:
+                print("失敗 : {0} {1}".format(r["src"], r["error"]))
+            elif r["skipped"] or r["partial"]:
+                print("一部のみ : {0} rows={1} skipped={2} partial={3}".format(r["src"], r["rows"], r["skipped"],
+                                                                           r["partial"]))
+        print("変換 : {0} 件".format(len(reports)))
+        months = {month_of(r["dst"]) for r in reports if r["error"] is None}
+        if months:
+            for dataset in build_monthly(args.out, months):
+                print("データセット : {0}".format(dataset))
+    else:
+        data = ColumnarFile(args.file)
+        print("rows = {0}".format(data.rows))
+        for run in data.runs:
+            print("{0}  {1:>7} rows  {2}".format(run.get("開始時刻"), run["rows"], run.get("memo", "")))
+        data.close()
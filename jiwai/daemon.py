@@ -0,0 +1,425 @@
+"""
+装置を占有して測定ジョブを順に実行する常駐プロセス
+
+ローカルのXML-RPCでジョブの投入・状態確認・取り消しを受け付ける.
+ステーション設定ファイルを与えると複数のステーションをそれぞれのワーカースレッドで並行して動かす.
+
+    python -m jiwai.daemon serve --magnet ELMG
+    python -m jiwai.daemon serve --config stations.json
+    python -m jiwai.daemon submit --station B oectl 50
+    python -m jiwai.daemon submit oectl 1000 true
+    python -m jiwai.daemon submit load test_seq.json
+    python -m jiwai.daemon submit measure --memo "sample A" --priority 5
+    python -m jiwai.daemon jobs
+    python -m jiwai.daemon cancel 3
+"""
+import argparse
+import datetime
+import itertools
+import logging
+import queue
+import threading
+import xmlrpc.client
+from typing import Union, List, Dict, Iterator, Final
+from xmlrpc.server import SimpleXMLRPCServer
+
+from jiwai.journal import start_queue_logging
+from jiwai.ring import SampleRing, RING_NAME_PREFIX
+from jiwai.session import Session, MeasureCancelledError
+from jiwai.station import StationConfig, load_stations, start_station
+from jiwai.status import stamp_ns
+from jiwai.telemetry import Telemetry, TELEMETRY_PORT
+from machines_controller.bipolar_power_ctl import Current, PowerInterlockError
+
+DAEMON_HOST: Final = "127.0.0.1"  # 外部には公開しない
+DAEMON_PORT: Final = 8765
+DEFAULT_PRIORITY: Final = 10  # 小さいほど先に実行する
+
+JOB_KINDS: Final = ("load", "test", "measure", "resume", "oectl", "current", "demag")
+JOB_FLAG_ARGS: Final = {"oectl": 1, "demag": 1}  # 真偽値しか受け付けない引数の位置 oectl:オートレンジ demag:磁界制御
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    投入された1件の処理
+
+    state : "queued" -> "running" -> "done" | "failed" | "cancelled"
+    """
+
+    def __init__(self, job_id: int, kind: str, args: List[Union[str, int, float]], priority: int,
+                 memo: str = "", station: str = "default") -> None:
+        self.job_id = job_id
+        self.station = station
+        self.kind = kind
+        self.args = args
+        self.priority = priority
+        self.memo = memo  # ログのヘッダに書き込むメモ
+        self.state = "queued"
+        self.error: Union[str, None] = None
+        self.submitted = datetime.datetime.now()
+        self.started: Union[datetime.datetime, None] = None
+        self.finished: Union[datetime.datetime, None] = None
+
+    def to_dict(self) -> Dict[str, Union[str, int, list, None]]:
+        def fmt(t: Union[datetime.datetime, None]) -> Union[str, None]:
+            return None if t is None else t.isoformat(timespec="seconds")
+
+        return {"job_id": self.job_id, "station": self.station, "kind": self.kind, "args": self.args,
+                "priority": self.priority, "memo": self.memo, "state": self.state, "error": self.error,
+                "submitted": fmt(self.submitted), "started": fmt(self.started), "finished": fmt(self.finished)}
+
+
+class JobQueue:
+    """
+    優先度付きのジョブキューと,それを1件ずつ実行するワーカースレッド
+
+    装置はワーカースレッドだけが操作するので,複数のクライアントが同時に投入しても通信は競合しない.
+    実行中のジョブの取り消しは測定点・消磁ステップの区切りで反映され,電流を0に戻して終了する.
+    測定の途中で取り消した場合はチェックポイントが残るので resume で再開できる.
+    """
+
+    def __init__(self, session: Session, station: str = "default", ids: Iterator[int] = None) -> None:
+        """
+        :param session: ジョブを実行するSession
+        :param station: ステーション名
+        :param ids: job_idの発番 複数のキューで共有すると全体で一意になる
+        """
+        self.session = session
+        self.station = station
+        session.ask = self.__answer
+        self.jobs: Dict[int, Job] = {}
+        self.running: Union[Job, None] = None
+        self.__queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self.__ids = ids or itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name="JobQueue-" + station, daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stop.set()
+        self.__queue.put((-1, 0, None))  # 待機中のワーカーを起こす
+        self.__thread.join()
+
+    def submit(self, kind: str, args: List[Union[str, int, float]] = None, priority: int = DEFAULT_PRIORITY,
+               memo: str = "") -> int:
+        """
+        :param kind: JOB_KINDSのいずれか
+        :param args: REPLのコマンドと同じ引数
+        :param priority: 小さいほど先に実行する 同じ優先度は投入順
+        :param memo: 測定ログのヘッダに書き込むメモ
+        :return: job_id
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError("unknown job kind : {0}".format(kind))
+        index = JOB_FLAG_ARGS.get(kind)
+        if index is not None and args is not None and len(args) > index and not isinstance(args[index], bool):
+            raise ValueError("{0} の引数 {1} は true/false : {2!r}".format(kind, index, args[index]))
+        with self.__lock:
+            job = Job(next(self.__ids), kind, list(args or []), priority, memo, self.station)
+            self.jobs[job.job_id] = job
+        self.__queue.put((priority, job.job_id, job))
+        logger.info("ジョブ投入 : {0}".format(job.to_dict()))
+        return job.job_id
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        待機中なら実行せずに破棄し,実行中なら中断を要求する
+
+        :return: 取り消しを受け付けたか
+        """
+        with self.__lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state not in {"queued", "running"}:
+                return False
+            if job.state == "queued":
+                job.state = "cancelled"
+                job.finished = datetime.datetime.now()
+            else:
+                self.session.cancel_request.set()
+        logger.info("ジョブ取り消し : {0}".format(job_id))
+        return True
+
+    def __answer(self, prompt: str) -> str:
+        """
+        測定中の問い合わせに応答する メモにはジョブのメモを返し,それ以外は既定の動作を選ぶ
+        """
+        if prompt.startswith("memo") and self.running is not None:
+            return self.running.memo
+        return ""
+
+    def __run(self) -> None:
+        while not self.__stop.is_set():
+            _, _, job = self.__queue.get()
+            if job is None:
+                continue
+            with self.__lock:
+                if job.state != "queued":
+                    continue
+                job.state = "running"
+                job.started = datetime.datetime.now()
+                self.running = job
+                self.session.cancel_request.clear()
+            try:
+                self.execute(job)
+            except MeasureCancelledError:
+                job.state = "cancelled"
+                self.session.init()
+            except PowerInterlockError as e:
+                job.state = "failed"
+                job.error = "interlock : {0}".format(e)
+                logger.critical("監視スレッドが異常を検知したためジョブを中断 : {0}".format(job.job_id))
+                self.session.emit("error", job=job.job_id, message=job.error)
+            except Exception as e:
+                job.state = "failed"
+                job.error = repr(e)
+                logger.error("ジョブ失敗 : {0}".format(job.job_id), exc_info=True)
+                self.session.emit("error", job=job.job_id, message=job.error)
+                self.session.init()
+            else:
+                job.state = "done"
+            finally:
+                job.finished = datetime.datetime.now()
+                self.running = None
+            logger.info("ジョブ終了 : {0}".format(job.to_dict()))
+
+    def execute(self, job: Job) -> None:
+        session = self.session
+        db = session.db
+        if job.kind == "load":
+            db.multi_load([str(a) for a in job.args])
+        elif job.kind == "test":
+            db.seq.measure_test()
+            db.seq_verified(db.seq.verified)
+            if not db.seq.verified:
+                raise ValueError("measure_test failed")
+        elif job.kind == "measure":
+            if not db.seq.verified:
+                raise ValueError("setting is not verified")
+            db.seq.measure()
+        elif job.kind == "resume":
+            db.resume_measure()
+        elif job.kind == "oectl":
+            auto_range = len(job.args) >= 2 and job.args[1]
+            session.magnet_field_ctl(int(job.args[0]), auto_range)
+        elif job.kind == "current":
+            session.power.set_iset(Current(float(job.args[0]), "mA"))
+        elif job.kind == "demag":
+            step = int(job.args[0]) if job.args else 15
+            field_mode = len(job.args) < 2 or job.args[1]
+            session.demag(step, field_mode)
+        if job.kind in {"oectl", "current", "demag"}:  # statusの問い合わせに設定後の状態を返せるよう記録しておく
+            session.publish_status(session.load_status())
+        return
+
+
+class DaemonAPI:
+    """
+    XML-RPCで公開するメソッド
+
+    stationを省略できるのはステーションが1つのときだけ
+    """
+
+    def __init__(self, queues: Dict[str, JobQueue]) -> None:
+        self.__queues = queues
+
+    def __queue(self, station: Union[str, None]) -> JobQueue:
+        if station is None:
+            if len(self.__queues) != 1:
+                raise ValueError("station is required : {0}".format(list(self.__queues)))
+            return next(iter(self.__queues.values()))
+        if station not in self.__queues:
+            raise ValueError("unknown station : {0}".format(station))
+        return self.__queues[station]
+
+    def __find(self, job_id: int) -> Union[Job, None]:
+        for q in self.__queues.values():
+            if job_id in q.jobs:
+                return q.jobs[job_id]
+        return None
+
+    def stations(self) -> List[str]:
+        return list(self.__queues)
+
+    def submit(self, kind: str, args: list = None, priority: int = DEFAULT_PRIORITY, memo: str = "",
+               station: str = None) -> int:
+        return self.__queue(station).submit(kind, args, priority, memo)
+
+    def cancel(self, job_id: int) -> bool:
+        job = self.__find(job_id)
+        if job is None:
+            return False
+        return self.__queues[job.station].cancel(job_id)
+
+    def job(self, job_id: int) -> Union[dict, None]:
+        job = self.__find(job_id)
+        return None if job is None else job.to_dict()
+
+    def jobs(self, include_finished: bool = False, station: str = None) -> List[dict]:
+        queues = self.__queues.values() if station is None else [self.__queue(station)]
+        result = [job for q in queues for job in q.jobs.values()
+                  if include_finished or job.state in {"queued", "running"}]
+        return [job.to_dict() for job in sorted(result, key=lambda x: x.job_id)]
+
+    def status(self, station: str = None) -> Dict[str, dict]:
+        """
+        ステーションごとの装置の状態 最後に記録した状態を返し,装置には問い合わせない
+        """
+        names = list(self.__queues) if station is None else [station]
+        return {name: self.__station_status(self.__queue(name)) for name in names}
+
+    @staticmethod
+    def __station_status(q: JobQueue) -> dict:
+        session = q.session
+        running = q.running
+        watchdog = session.watchdog
+        values = dict.fromkeys(("iset", "iout", "field", "vout", "age_sec"))
+        if (status := session.last_status) is not None:
+            values.update(iset=status.iset, iout=status.iout, field=status.field, vout=status.vout)
+            if stamps := [t for t in status.stamps() if t is not None]:
+                values["age_sec"] = round((stamp_ns() - max(stamps)) / 1e9, 3)
+        return {**values,
+                "connect_magnet": session.connect_magnet, "ring": None if session.ring is None else session.ring.name,
+                "queued": sum(j.state == "queued" for j in q.jobs.values()),
+                "running": None if running is None else running.to_dict(),
+                "watchdog": None if watchdog is None else (watchdog.reason if watchdog.tripped else "running")}
+
+    def io_stats(self, station: str = None) -> dict:
+        return self.__queue(station).session.stats.to_dict()
+
+
+def serve(sessions: Dict[str, Session], host: str = DAEMON_HOST, port: int = DAEMON_PORT) -> None:
+    """
+    Ctrl+Cで止めるまでジョブを受け付ける
+
+    :param sessions: ステーション名 -> 接続済みのSession ステーションごとにワーカースレッドを立てる
+    """
+    ids = itertools.count(1)
+    queues = {name: JobQueue(session, name, ids) for name, session in sessions.items()}
+    for q in queues.values():
+        q.start()
+    server = SimpleXMLRPCServer((host, port), allow_none=True, logRequests=False)
+    server.register_instance(DaemonAPI(queues))
+    logger.info("ジョブ受付開始 : {0}:{1} stations={2}".format(host, port, list(queues)))
+    print("listening on {0}:{1}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for q in queues.values():
+            q.session.cancel_request.set()
+        for q in queues.values():
+            q.stop()
+
+
+def connect(host: str = DAEMON_HOST, port: int = DAEMON_PORT) -> xmlrpc.client.ServerProxy:
+    """
+    解析スクリプトなどからデーモンに接続する
+
+        daemon = connect()
+        job_id = daemon.submit("oectl", [1000])
+        daemon.job(job_id)
+    """
+    return xmlrpc.client.ServerProxy("http://{0}:{1}/".format(host, port), allow_none=True)
+
+
+def parse_value(text: str) -> Union[bool, int, float, str]:
+    if text.lower() in {"true", "false"}:
+        return text.lower() == "true"
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="測定ジョブの常駐プロセスとクライアント")
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="装置に接続してジョブを受け付ける")
+    p.add_argument("--config", default=None, help="ステーション設定ファイル 省略時は既定のアドレスの1台")
+    p.add_argument("--magnet", choices=("ELMG", "HELM"), default=None, help="省略時は抵抗値から推定する")
+    p.add_argument("--base-dir", default=".")
+    p.add_argument("--no-watchdog", action="store_true")
+    p.add_argument("--echo", action="store_true", help="記録した状態を標準出力にも表示する")
+    p.add_argument("--telemetry-port", type=int, default=TELEMETRY_PORT, help="0でテレメトリを配信しない")
+    p.add_argument("--no-journal", action="store_true", help="イベントジャーナルを書かない")
+    p.add_argument("--watch", action="store_true", help="測定設定ファイルの編集を監視して裏で読み直す")
+    p = sub.add_parser("submit", help="ジョブを投入する")
+    p.add_argument("--station", default=None)
+    p.add_argument("kind", choices=JOB_KINDS)
+    p.add_argument("args", nargs="*")
+    p.add_argument("--priority", type=int, default=DEFAULT_PRIORITY)
+    p.add_argument("--memo", default="")
+    p = sub.add_parser("cancel", help="ジョブを取り消す")
+    p.add_argument("job_id", type=int)
+    p = sub.add_parser("jobs", help="待機中・実行中のジョブを表示する")
+    p.add_argument("--all", action="store_true", help="終了したジョブも表示する")
+    p.add_argument("--station", default=None)
+    p = sub.add_parser("status", help="装置の状態を表示する")
+    p.add_argument("--station", default=None)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        handler = logging.StreamHandler()
+        handler.setLevel(logging.INFO)
+        handler.setFormatter(logging.Formatter('%(asctime)s : %(name)s : %(levelname)s : %(message)s'))
+        listener = start_queue_logging([handler], (__name__, "jiwai", "machines_controller"))
+        if args.config:
+            configs = load_stations(args.config)
+        else:
+            config = StationConfig()
+            config.magnet = args.magnet
+            config.base_dir = args.base_dir
+            config.watchdog = not args.no_watchdog
+            configs = [config]
+        sessions: Dict[str, Session] = {}
+        telemetry = None
+        if args.telemetry_port:
+            telemetry = Telemetry(port=args.telemetry_port)
+            telemetry.start()
+        try:
+            for config in configs:
+                session = start_station(config)
+                sessions[config.name] = session
+                session.ring = SampleRing.create(RING_NAME_PREFIX + config.name)
+                session.echo_status = args.echo
+                if telemetry is not None:
+                    session.attach_telemetry(telemetry.channel(config.name))
+                if not args.no_journal:
+                    session.open_journal(config.name)
+                if args.watch:
+                    session.db.watch_sequences()
+            serve(sessions, port=args.port)
+        finally:
+            for session in sessions.values():
+                session.close()
+            if telemetry is not None:
+                telemetry.stop()
+            listener.stop()
+        return
+
+    daemon = connect(port=args.port)
+    if args.command == "submit":
+        print(daemon.submit(args.kind, [parse_value(a) for a in args.args], args.priority, args.memo, args.station))
+    elif args.command == "cancel":
+        print(daemon.cancel(args.job_id))
+    elif args.command == "jobs":
+        for job in daemon.jobs(args.all, args.station):
+            print(job)
+    elif args.command == "status":
+        for name, status in daemon.status(args.station).items():
+            print(name, status)
+    return
+
+
+if __name__ == '__main__':
+    main()
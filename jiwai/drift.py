@@ -0,0 +1,111 @@
+"""
+プリブロック・ポストブロックの記録からBG(ドリフト)を求めて補正する
+
+ログの最初の設定値が続く区間(プリブロックと0番目の測定点)と最後の設定値が続く区間
+(最後の測定点とポストブロック)では,値は本来一定とみなせる.
+2つの区間それぞれの平均からのずれに共通の傾きを最小二乗で当てはめ,時間に比例するドリフトとして全点から引く.
+基準はそのログの区間だけなので,区間がDRIFT_MIN_HOLD_SECより短いログ(プリブロックを短縮したログ等)は補正しない.
+
+    python -m jiwai.drift logs/20201010/2020-10-10_12-00-00.log
+"""
+import csv
+import math
+import os
+import sys
+from array import array
+from logging import getLogger
+from typing import Dict, List, Sequence, Tuple, Final
+
+from jiwai.columnar import parse_log
+from jiwai.status import LOG_COLUMNS, LOG_COLUMN_NAMES, LOG_HEADER_END
+
+DRIFT_SUFFIX: Final = ".bg.csv"  # ログと同じ名前で置く補正済みのログ
+DRIFT_COLUMNS: Final = ("iout", "field")  # 補正する列
+DRIFT_MIN_HOLD_SEC: Final = 5.0  # ドリフトの基準にする区間の最短の長さ
+
+logger = getLogger(__name__)
+
+
+def hold_blocks(targets: Sequence[float]) -> List[Tuple[int, int]]:
+    """
+    最初と最後の設定値が続く区間
+
+    :return: [(開始, 終了)] 全体が1つの設定値なら1区間
+    """
+    if not targets:
+        return []
+    first_end = 1
+    while first_end < len(targets) and targets[first_end] == targets[0]:
+        first_end += 1
+    last_start = len(targets) - 1
+    while last_start > 0 and targets[last_start - 1] == targets[-1]:
+        last_start -= 1
+    if last_start < first_end:
+        return [(0, len(targets))]
+    return [(0, first_end), (last_start, len(targets))]
+
+
+def fit_drift(times: Sequence[float], values: Sequence[float], blocks: List[Tuple[int, int]]) -> float:
+    """
+    区間ごとに切片を持ち傾きを共有する直線を当てはめる
+
+    :return: 傾き[単位/sec] 区間内で時間が変化しなければ0
+    """
+    sxy = 0.0
+    sxx = 0.0
+    for start, end in blocks:
+        n = end - start
+        t_mean = sum(times[start:end]) / n
+        v_mean = sum(values[start:end]) / n
+        for i in range(start, end):
+            sxy += (times[i] - t_mean) * (values[i] - v_mean)
+            sxx += (times[i] - t_mean) ** 2
+    if sxx == 0:
+        return 0.0
+    return sxy / sxx
+
+
+def correct_log(filepath: str, columns: Sequence[str] = DRIFT_COLUMNS) -> Dict[str, float]:
+    """
+    ログのドリフトを補正して同じ名前の .bg.csv に書き出す
+
+    :param columns: 補正する列 LOG_COLUMNSの列名
+    :return: 列ごとの傾き[単位/sec]
+    :raise ValueError: ログのヘッダが壊れている,または区間が短すぎる
+    """
+    header, data, _ = parse_log(filepath)
+    elapsed = data["elapsed"]
+    blocks = hold_blocks(data["target"])
+    for start, end in blocks:
+        if elapsed[end - 1] - elapsed[start] < DRIFT_MIN_HOLD_SEC:
+            raise ValueError("BGの基準にする区間が短い : {0:.1f} sec".format(elapsed[end - 1] - elapsed[start]))
+    slopes = {}
+    for name in columns:
+        times = elapsed
+        stamps = data.get("t_" + name)
+        if stamps and not any(math.isnan(t) for t in stamps):  # 値ごとの応答時刻があればそれを使う
+            times = array("d", (t / 1e9 for t in stamps))
+        slope = fit_drift(times, data[name], blocks)
+        t0 = times[0] if times else 0.0
+        data[name] = array("d", (v - slope * (t - t0) for t, v in zip(times, data[name])))
+        slopes[name] = slope
+    out = os.path.splitext(filepath)[0] + DRIFT_SUFFIX
+    with open(out, mode='w', encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator='\n')
+        for key, value in header.items():
+            writer.writerow([key, value])
+        for name, slope in slopes.items():
+            writer.writerow(["drift_" + name, "{0:.6g}".format(slope)])
+        writer.writerow([LOG_HEADER_END])
+        writer.writerow(LOG_COLUMN_NAMES)
+        writer.writerows(zip(*(data[name] for name in LOG_COLUMNS)))
+    logger.info("BG補正 : {0} {1}".format(out, slopes))
+    return slopes
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        try:
+            print(path, correct_log(path))
+        except ValueError as e:
+            print(path, e)
@@ -0,0 +1,135 @@
+"""
+ヘルムホルツコイルの電流と磁界の関係 field = slope * current + offset を測定中の読み取りから当てはめる
+
+空芯のコイルなので直線とみなし,最小二乗の和だけを持って読み取りごとに更新する.
+重みの合計がFIT_WINDOWを超えたら和を縮め,古い読み取りほど効かなくする.
+"""
+import json
+import math
+import os
+from logging import getLogger
+from typing import Union, Final
+
+FIT_MIN_SAMPLES: Final = 4  # 傾きを当てはめるのに必要な読み取り数
+FIT_MIN_SPREAD_MA: Final = 300.0  # 電流の標準偏差がこれ未満なら傾きを当てはめず切片だけ求める
+FIT_SLOPE_TOLERANCE: Final = 0.2  # 校正値からの相対的なずれがこれを超える傾きは使わない
+FIT_WINDOW: Final = 500.0  # 重みの合計の上限
+FIT_SAVE_INTERVAL: Final = 20  # この数の読み取りごとに書き出す
+
+logger = getLogger(__name__)
+
+
+class HelmholtzFit:
+    """
+    :param filepath: 当てはめを書き出すファイル Noneなら書き出さない
+    :param nominal_slope: 校正値[Oe/mA] 当てはめられない間はこれを使う
+    """
+    offset: float = 0.0  # 電流0での磁界[Oe] 地磁気・ガウスメーターのオフセット
+
+    def __init__(self, filepath: Union[str, None], nominal_slope: float) -> None:
+        self.filepath = filepath
+        self.nominal_slope = nominal_slope
+        self.slope = nominal_slope  # [Oe/mA]
+        self.fitted = False  # 傾きを読み取りから当てはめたか
+        # 重み付きの和 n, Σx, Σy, Σxx, Σxy x: 電流[mA] y: 磁界[Oe]
+        self.n = 0.0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.__unsaved = 0
+
+    def __str__(self):
+        return "slope = {0:.6f} Oe/mA, offset = {1:+.3f} Oe, n = {2:.0f}{3}".format(
+            self.slope, self.offset, self.n, "" if self.fitted else " (校正値)")
+
+    def add(self, current: float, field: float) -> None:
+        """
+        読み取りを1点加えて当てはめ直す
+
+        :param current: 設定電流[mA]
+        :param field: 読み取った磁界[Oe]
+        """
+        if self.n >= FIT_WINDOW:
+            scale = (FIT_WINDOW - 1) / self.n
+            self.n *= scale
+            self.sx *= scale
+            self.sy *= scale
+            self.sxx *= scale
+            self.sxy *= scale
+        self.n += 1
+        self.sx += current
+        self.sy += field
+        self.sxx += current * current
+        self.sxy += current * field
+        self.refit()
+        self.__unsaved += 1
+        if self.__unsaved >= FIT_SAVE_INTERVAL:
+            self.save()
+
+    def refit(self) -> None:
+        x_mean = self.sx / self.n
+        y_mean = self.sy / self.n
+        var = self.sxx / self.n - x_mean * x_mean
+        if self.n >= FIT_MIN_SAMPLES and var >= FIT_MIN_SPREAD_MA ** 2:
+            slope = (self.sxy / self.n - x_mean * y_mean) / var
+            if abs(slope / self.nominal_slope - 1) <= FIT_SLOPE_TOLERANCE:
+                self.slope = slope
+                self.fitted = True
+            elif self.fitted:
+                logger.warning("ヘルムホルツコイルの傾きが校正値から外れています : {0:.6f} Oe/mA".format(slope))
+        self.offset = y_mean - self.slope * x_mean
+
+    def current_for(self, field: float) -> float:
+        """
+        :return: fieldを出すための電流[mA]
+        """
+        return (field - self.offset) / self.slope
+
+    def field_for(self, current: float) -> float:
+        """
+        :param current: 電流[mA]
+        """
+        return self.slope * current + self.offset
+
+    def save(self) -> None:
+        """
+        途中で落ちても壊れないように一時ファイル経由で書き出す
+        """
+        self.__unsaved = 0
+        if self.filepath is None:
+            return
+        data = {
+            "slope": self.slope,
+            "offset": self.offset,
+            "fitted": self.fitted,
+            "sums": [self.n, self.sx, self.sy, self.sxx, self.sxy],
+        }
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        tmp_path = self.filepath + ".tmp"
+        with open(tmp_path, mode='w', encoding="utf-8")as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.filepath)
+        return
+
+    @classmethod
+    def load(cls, filepath: str, nominal_slope: float) -> "HelmholtzFit":
+        """
+        書き出した当てはめを読む ファイルがない・壊れている場合は校正値から始める
+        """
+        fit = cls(filepath, nominal_slope)
+        if not os.path.exists(filepath):
+            return fit
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            n, sx, sy, sxx, sxy = (float(v) for v in data["sums"])
+            slope, offset = float(data["slope"]), float(data["offset"])
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+            logger.error("ヘルムホルツコイルの当てはめが壊れています : {0}".format(filepath))
+            return fit
+        if not (math.isfinite(slope) and math.isfinite(offset)) or slope == 0:
+            return fit
+        fit.n, fit.sx, fit.sy, fit.sxx, fit.sxy = n, sx, sy, sxx, sxy
+        fit.slope, fit.offset, fit.fitted = slope, offset, bool(data.get("fitted", False))
+        return fit
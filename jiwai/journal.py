@@ -0,0 +1,166 @@
+"""
+機械で読める形式のイベントジャーナル
+
+制御ループからはキューに積むだけで,ファイルへの書き込みは専用スレッドで行う.
+1行1イベントのJSON {"t": UNIX時刻, "station": ステーション名, "kind": 種類, ...}
+
+kind :
+    "setpoint"     電源への設定電流の書き込み mA
+    "field_read"   磁界の読み取り field, hops(オーバーレンジによるレンジ切替回数)
+    "range_change" ガウスメーターのレンジ切替 range
+    "oectl"        磁界制御の反復 target, field, range, remaining
+    "cache_hit" / "cache_miss"  測定キャッシュの利用 target
+    "status"       記録した状態
+    "point"        測定点の完了 index, target, current, range, sec(所要時間)
+    "metrics"      終わったサブシークエンスの要約とループの指標 jiwai.runindexの列
+    "error"        エラー message ログからはlogger,ジョブの失敗からはjobを付ける
+
+    python -m jiwai.journal logs/journal_20201010.jsonl --slow 30
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Final
+
+JOURNAL_NAME_FORMAT: Final = "journal_%Y%m%d.jsonl"  # ログフォルダに置くジャーナルのファイル名
+
+
+class Journal:
+    """
+    :param filepath: 追記するファイル
+    :param station: イベントに付けるステーション名
+    """
+
+    def __init__(self, filepath: str, station: str = "default") -> None:
+        self.filepath = filepath
+        self.station = station
+        self.__queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self.__thread = threading.Thread(target=self.__run, name="Journal-" + station, daemon=True)
+        self.__thread.start()
+
+    def record(self, kind: str, **fields: Any) -> None:
+        """
+        イベントをキューに積む 書き込みは待たない
+        """
+        self.__queue.put((time.time(), kind, fields))
+
+    def __run(self) -> None:
+        with open(self.filepath, mode='a', encoding="utf-8") as f:
+            while True:
+                item = self.__queue.get()
+                if item is None:
+                    break
+                t, kind, fields = item
+                event = {"t": t, "station": self.station, "kind": kind}
+                event.update(fields)
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+                if self.__queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        """
+        キューに残ったイベントを書き終えてから閉じる
+        """
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def error_handler(self) -> logging.Handler:
+        """
+        ERROR以上のログを"error"イベントとしてジャーナルに残すハンドラ
+        """
+        return _JournalHandler(self)
+
+
+class _JournalHandler(logging.Handler):
+    def __init__(self, journal: Journal) -> None:
+        super().__init__(logging.ERROR)
+        self.journal = journal
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.journal.record("error", logger=record.name, message=record.getMessage())
+
+
+def start_queue_logging(handlers: Sequence[logging.Handler], modnames: Iterable[str]) -> logging.handlers.QueueListener:
+    """
+    ログの出力をQueueHandler経由で専用スレッドに任せる
+
+    :param handlers: 実際に出力するハンドラ
+    :param modnames: ハンドラを付けるロガー
+    :return: 開始済みのQueueListener 終了時にstop()する
+    """
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for modname in modnames:
+        lg = logging.getLogger(modname)
+        lg.setLevel(logging.DEBUG)
+        lg.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def load(filepaths: Iterable[str], kinds: Iterable[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    ジャーナルを読み込む
+
+    :param kinds: 指定した種類のイベントだけを返す
+    """
+    kinds = None if kinds is None else set(kinds)
+    for filepath in filepaths:
+        with open(filepath, mode='r', encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if kinds is None or event["kind"] in kinds:
+                    yield event
+
+
+def summarize(events: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    種類ごとのイベント数
+    """
+    result: Dict[str, int] = {}
+    for event in events:
+        result[event["kind"]] = result.get(event["kind"], 0) + 1
+    return result
+
+
+def slow_points(events: Iterable[Dict[str, Any]], threshold_sec: float) -> List[Dict[str, Any]]:
+    """
+    所要時間がthreshold_secを超えた測定点と,その点までに発生したoectl反復・レンジ切替・エラーの数
+
+    :return: pointイベントに"oectl", "range_change", "error"の数を加えたもの
+    """
+    result = []
+    counts: Dict[str, Dict[str, int]] = {}
+    for event in events:
+        c = counts.setdefault(event["station"], {"oectl": 0, "range_change": 0, "error": 0})
+        if event["kind"] in c:
+            c[event["kind"]] += 1
+        elif event["kind"] == "point":
+            if event["sec"] > threshold_sec:
+                result.append(dict(event, **c))
+            counts[event["station"]] = {"oectl": 0, "range_change": 0, "error": 0}
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="イベントジャーナルの検索")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--kind", action="append", default=None, help="表示するイベントの種類 複数指定可")
+    parser.add_argument("--slow", type=float, default=None, metavar="SEC", help="所要時間がSECを超えた測定点を表示する")
+    args = parser.parse_args()
+    if args.slow is not None:
+        for p in slow_points(load(args.files), args.slow):
+            print(p)
+    elif args.kind:
+        for e in load(args.files, args.kind):
+            print(e)
+    else:
+        for kind, count in sorted(summarize(load(args.files)).items()):
+            print("{:<14}{:>8}".format(kind, count))
@@ -0,0 +1,148 @@
+"""
+測定設定ファイルの読み込み結果とハッシュのキャッシュ
+
+ファイルのサイズと更新時刻が変わらない限り,JSONの読み込み・検証・SHA-512の計算をやり直さない.
+監視スレッドを起動すると,編集されたファイルを裏で読み直す.
+"""
+import concurrent.futures
+import copy
+import hashlib
+import json
+import os
+import threading
+from logging import getLogger
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union, Final
+
+LIBRARY_WORKERS: Final = 4  # 事前読み込みのスレッド数
+WATCH_INTERVAL_SEC: float = 2.0  # 監視スレッドがフォルダを調べる周期
+
+logger = getLogger(__name__)
+
+
+class LibraryEntry:
+    """
+    1つの設定ファイルの読み込み結果
+
+    :param stamp: 読み込んだときの (サイズ, 更新時刻[ns])
+    :param context: 読み込んだときのSequenceLibrary.context()の値
+    """
+    setting: Any = None  # factoryが作った測定設定 読み込みに失敗した場合はNone
+    seq_hash: Union[str, None] = None
+    error: Union[str, None] = None
+
+    def __init__(self, stamp: Tuple[int, int], context: Any = None) -> None:
+        self.stamp = stamp
+        self.context = context
+
+    def new_setting(self) -> Any:
+        """
+        状態を持ち越さないよう測定設定の複製を返す
+        """
+        return copy.copy(self.setting)
+
+
+def file_stamp(filepath: str) -> Tuple[int, int]:
+    st = os.stat(filepath)
+    return st.st_size, st.st_mtime_ns
+
+
+class SequenceLibrary:
+    """
+    :param sequence_dir: 測定設定ファイルを置くフォルダ 監視と事前読み込みの対象
+    :param factory: (JSONの内容, パス) から測定設定を作る関数
+    :param context: factoryの結果が依存するファイル以外の状態を返す関数 値が変わったら読み直す
+    """
+
+    def __init__(self, sequence_dir: str, factory: Callable[[Dict[str, Any], str], Any],
+                 context: Callable[[], Any] = lambda: None) -> None:
+        self.sequence_dir = sequence_dir
+        self.factory = factory
+        self.context = context
+        self.__entries: Dict[str, LibraryEntry] = {}
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__watcher: Union[threading.Thread, None] = None
+
+    def load(self, filepath: str) -> LibraryEntry:
+        """
+        キャッシュが古いかcontextが変わっていれば読み直して返す
+
+        :raise OSError: ファイルがない 内容の誤りは例外にせずLibraryEntry.errorに入れる
+        """
+        path = os.path.abspath(filepath)
+        stamp = file_stamp(path)
+        context = self.context()
+        with self.__lock:
+            entry = self.__entries.get(path)
+        if entry is not None and entry.stamp == stamp and entry.context == context:
+            return entry
+        entry = self.__read(path, stamp, context)
+        with self.__lock:
+            self.__entries[path] = entry
+        return entry
+
+    def __read(self, path: str, stamp: Tuple[int, int], context: Any) -> LibraryEntry:
+        entry = LibraryEntry(stamp, context)
+        with open(path, "rb") as f:
+            data = f.read()
+        entry.seq_hash = hashlib.sha512(data).hexdigest()
+        try:
+            entry.setting = self.factory(json.loads(data), path)
+        except Exception as e:  # 形式の違う設定でも読み込み失敗として記録し,呼び出し元・監視スレッドを止めない
+            entry.error = repr(e)
+        return entry
+
+    def files(self) -> List[str]:
+        if not os.path.isdir(self.sequence_dir):
+            return []
+        return sorted(os.path.join(self.sequence_dir, name) for name in os.listdir(self.sequence_dir)
+                      if name.endswith(".json"))
+
+    def prefetch(self, filepaths: Iterable[str] = None, workers: int = LIBRARY_WORKERS) -> Dict[str, LibraryEntry]:
+        """
+        複数の設定ファイルを並行して読み込んでおく
+
+        :param filepaths: 省略時はフォルダ内の全ファイル
+        :return: {パス: 読み込み結果} 読めなかったファイルは含まない
+        """
+        filepaths = self.files() if filepaths is None else list(filepaths)
+        result = {}
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            futures = {pool.submit(self.load, p): p for p in filepaths}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result[futures[future]] = future.result()
+                except Exception as e:
+                    logger.warning("設定ファイルの読み込み失敗 : {0} {1!r}".format(futures[future], e))
+        return result
+
+    def watch(self, on_change: Callable[[str, LibraryEntry], None], interval: float = WATCH_INTERVAL_SEC) -> None:
+        """
+        フォルダを監視し,追加・編集されたファイルを読み直してon_changeを呼ぶ
+        """
+        self.prefetch()
+        self.__stop.clear()
+        self.__watcher = threading.Thread(target=self.__watch, args=(on_change, interval), name="SequenceLibrary",
+                                          daemon=True)
+        self.__watcher.start()
+
+    def __watch(self, on_change: Callable[[str, LibraryEntry], None], interval: float) -> None:
+        while not self.__stop.wait(interval):
+            for path in self.files():
+                path = os.path.abspath(path)
+                with self.__lock:
+                    old = self.__entries.get(path)
+                try:
+                    entry = self.load(path)
+                    if entry is not old:
+                        on_change(path, entry)
+                except OSError:  # 調べている間に消された
+                    continue
+                except Exception as e:
+                    logger.warning("設定ファイルの読み直し失敗 : {0} {1!r}".format(path, e))
+
+    def stop_watch(self) -> None:
+        self.__stop.set()
+        if self.__watcher is not None:
+            self.__watcher.join()
+            self.__watcher = None
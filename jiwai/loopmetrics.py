@@ -0,0 +1,55 @@
+"""
+1本のログから求めるループの指標
+
+出力電流IOUTを横軸,磁界を縦軸とした磁石のループについて
+    coercive_current  磁界が0を横切るときの電流[A] 横切った点の絶対値の平均
+    remanence_field   電流が0を横切るときの磁界[G] 同上
+    saturation_field  磁界の最大値と最小値の差の半分[G]
+    loop_area         始点と終点を結んで閉じた曲線の面積[G*A]
+    field_error_rms / field_error_max  設定値に対する磁界の誤差[G] 磁界制御のときだけ
+"""
+import math
+from typing import Any, Dict, List, Sequence, Union, Final
+
+METRIC_COLUMNS: Final = ("coercive_current", "remanence_field", "saturation_field", "loop_area", "field_error_rms",
+                         "field_error_max")
+
+
+def zero_crossings(x: Sequence[float], y: Sequence[float]) -> List[float]:
+    """
+    yの符号が変わる区間で,y=0となるxを線形補間で求める
+    """
+    result = []
+    for i in range(len(y) - 1):
+        y0, y1 = y[i], y[i + 1]
+        if y0 == 0:
+            result.append(x[i])
+        elif y0 * y1 < 0:
+            result.append(x[i] + (x[i + 1] - x[i]) * y0 / (y0 - y1))
+    return result
+
+
+def loop_metrics(iout: Sequence[float], field: Sequence[float], target: Sequence[float],
+                 field_control: bool) -> Dict[str, Union[float, None]]:
+    """
+    :param iout: 出力電流[A]
+    :param field: 磁界[G]
+    :param target: 設定値
+    :param field_control: 設定値が磁界か(磁界制御) Falseなら誤差を求めない
+    :return: METRIC_COLUMNSの指標 求められないものはNone
+    """
+    metrics: Dict[str, Any] = dict.fromkeys(METRIC_COLUMNS)
+    if not field:
+        return metrics
+    if crossings := zero_crossings(iout, field):
+        metrics["coercive_current"] = sum(abs(c) for c in crossings) / len(crossings)
+    if crossings := zero_crossings(field, iout):
+        metrics["remanence_field"] = sum(abs(c) for c in crossings) / len(crossings)
+    metrics["saturation_field"] = (max(field) - min(field)) / 2
+    n = len(field)
+    metrics["loop_area"] = abs(sum(iout[i] * field[(i + 1) % n] - iout[(i + 1) % n] * field[i] for i in range(n))) / 2
+    if field_control:
+        errors = [f - t for f, t in zip(field, target)]
+        metrics["field_error_rms"] = math.sqrt(sum(e * e for e in errors) / n)
+        metrics["field_error_max"] = max(abs(e) for e in errors)
+    return metrics
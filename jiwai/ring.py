@@ -0,0 +1,152 @@
+"""
+測定プロセスから表示・解析プロセスへ状態を渡す共有メモリのリングバッファ
+
+書き込みは1プロセスだけが行い,読み取り側は何プロセスでも取り付けられる.
+読み取り側が遅れても書き込み側は待たず,追い越された記録は読み取り側で欠落として数える.
+
+    python -m jiwai.ring jiwai_default         # 記録を表示し続ける
+"""
+import struct
+import sys
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import List, Tuple, Iterator, Union, Final
+
+from jiwai.status import StatusList, stamp_ns
+
+RING_MAGIC: Final = b"JWRB"
+RING_CAPACITY: Final = 4096  # 記録数
+RING_NAME_PREFIX: Final = "jiwai_"
+
+# magic, 記録サイズ, 容量, 書き込み済みの記録数
+HEADER: Final = struct.Struct("<4sIIQ")
+# 通し番号, 時刻[ns], ISET[A], IOUT[A], 磁界[G], VOUT[V], 設定値
+# 通し番号は何番目の記録か+1 書き込み中は0
+RECORD: Final = struct.Struct("<Qq5d")
+SEQ: Final = struct.Struct("<Q")
+COUNT_OFFSET: Final = 12
+
+
+class SampleRing:
+    """
+    固定長の記録を並べたリングバッファ
+
+    書き込みは通し番号を0にして記録を置き,最後に通し番号を書いてから書き込み済みの数を進める.
+    読み取り側は記録を写した後に通し番号を読み直し,写す前後で番号が期待通りでなければ
+    上書き中か上書き済みとみなしてその記録を捨てる.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool) -> None:
+        self.shm = shm
+        self.owner = owner
+        magic, record_size, capacity, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != RING_MAGIC or record_size != RECORD.size:
+            raise ValueError("not a sample ring : {0}".format(shm.name))
+        self.capacity = capacity
+        self.__count = self.count()
+
+    @classmethod
+    def create(cls, name: str, capacity: int = RING_CAPACITY) -> "SampleRing":
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + RECORD.size * capacity)
+        HEADER.pack_into(shm.buf, 0, RING_MAGIC, RECORD.size, capacity, 0)
+        return cls(shm, True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SampleRing":
+        shm = shared_memory.SharedMemory(name=name)
+        # 読み取り側の終了時に共有メモリが消されないようにする(Python 3.13未満の挙動)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def count(self) -> int:
+        """
+        これまでに書き込まれた記録の数
+        """
+        return struct.unpack_from("<Q", self.shm.buf, COUNT_OFFSET)[0]
+
+    def append(self, t_ns: int, iset: float, iout: float, field: float, vout: float, target: float) -> None:
+        offset = HEADER.size + RECORD.size * (self.__count % self.capacity)
+        RECORD.pack_into(self.shm.buf, offset, 0, t_ns, iset, iout, field, vout, target)
+        self.__count += 1
+        SEQ.pack_into(self.shm.buf, offset, self.__count)
+        struct.pack_into("<Q", self.shm.buf, COUNT_OFFSET, self.__count)
+
+    def append_status(self, status: StatusList) -> None:
+        t_ns = time.time_ns()
+        if stamps := [t for t in status.stamps() if t is not None]:  # 最後に応答した時刻に戻す
+            t_ns -= stamp_ns() - max(stamps)
+        self.append(t_ns, status.iset, status.iout, status.field, status.vout, float(status.target))
+
+    def read_since(self, cursor: int) -> Tuple[List[tuple], int, int]:
+        """
+        cursor番目以降の記録を写す
+
+        :param cursor: 前回の戻り値の次の読み取り位置 初回は0かcount()
+        :return: (記録のリスト, 次の読み取り位置, 上書きされて読めなかった記録数)
+        """
+        end = self.count()
+        start = max(cursor, end - self.capacity)
+        records = []
+        for i in range(start, end):
+            if (record := self.record(i)) is None:  # 上書きされた記録より古い記録も上書きされている
+                records.clear()
+                start = i + 1
+                continue
+            records.append(record)
+        return records, end, start - cursor
+
+    def record(self, index: int) -> Union[tuple, None]:
+        """
+        index番目の記録 (時刻[ns], ISET, IOUT, 磁界, VOUT, 設定値) 上書き中か上書き済みならNone
+        """
+        offset = HEADER.size + RECORD.size * (index % self.capacity)
+        seq, *record = RECORD.unpack_from(self.shm.buf, offset)
+        if seq != index + 1 or SEQ.unpack_from(self.shm.buf, offset)[0] != seq:
+            return None
+        return tuple(record)
+
+    def view(self) -> memoryview:
+        """
+        記録領域そのもの 写さずに読むとき用 上書き中の記録を含みうる
+        """
+        return self.shm.buf[HEADER.size:]
+
+    def follow(self, interval: float = 0.2) -> Iterator[tuple]:
+        """
+        新しい記録を待って1件ずつ返し続ける
+        """
+        cursor = self.count()
+        while True:
+            records, cursor, lost = self.read_since(cursor)
+            if lost:
+                print("[{0} records lost]".format(lost), file=sys.stderr)
+            yield from records
+            if not records:
+                time.sleep(interval)
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def format_record(record: tuple) -> str:
+    t_ns, iset, iout, field, vout, target = record
+    stamp = time.strftime("%H:%M:%S", time.localtime(t_ns / 1e9))
+    fm = "{}, ISET= {:>+7.3f} A, IOUT= {:>+7.3f} A, Field= {:>+7.1f} G, VOUT= {:>+7.3f} V, Target= {:>+5}"
+    return fm.format(stamp, iset, iout, field, vout, target)
+
+
+if __name__ == '__main__':
+    ring = SampleRing.attach(sys.argv[1] if len(sys.argv) > 1 else RING_NAME_PREFIX + "default")
+    try:
+        for r in ring.follow():
+            print(format_record(r))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
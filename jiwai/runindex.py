@@ -0,0 +1,218 @@
+"""
+logs/ 以下の測定ログの索引
+
+ログのヘッダ(開始時刻,memo,測定設定ファイル,ハッシュ,磁石)とデータの要約を1つのSQLiteファイルに持つ.
+更新時は前回から変わったログファイルだけを読み直す.
+ヘッダに測定設定ファイル・磁石の行がない古いログは,その項目を空として登録する.
+ループの指標(jiwai.loopmetrics)も持つ. 測定中はサブシークエンスが終わるごとにSessionが登録する.
+
+    python -m jiwai.runindex logs --magnet ELMG --sequence test_seq.json --memo sample
+    python -m jiwai.runindex logs --since 2020-10-01 --until 2020-11-01
+"""
+import argparse
+import glob
+import os
+import sqlite3
+from logging import getLogger
+from typing import Any, Dict, List, Final
+
+from jiwai.columnar import parse_log
+from jiwai.loopmetrics import METRIC_COLUMNS, loop_metrics
+
+INDEX_NAME: Final = "index.sqlite"  # ログフォルダに置く索引のファイル名
+RUN_GLOB: Final = os.path.join("*", "*.log")  # logs/YYYYMMDD/YYYY-MM-DD_HH-MM-SS.log
+
+COLUMNS: Final = ("path", "mtime", "size", "start", "memo", "sequence", "seq_hash", "magnet", "control", "records",
+                  "points", "field_min", "field_max", "duration") + METRIC_COLUMNS
+COLUMN_TYPES: Final = {"path": "TEXT", "size": "INTEGER", "start": "TEXT", "memo": "TEXT", "sequence": "TEXT",
+                       "seq_hash": "TEXT", "magnet": "TEXT", "control": "TEXT", "records": "INTEGER",
+                       "points": "INTEGER"}  # 省略した列はREAL
+
+logger = getLogger(__name__)
+
+
+def parse_run(filepath: str) -> Dict[str, Any]:
+    """
+    測定ログのヘッダとデータを要約し,ループの指標を求める
+
+    points は設定値が変わった回数+1, duration は最後の記録の経過時間[sec]
+
+    :raise ValueError: ヘッダが壊れている
+    """
+    header, data, _ = parse_log(filepath)
+    run: Dict[str, Any] = {"start": None, "memo": "", "sequence": None, "seq_hash": None, "magnet": None,
+                           "control": None}
+    keys = {"開始時刻": "start", "memo": "memo", "sequence": "sequence", "seq_hash": "seq_hash", "magnet": "magnet",
+            "control": "control"}
+    for key, value in header.items():
+        if key in keys:
+            run[keys[key]] = value
+    targets, field = data["target"], data["field"]
+    run["records"] = len(targets)
+    run["points"] = sum(1 for i in range(len(targets)) if i == 0 or targets[i] != targets[i - 1])
+    run["field_min"] = min(field, default=None)
+    run["field_max"] = max(field, default=None)
+    run["duration"] = max(data["elapsed"], default=0)
+    run.update(loop_metrics(data["iout"], field, targets, run["control"] == "oectl"))
+    return run
+
+
+class RunIndex:
+    """
+    測定ログの索引
+
+    :param record_base_dir: 日付ごとのログフォルダを置くフォルダ
+    :param filepath: 索引ファイル 省略時は record_base_dir/index.sqlite
+    """
+
+    def __init__(self, record_base_dir: str, filepath: str = None) -> None:
+        self.record_base_dir = record_base_dir
+        self.filepath = filepath or os.path.join(record_base_dir, INDEX_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+        self.conn = sqlite3.connect(self.filepath)
+        self.conn.row_factory = sqlite3.Row
+        columns = ", ".join("{0} {1}".format(c, COLUMN_TYPES.get(c, "REAL")) for c in COLUMNS)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS runs ({0}, PRIMARY KEY (path))".format(columns))
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(runs)")}
+        if missing := [c for c in COLUMNS if c not in existing]:  # 古い索引に列を足し,次の更新で全て読み直す
+            with self.conn:
+                for c in missing:
+                    self.conn.execute("ALTER TABLE runs ADD COLUMN {0} {1}".format(c, COLUMN_TYPES.get(c, "REAL")))
+                self.conn.execute("UPDATE runs SET mtime = NULL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS runs_start ON runs(start)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS runs_seq ON runs(seq_hash)")
+
+    def update(self) -> int:
+        """
+        前回から追加・変更されたログを読んで索引に反映し,消えたログを索引から除く
+
+        :return: 読み直したログの数
+        """
+        rows = self.conn.execute("SELECT path, mtime, size FROM runs")
+        known = {row["path"]: (row["mtime"], row["size"]) for row in rows}
+        found = set()
+        updated = 0
+        with self.conn:
+            for filepath in glob.glob(os.path.join(self.record_base_dir, RUN_GLOB)):
+                path = os.path.relpath(filepath, self.record_base_dir)
+                found.add(path)
+                st = os.stat(filepath)
+                if known.get(path) == (st.st_mtime, st.st_size):
+                    continue
+                if self.add_run(filepath, st):
+                    updated += 1
+            for path in set(known) - found:
+                self.conn.execute("DELETE FROM runs WHERE path = ?", (path,))
+        return updated
+
+    def add_run(self, filepath: str, st: os.stat_result = None) -> bool:
+        """
+        1つのログを読んで索引に登録する 登録済みなら置き換える コミットは呼び出し側で行う
+
+        :return: 登録できたか
+        """
+        st = st or os.stat(filepath)
+        try:
+            run = parse_run(filepath)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            logger.warning("ログの読み込み失敗 : {0} {1}".format(filepath, e))
+            return False
+        run.update(path=os.path.relpath(filepath, self.record_base_dir), mtime=st.st_mtime, size=st.st_size)
+        self.conn.execute("INSERT OR REPLACE INTO runs ({0}) VALUES ({1})".format(
+            ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))), [run[c] for c in COLUMNS])
+        return True
+
+    def query(self, magnet: str = None, sequence: str = None, seq_hash: str = None, memo: str = None,
+              since: str = None, until: str = None) -> List[Dict[str, Any]]:
+        """
+        条件に合う測定を開始時刻順に返す 省略した条件は問わない
+
+        :param sequence: 測定設定ファイル名
+        :param seq_hash: 測定設定ファイルのハッシュ 先頭だけでもよい
+        :param memo: memoに含まれる文字列
+        :param since: この日時以降に開始 "2020-10-10" "2020-10-10_12-00-00"
+        :param until: この日時より前に開始
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        if magnet is not None:
+            where.append("magnet = ?")
+            params.append(magnet)
+        if sequence is not None:
+            where.append("sequence = ?")
+            params.append(sequence)
+        if seq_hash is not None:
+            where.append("substr(seq_hash, 1, ?) = ?")
+            params += [len(seq_hash), seq_hash]
+        if memo is not None:
+            where.append("instr(memo, ?) > 0")
+            params.append(memo)
+        if since is not None:
+            where.append("start >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("start < ?")
+            params.append(until)
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [dict(row) for row in self.conn.execute(sql + " ORDER BY start", params)]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def index_run(record_base_dir: str, filepath: str) -> Dict[str, Any]:
+    """
+    1つのログを索引に登録し,登録した内容を返す 測定中にプロセスプールから呼ぶ
+
+    :raise ValueError: ログを読めなかった
+    """
+    index = RunIndex(record_base_dir)
+    try:
+        with index.conn:
+            added = index.add_run(filepath)
+        if not added:
+            raise ValueError("ログの読み込み失敗 : {0}".format(filepath))
+        path = os.path.relpath(filepath, record_base_dir)
+        return dict(index.conn.execute("SELECT * FROM runs WHERE path = ?", (path,)).fetchone())
+    finally:
+        index.close()
+
+
+def format_run(run: Dict[str, Any]) -> str:
+    fm = "{start}  {magnet!s:<4}  {sequence!s:<20}  {points:>4} pt  {field_min:>+8.1f} .. {field_max:>+8.1f} G  " \
+         "{duration:>6.0f} sec  {path}  {memo}"
+    if run["field_min"] is None:
+        run = dict(run, field_min=0.0, field_max=0.0)
+    return fm.format(**run) + format_metrics(run)
+
+
+def format_metrics(run: Dict[str, Any]) -> str:
+    result = ""
+    for name, label, fm in (("coercive_current", "Hc", "{:.3f} A"), ("remanence_field", "Br", "{:.1f} G"),
+                            ("field_error_max", "err", "{:.1f} G")):
+        if run.get(name) is not None:
+            result += "  {0}={1}".format(label, fm.format(run[name]))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="測定ログの検索")
+    parser.add_argument("logs", nargs="?", default="logs", help="日付ごとのログフォルダを置くフォルダ")
+    parser.add_argument("--magnet", choices=("ELMG", "HELM"), default=None)
+    parser.add_argument("--sequence", default=None, help="測定設定ファイル名")
+    parser.add_argument("--hash", default=None, help="測定設定ファイルのハッシュ(先頭だけでもよい)")
+    parser.add_argument("--memo", default=None, help="memoに含まれる文字列")
+    parser.add_argument("--since", default=None, help="2020-10-10 の形式")
+    parser.add_argument("--until", default=None)
+    parser.add_argument("--no-update", action="store_true", help="索引を更新せずに検索する")
+    args = parser.parse_args()
+    index = RunIndex(args.logs)
+    try:
+        if not args.no_update:
+            index.update()
+        for r in index.query(args.magnet, args.sequence, args.hash, args.memo, args.since, args.until):
+            print(format_run(r))
+    finally:
+        index.close()
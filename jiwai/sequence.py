@@ -0,0 +1,286 @@
+import bisect
+import datetime
+import itertools
+import math
+from typing import Union, List, Dict, Any, Iterator, Sequence, Final
+
+TRANSITION_MIN_BLOCK_TD: Final = datetime.timedelta(seconds=0.2)  # 連続境界でのプリブロック時間
+
+
+def sequence_direction(seq: List[Union[int, float]]) -> int:
+    """
+    測定シークエンス終端での掃引方向を返す
+
+    :param seq: 測定シークエンス
+    :return: 1:増加方向 -1:減少方向 0:不明
+    """
+    for i in range(len(seq) - 1, 0, -1):
+        step = seq[i] - seq[i - 1]
+        if step > 0:
+            return 1
+        if step < 0:
+            return -1
+    return 0
+
+
+class TransitionPlan:
+    """
+    サブシークエンス間の遷移計画
+    """
+    skip_approach: bool = False  # 開始点への移動と待機を省略する
+    pre_block_td: Union[datetime.timedelta, None] = None  # 短縮後のプリブロック時間 Noneなら設定値を使用
+
+    def __str__(self):
+        return "skip_approach={0}, pre_block_td={1}".format(self.skip_approach, self.pre_block_td)
+
+
+def plan_transition(prev_seq: List[Union[int, float]], next_seq: List[Union[int, float]],
+                    tolerance: float = 0, keep_pre_block: bool = False) -> TransitionPlan:
+    """
+    連続するサブシークエンスの境界を調べて冗長な移動とブロックを省略する計画を立てる
+
+    前の終点と次の始点が一致する場合は開始点への移動を省略し,磁界は直前のポストブロックから
+    同じ設定値に留まっているのでプリブロックを最小限にする.
+    短縮したプリブロックはそのログだけではBGの基準にならないため,ログごとにBG補正する場合は
+    keep_pre_blockを指定してプリブロックを設定値のまま残す.
+    差が許容値以内でも前のシークエンスと逆向きに移動する場合はヒステリシスの枝が変わるため省略しない.
+
+    :param prev_seq: 直前に測定したシークエンス
+    :param next_seq: 次に測定するシークエンス
+    :param tolerance: 境界を連続とみなす設定値の差
+    :param keep_pre_block: プリブロックを短縮しない
+    :return: 遷移計画
+    """
+    plan = TransitionPlan()
+    if not prev_seq or not next_seq:
+        return plan
+    gap = next_seq[0] - prev_seq[-1]
+    if gap == 0:
+        plan.skip_approach = True
+    elif abs(gap) > tolerance:
+        return plan
+    else:
+        direction = sequence_direction(prev_seq)
+        if direction == 0 or (gap > 0) != (direction > 0):  # 反転するときはヒステリシスを優先
+            return plan
+    if not keep_pre_block:
+        plan.pre_block_td = TRANSITION_MIN_BLOCK_TD
+    return plan
+
+
+def reapproach_index(seq: List[Union[int, float]], index: int) -> Union[int, None]:
+    """
+    中断した測定点へ戻るときに経由する折り返し点を探す
+
+    index番目の点に至る単調な区間の始点を返すので,そこからシークエンスを辿れば
+    元と同じヒステリシスの枝で再開できる.
+
+    :param seq: 測定シークエンス
+    :param index: 再開する測定点
+    :return: 経由する点のindex 経由不要ならNone
+    """
+    if index <= 0:
+        return None
+    direction = seq[index] - seq[index - 1]
+    j = index - 1
+    while j > 0:
+        step = seq[j] - seq[j - 1]
+        if step != 0 and (step > 0) != (direction > 0):
+            break
+        j -= 1
+    return j
+
+
+class LinearSegment(Sequence):
+    """
+    start から stop へ step 刻みの設定値 stop は刻みに乗る場合だけ含む
+
+    {"start": 4000, "stop": -4000, "step": 100} stepの符号は向きから決める
+    """
+
+    def __init__(self, start: Union[int, float], stop: Union[int, float], step: Union[int, float]) -> None:
+        if step == 0:
+            raise ValueError("step が0")
+        self.start = start
+        self.step = math.copysign(abs(step), stop - start)
+        self.count = int(math.floor(abs(stop - start) / abs(step) + 1e-9)) + 1
+        self.integer = all(isinstance(v, int) for v in (start, stop, step))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        v = self.start + self.step * index
+        return round(v) if self.integer else round(v, 6)
+
+
+class LogSegment(Sequence):
+    """
+    対数間隔の設定値 0付近を細かく測る
+
+    {"start": 4000, "stop": 10, "num": 10, "scale": "log"} 同符号の両端を含むnum点
+    {"start": 4000, "stop": -4000, "num": 10, "scale": "log", "min": 5} 符号が変わる場合は
+    start から ±min までのnum点, 0, ∓min から stop までのnum点
+    """
+
+    def __init__(self, start: Union[int, float], stop: Union[int, float], num: int,
+                 minimum: Union[int, float, None] = None) -> None:
+        if num < 2:
+            raise ValueError("num が2未満")
+        if start == 0 or stop == 0:
+            raise ValueError("対数間隔の端点が0")
+        self.integer = isinstance(start, int) and isinstance(stop, int)
+        if (start > 0) == (stop > 0):
+            self.parts = [(start, stop, num)]
+        else:
+            if not minimum or minimum <= 0:
+                raise ValueError("符号が変わる対数間隔には min が必要")
+            self.parts = [(start, math.copysign(minimum, start), num), (0, 0, 1),
+                          (math.copysign(minimum, stop), stop, num)]
+        self.count = sum(n for _, _, n in self.parts)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        for a, b, n in self.parts:
+            if index < n:
+                v = a
+                if n > 1:
+                    la, lb = math.log(abs(a)), math.log(abs(b))
+                    v = math.copysign(math.exp(la + (lb - la) * index / (n - 1)), a)
+                return round(v) if self.integer else round(v, 3)
+            index -= n
+        raise IndexError(index)
+
+
+class SegmentSequence(Sequence):
+    """
+    区間をつないだ測定シークエンス
+
+    設定値は参照・反復のたびに計算するので,細かい刻みのシークエンスもメモリを使わない
+    """
+
+    def __init__(self, segments: List[Sequence]) -> None:
+        self.segments = segments
+        self.offsets = list(itertools.accumulate(len(s) for s in segments))
+
+    def __len__(self) -> int:
+        return self.offsets[-1] if self.offsets else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        k = bisect.bisect_right(self.offsets, index)
+        return self.segments[k][index - (self.offsets[k - 1] if k else 0)]
+
+    def __iter__(self) -> Iterator[Union[int, float]]:
+        for segment in self.segments:
+            yield from segment
+
+    def __repr__(self):
+        return "SegmentSequence(len={0})".format(len(self))
+
+
+class RepeatSegment(Sequence):
+    """
+    同じループを繰り返す {"repeat": [...], "times": 3}
+    """
+
+    def __init__(self, template: Sequence, times: int) -> None:
+        if times < 1:
+            raise ValueError("times が1未満")
+        self.template = template
+        self.times = times
+
+    def __len__(self) -> int:
+        return len(self.template) * self.times
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.template[index % len(self.template)]
+
+    def __iter__(self) -> Iterator[Union[int, float]]:
+        for _ in range(self.times):
+            yield from self.template
+
+
+def parse_segment(spec: Any) -> Sequence:
+    """
+    設定値1つか区間の指定を区間にする
+
+    :raise ValueError: 指定が不正
+    """
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        return [spec]
+    if not isinstance(spec, dict):
+        raise ValueError("区間の指定が不正 : {0}".format(spec))
+    try:
+        if "repeat" in spec:
+            return RepeatSegment(parse_sub_sequence(spec["repeat"]), int(spec.get("times", 1)))
+        if spec.get("scale") == "log":
+            return LogSegment(spec["start"], spec["stop"], int(spec["num"]), spec.get("min"))
+        return LinearSegment(spec["start"], spec["stop"], spec["step"])
+    except (KeyError, TypeError) as e:
+        raise ValueError("区間の指定が不正 : {0} {1}".format(spec, e))
+
+
+def parse_sub_sequence(spec: Any) -> Sequence:
+    """
+    サブシークエンスの指定を展開せずに読む 設定値だけのリストはそのまま返す
+
+    :param spec: 設定値と区間の指定のリスト または区間の指定1つ
+    :raise ValueError: 指定が不正
+    """
+    if isinstance(spec, dict):
+        spec = [spec]
+    if not isinstance(spec, list):
+        raise ValueError("サブシークエンスの指定が不正 : {0}".format(spec))
+    if not any(isinstance(v, dict) for v in spec):
+        return spec
+    segments: List[Sequence] = []
+    literal: List[Union[int, float]] = []
+    for item in spec:
+        segment = parse_segment(item)
+        if isinstance(segment, list):
+            literal += segment
+            continue
+        if literal:
+            segments.append(literal)
+            literal = []
+        segments.append(segment)
+    if literal:
+        segments.append(literal)
+    return SegmentSequence(segments)
+
+
+def parse_sequence(spec: Any) -> List[Sequence]:
+    """
+    設定ファイルの"seq"を読む
+
+    :raise ValueError: 指定が不正
+    """
+    if not isinstance(spec, list):
+        raise ValueError("seq がリストでない")
+    return [parse_sub_sequence(sub) for sub in spec]
@@ -0,0 +1,592 @@
+import concurrent.futures
+import csv
+import datetime
+import multiprocessing
+import os
+import threading
+import time
+from logging import getLogger
+from typing import Union, Callable, Dict, Any, Final
+
+import machines_controller.gauss_ctl as visa_gs
+from jiwai import sound
+from jiwai.checkpoint import CHECKPOINT_NAME
+from jiwai.helmfit import HelmholtzFit
+from jiwai.journal import Journal, JOURNAL_NAME_FORMAT
+from jiwai.ring import SampleRing
+from jiwai.runindex import index_run, format_metrics
+from jiwai.setting import SettingDB
+from jiwai.status import StatusList, LOG_HEADER_END, LOG_COLUMN_NAMES, STAMPED_COLUMNS
+from jiwai.telemetry import TelemetryChannel
+from machines_controller.bipolar_power_ctl import BipolarPower, Current, CurrentArray
+from machines_controller.gauss_ctl import GaussMeter
+from machines_controller.io_stats import IOStats
+from machines_controller.watchdog import Watchdog
+
+HELM_Oe2CURRENT_CONST: float = 20.960 / 1000  # ヘルムホルツコイル用磁界電流変換係数 mA換算用 当てはめが得られるまでの校正値
+HELM_MAGNET_FIELD_LIMIT: Final = 150
+HELM_TRIM_MAX_OE: float = 2.0  # ヘルムホルツコイルの1点あたりの補正の上限
+HELM_TRIM_DEADBAND_OE: float = 0.2  # これ以下の誤差は補正しない
+ELMG_MAGNET_FIELD_LIMIT: Final = 4150
+
+WATCHDOG_INTERVAL_SEC: float = 0.1  # 監視スレッドのサンプリング周期
+WATCHDOG_FIELD_MARGIN: float = 1.1  # 磁界上限に対してこの倍率を超えたら暴走とみなす
+
+OECTL_LOOP_LIMIT: int = 12
+OECTL_BASE_COEFFICIENT: float = 0.96
+OECTL_RANGE_COEFFICIENT: float = 0.12
+
+ANALYSIS_WORKERS: int = 2  # 終わったサブシークエンスを解析するプロセス数
+
+DB_NAME: Final = "setting.db"
+MEASURE_RECORD_DIR_NAME: Final = "logs"
+SEQUENCE_DIR_NAME: Final = "measure_sequence"
+HELM_FIT_NAME: Final = "helm_fit.json"
+
+logger = getLogger(__name__)
+
+
+class MeasureCancelledError(Exception):
+    pass
+
+
+class Session:
+    """
+    1台の測定装置に対する制御の状態
+
+    装置・設定DBは最初に使うときに開くので,作成しただけでは通信もファイルアクセスも行わない.
+    1つのプロセスで複数のSessionを同時に扱える.
+
+    :param base_dir: 設定DB・測定設定ファイル・ログを置くフォルダ
+    :param power_factory: BipolarPowerを返す関数 省略時は既定のアドレスに接続する
+    :param gauss_factory: GaussMeterを返す関数 省略時は既定のアドレスに接続する
+    :param ask: 利用者への問い合わせ 既定はinput
+    """
+
+    def __init__(self, base_dir: str = ".", power_factory: Callable[[], BipolarPower] = None,
+                 gauss_factory: Callable[[], GaussMeter] = None, ask: Callable[[str], str] = input) -> None:
+        self.base_dir = os.path.abspath(base_dir)
+        self.power_factory = power_factory or BipolarPower
+        self.gauss_factory = gauss_factory or GaussMeter
+        self.ask = ask
+        self.connect_magnet = ""  # 接続先の磁石 "ELMG" or "HELM"
+        self.stats = IOStats()  # このセッションの通信回数・応答時間の集計
+        self.watchdog: Union[Watchdog, None] = None
+        self.cancel_request = threading.Event()  # セットすると次の確認点で処理を中断する
+        self.echo_status = True  # 記録した状態を標準出力に表示するか
+        self.ring: Union[SampleRing, None] = None  # 記録した状態を他のプロセスに渡すリングバッファ
+        self.telemetry: Union[TelemetryChannel, None] = None
+        self.journal: Union[Journal, None] = None
+        self.last_status: Union[StatusList, None] = None  # 最後に記録した状態 装置に問い合わせずに状態を返すときに使う
+        self.__analysis: Union[concurrent.futures.ProcessPoolExecutor, None] = None
+        self.__power: Union[BipolarPower, None] = None
+        self.__gauss: Union[GaussMeter, None] = None
+        self.__db: Union[SettingDB, None] = None
+        self.__helm_fit: Union[HelmholtzFit, None] = None
+
+    @property
+    def power(self) -> BipolarPower:
+        if self.__power is None:
+            self.power = self.power_factory()
+        return self.__power
+
+    @power.setter
+    def power(self, power: BipolarPower) -> None:
+        if power is not None:
+            power.stats = self.stats
+            power.journal = self.journal
+        self.__power = power
+
+    @property
+    def gauss(self) -> GaussMeter:
+        if self.__gauss is None:
+            self.gauss = self.gauss_factory()
+        return self.__gauss
+
+    @gauss.setter
+    def gauss(self, gauss: GaussMeter) -> None:
+        if gauss is not None:
+            gauss.stats = self.stats
+            gauss.journal = self.journal
+        self.__gauss = gauss
+
+    @property
+    def db(self) -> SettingDB:
+        if self.__db is None:
+            self.__db = SettingDB(os.path.join(self.base_dir, DB_NAME), self)
+        return self.__db
+
+    @property
+    def helm_fit(self) -> HelmholtzFit:
+        """
+        ヘルムホルツコイルの電流と磁界の当てはめ 測定中の読み取りで更新し,base_dirに書き出す
+        """
+        if self.__helm_fit is None:
+            self.__helm_fit = HelmholtzFit.load(os.path.join(self.base_dir, HELM_FIT_NAME), HELM_Oe2CURRENT_CONST)
+        return self.__helm_fit
+
+    @property
+    def sequence_dir(self) -> str:
+        return os.path.join(self.base_dir, SEQUENCE_DIR_NAME)
+
+    @property
+    def record_base_dir(self) -> str:
+        return os.path.join(self.base_dir, MEASURE_RECORD_DIR_NAME)
+
+    @property
+    def checkpoint_file(self) -> str:
+        return os.path.join(self.record_base_dir, CHECKPOINT_NAME)
+
+    def record_dir(self) -> str:
+        """
+        ログの書き込み先 日付が変わると次のフォルダに切り替わる
+        """
+        return os.path.join(self.record_base_dir, datetime.datetime.now().strftime("%Y%m%d"))
+
+    def check_cancel(self) -> None:
+        """
+        中断が要求されていれば例外を投げる 測定点・消磁ステップの区切りで呼ぶ
+
+        :raise MeasureCancelledError:
+        """
+        if self.cancel_request.is_set():
+            self.cancel_request.clear()
+            raise MeasureCancelledError
+
+    @staticmethod
+    def beep() -> None:
+        sound.beep()
+
+    @staticmethod
+    def beep_double() -> None:
+        sound.beep_double()
+
+    @staticmethod
+    def beep_long() -> None:
+        sound.beep_long()
+
+    def load_status(self, iout=True, iset=True, vout=True, field=True) -> StatusList:
+        """
+        各ステータスをまとめて取得する
+
+        --------
+        :return: StatusList
+        """
+        result = StatusList()
+        if iout:
+            result.iout = self.power.iout_fetch().A()
+            result.stamp("iout")
+        if iset:
+            result.iset = self.power.iset_fetch().A()
+            result.stamp("iset")
+        if vout:
+            result.vout = self.power.vout_fetch()
+            result.stamp("vout")
+        if field:
+            hint = None
+            if iset:
+                hint = self.expected_field(Current(result.iset, "A"))
+            result.field = self.gauss.magnetic_field_fetch(hint)
+            result.stamp("field")
+            if iset and self.connect_magnet == "HELM":
+                self.helm_fit.add(result.iset * 1000, result.field)
+            if self.gauss.last_range_hops:
+                logger.info("オーバーレンジによるレンジ切替 : {0}回".format(self.gauss.last_range_hops))
+        return result
+
+    def attach_telemetry(self, channel: TelemetryChannel) -> None:
+        """
+        記録・磁界制御・フェーズのイベントをテレメトリに流す
+        """
+        self.telemetry = channel
+        self.stats.add_listener(channel)
+
+    def attach_journal(self, journal: Journal) -> None:
+        """
+        イベントと装置への設定・読み取りをジャーナルに残す
+        """
+        self.journal = journal
+        for device in (self.__power, self.__gauss):
+            if device is not None:
+                device.journal = journal
+
+    def open_journal(self, station: str = "default") -> Journal:
+        """
+        ログフォルダに日付ごとのジャーナルを開いて取り付ける
+        """
+        os.makedirs(self.record_base_dir, exist_ok=True)
+        filepath = os.path.join(self.record_base_dir, datetime.datetime.now().strftime(JOURNAL_NAME_FORMAT))
+        self.attach_journal(Journal(filepath, station))
+        logger.info("ジャーナル : {0}".format(filepath))
+        return self.journal
+
+    def emit(self, kind: str, **fields) -> None:
+        if self.telemetry is not None:
+            self.telemetry.publish(kind, **fields)
+        if self.journal is not None:
+            self.journal.record(kind, **fields)
+
+    def publish_status(self, status: StatusList) -> None:
+        """
+        記録した状態を表示し,リングバッファ・テレメトリがあれば流す
+        """
+        self.last_status = status
+        if self.ring is not None:
+            self.ring.append_status(status)
+        self.emit("status", elapsed=status.diff_second, iset=status.iset, iout=status.iout, field=status.field,
+                  vout=status.vout, target=status.target, t_ns=dict(zip(STAMPED_COLUMNS, status.elapsed_ns())),
+                  dwell=status.dwell)
+        if self.echo_status:
+            print(status)
+        return
+
+    def analyze_run(self, save_file: str) -> concurrent.futures.Future:
+        """
+        記録を終えたログのループの指標を別プロセスで求めて索引に登録する 測定は完了を待たずに続ける
+
+        結果は"metrics"イベントとして流す
+        """
+        if self.__analysis is None:
+            # 監視スレッド等を抱えたままforkしないようspawnで起動する
+            self.__analysis = concurrent.futures.ProcessPoolExecutor(ANALYSIS_WORKERS,
+                                                                     multiprocessing.get_context("spawn"))
+        future = self.__analysis.submit(index_run, self.record_base_dir, save_file)
+        future.add_done_callback(self.__report_run)
+        return future
+
+    def __report_run(self, future: concurrent.futures.Future) -> None:
+        try:
+            run = future.result()
+        except Exception as e:
+            logger.error("ログの解析失敗 : {0}".format(e))
+            return
+        logger.info("ログの解析 : {0}{1}".format(run["path"], format_metrics(run)))
+        self.emit("metrics", **run)
+
+    def report_io_stats(self) -> None:
+        """
+        装置との通信回数と応答時間の集計を表示し,ログフォルダにJSONで書き出す
+        """
+        print(self.stats.summary())
+        record_dir = self.record_dir()
+        os.makedirs(record_dir, exist_ok=True)
+        filename = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".iostats.json"
+        file_path = os.path.join(record_dir, filename)
+        self.stats.export_json(file_path)
+        logger.info("通信集計を書き出し : {0}".format(file_path))
+        return
+
+    def gen_csv_header(self, filename: str, meta: Dict[str, Any] = None) -> (str, datetime.datetime):
+        """
+        ログのヘッダを書き込む
+
+        :param filename:
+        :param meta: ヘッダに1行ずつ書き込む測定条件 (項目名, 値)
+        :return: 基準時刻
+        """
+        record_dir = self.record_dir()
+        os.makedirs(record_dir, exist_ok=True)
+        file_path = os.path.join(record_dir, filename)
+        print("測定条件等メモ記入欄")
+        memo = self.ask("memo :")
+        start_time = datetime.datetime.now()
+        with open(file_path, mode='a', encoding="utf-8")as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(["開始時刻", start_time.strftime('%Y-%m-%d_%H-%M-%S')])
+            writer.writerow(["memo", memo])
+            for key, value in (meta or {}).items():
+                writer.writerow([key, value])
+            writer.writerow([LOG_HEADER_END])
+            writer.writerow(LOG_COLUMN_NAMES)
+        return file_path, start_time
+
+    def expected_field(self, current: Current) -> float:
+        """
+        指令電流から予想される磁界 ガウスメーターのレンジ予測に使う
+
+        :param current: 指令電流
+        :return: 磁界(Oe)
+        """
+        if self.connect_magnet == "HELM":
+            return self.helm_fit.field_for(current.mA())
+        return float(current.mA())  # 電磁石は1 mA -> 1 Oe換算
+
+    def magnet_field_ctl(self, target: int, auto_range: bool = False) -> Current:
+        """
+        磁界制御を行う
+        電磁石の場合は1 Oe -> 1 mA換算で電流を変化させる
+        ヘルムホルツコイルの場合は磁界-電流変換式を用いる
+
+        目標磁界に対応した電流値を最後に返す
+
+        :param target: ターゲット磁界(Oe)
+        :param auto_range: オートレンジを使用するか(電磁石のみ有効)
+        :return: 最終電流
+
+        :raise ValueError: 目標磁界が出力制限を超過する場合は命令を発行せずに例外を投げる
+        """
+        if self.connect_magnet == "ELMG":  # 電磁石制御部
+            if target > ELMG_MAGNET_FIELD_LIMIT:
+                logger.error("磁界制御入力値過大")
+                print("最大磁界4.1kOe")
+                raise ValueError
+            gauss = self.gauss
+            power = self.power
+            now_range = gauss.range_fetch()
+            next_range = 0
+
+            if auto_range:
+                next_range = visa_gs.suitable_range(target)
+
+                if now_range == next_range:  # レンジを変えないとき
+                    auto_range = False
+                    pass
+                elif now_range < next_range:  # レンジを下げる方向
+                    pass
+                else:  # レンジを上げる
+                    gauss.range_set(next_range)
+                    now_range = next_range
+                    auto_range = False
+                    time.sleep(0.1)
+            now_field = gauss.magnetic_field_fetch(target)
+
+            field_up: int
+            if target - now_field > 0:
+                field_up = 1
+            else:
+                field_up = -1
+
+            loop_limit = OECTL_LOOP_LIMIT
+            while True:
+                with self.stats.phase("oectl"):
+                    self.stats.count_event("oectl_iteration")
+                    with self.stats.phase("settle"):
+                        while True:  # 磁界の一致を待つ
+                            palfield = gauss.magnetic_field_fetch(target)
+                            if palfield == now_field:
+                                break
+                            now_field = palfield
+                            time.sleep(0.2)
+
+                    if auto_range:  # レンジを下げる処理
+                        r = visa_gs.suitable_range(now_field)
+
+                        if next_range == 0:
+                            auto_range = False
+
+                        if r == now_range:
+                            pass
+                        if r > now_range:
+                            if r == next_range:
+                                gauss.range_set(next_range)
+                                now_range = r
+                                auto_range = False
+                            elif r < next_range:
+                                gauss.range_set(r)
+                                now_range = r
+                            else:
+                                pass
+                        else:
+                            pass
+
+                    with self.stats.phase("settle"):
+                        while True:  # 磁界の一致を待つ
+                            palfield = gauss.magnetic_field_fetch(target)
+                            if palfield == now_field:
+                                break
+                            now_field = palfield
+                            time.sleep(0.2)
+
+                    self.emit("oectl", target=target, field=now_field, range=now_range, remaining=loop_limit)
+                    if loop_limit == 0:
+                        break
+                    loop_limit -= 1
+
+                    diff_field = target - now_field
+
+                    if field_up == 1 and diff_field <= 1:
+                        break
+                    if field_up == -1 and diff_field >= -1:
+                        break
+
+                    elmg_const = OECTL_BASE_COEFFICIENT - OECTL_RANGE_COEFFICIENT * now_range
+
+                    # 次の設定値を算出
+                    now_current = power.iset_fetch()
+                    diff_current = Current(diff_field * elmg_const, "mA")
+                    if abs(diff_current) < Current(2, "mA"):
+                        if diff_current > 0:
+                            diff_current = Current(2, "mA")
+                        else:
+                            diff_current = Current(-2, "mA")
+
+                    next_current = now_current + diff_current
+                    power.set_iset(next_current)
+
+                    continue
+
+            # 初期差分算出
+            last_current = power.iset_fetch()
+            now_field = gauss.magnetic_field_fetch(target)
+            diff_field = target - now_field
+            if abs(diff_field) >= 1:
+                last_current = last_current + Current(diff_field * 0.9, "mA")
+            last_current = last_current + Current(-(4 - now_range) * field_up, "mA")
+            return last_current
+
+        elif self.connect_magnet == "HELM":  # ヘルムホルツコイル制御部
+            return self.magnet_field_ctl_helmholtz(target)
+        else:
+            raise ValueError
+
+    def magnet_field_ctl_helmholtz(self, target: int) -> Current:
+        if self.connect_magnet == "HELM":  # ヘルムホルツコイル制御部
+            if target > HELM_MAGNET_FIELD_LIMIT:
+                logger.error("磁界制御入力値過大")
+                print("最大磁界200Oe")
+                raise ValueError
+            target_current = Current(self.helm_fit.current_for(target), "mA")
+            self.power.set_iset(target_current)
+            return self.helmholtz_trim(target, target_current)
+        else:
+            raise ValueError
+
+    def helmholtz_trim(self, target: int, current: Current) -> Current:
+        """
+        設定後の磁界を1回だけ読んで当てはめに加え,誤差が残っていれば上限付きで1回補正する
+
+        :param target: ターゲット磁界(Oe)
+        :param current: 設定した電流
+        :return: 最終電流
+        """
+        fit = self.helm_fit
+        field = self.gauss.magnetic_field_fetch(target)
+        fit.add(current.mA(), field)
+        error = max(-HELM_TRIM_MAX_OE, min(HELM_TRIM_MAX_OE, target - field))
+        if abs(error) <= HELM_TRIM_DEADBAND_OE:
+            return current
+        trimmed = current + Current(error / fit.slope, "mA")
+        self.power.set_iset(trimmed)
+        self.stats.count_event("helm_trim")
+        logger.debug("ヘルムホルツコイルの補正 : {0} Oe -> {1} ({2})".format(target, trimmed, fit))
+        return trimmed
+
+    def demag(self, step: int = 15, field_mode: bool = True):
+        with self.stats.phase("demag"):
+            self.demag_process(step, field_mode)
+        return
+
+    def demag_process(self, step: int, field_mode: bool):
+        if self.connect_magnet == "ELMG" and field_mode:
+            max_current = self.magnet_field_ctl(4000, True).mA()
+        elif self.connect_magnet == "ELMG" and (not field_mode):
+            max_current = 4300
+            self.power.set_iset(Current(max_current, "mA"))
+        elif self.connect_magnet == "HELM":
+            max_current = self.magnet_field_ctl(100, True).mA()
+        else:
+            raise ValueError
+        time.sleep(1.0)
+        for i, nc in enumerate(self.demag_waveform(max_current, step).currents()):
+            self.check_cancel()
+            print("Step: " + str(i + 1) + "/" + str(step) + "...", end="", flush=True)
+            self.power.set_iset(nc)
+            time.sleep(1.0)
+            print("!")
+
+        self.power.set_iset(Current(0, "mA"))
+        return
+
+    @staticmethod
+    def demag_waveform(max_current: int, step: int) -> CurrentArray:
+        """
+        符号を反転しながら2乗で減衰する消磁の電流列 最初は-max_current
+
+        :param max_current: 振幅[mA]
+        :param step: 反転回数
+        """
+        return CurrentArray(round((-1) ** (i + 1) * max_current * (1 - i / step) ** 2) for i in range(step))
+
+    def detect_magnet(self) -> str:
+        """
+        抵抗値から接続先の磁石を推定する 推定後は出力を止める
+        """
+        self.power.set_iset(Current(400, "mA"))
+        time.sleep(0.3)
+        resistance: float = self.power.vout_fetch() / self.power.iout_fetch().A()
+        self.power.allow_output(False)
+        if resistance > 4:
+            return "ELMG"
+        return "HELM"
+
+    def connect(self, magnet: str) -> None:
+        """
+        接続先の磁石に合わせて電源とガウスメーターを設定する
+
+        :param magnet: "ELMG" or "HELM"
+        """
+        power = self.power
+        power.allow_output(True)
+        if magnet == "ELMG":
+            print("Support Magnet Field is +-4kOe")
+            power.CURRENT_CHANGE_LIMIT = Current(200, "mA")
+            self.connect_magnet = "ELMG"
+            power.set_iset(Current(500, "mA"))
+            time.sleep(0.5)
+            resistance = power.vout_fetch() / power.iout_fetch().A()
+            power.MAGNET_RESISTANCE = resistance
+            return
+        elif magnet == "HELM":
+            print("Support Magnet Field is +-100Oe")
+            power.CURRENT_CHANGE_DELAY = 0.3
+            self.connect_magnet = "HELM"
+            power.set_iset(Current(400, "mA"))
+            time.sleep(0.2)
+            resistance = power.vout_fetch() / power.iout_fetch().A()
+            power.MAGNET_RESISTANCE = resistance
+            self.gauss.range_set(2)
+            return
+        else:
+            raise ValueError
+
+    def init(self) -> None:
+        self.gauss.range_set(0)
+        self.power.set_iset(Current(0, "mA"))
+
+    def start_watchdog(self, interval: float = WATCHDOG_INTERVAL_SEC) -> Watchdog:
+        self.watchdog = Watchdog(self.power, self.gauss, interval)
+        if self.connect_magnet == "ELMG":
+            self.watchdog.field_limit = ELMG_MAGNET_FIELD_LIMIT * WATCHDOG_FIELD_MARGIN
+        else:
+            self.watchdog.field_limit = HELM_MAGNET_FIELD_LIMIT * WATCHDOG_FIELD_MARGIN
+        self.watchdog.start()
+        return self.watchdog
+
+    def close(self) -> None:
+        """
+        監視スレッドを止め,開いている装置の出力を0にして止める
+        """
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        if self.__db is not None:
+            self.__db.library.stop_watch()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.telemetry is not None:
+            self.stats.remove_listener(self.telemetry)
+            self.telemetry = None
+        if self.__power is not None and self.__gauss is not None:
+            self.init()
+        if self.__power is not None:
+            self.__power.allow_output(False)
+        if self.__helm_fit is not None:
+            self.__helm_fit.save()
+        if self.__analysis is not None:
+            self.__analysis.shutdown()
+            self.__analysis = None
+        if self.journal is not None:
+            journal = self.journal
+            self.attach_journal(None)
+            journal.close()
+        return
@@ -0,0 +1,944 @@
+import csv
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import time
+from logging import getLogger, DEBUG, ERROR, WARNING
+from typing import Union, List, Dict, Sequence, Tuple, TYPE_CHECKING
+
+from jiwai.checkpoint import Checkpoint, RESUME_MARKER
+from jiwai.drift import correct_log
+from jiwai.library import SequenceLibrary, LibraryEntry, WATCH_INTERVAL_SEC
+from jiwai.sequence import TransitionPlan, plan_transition, reapproach_index, parse_sequence
+from jiwai.status import save_status
+from machines_controller.bipolar_power_ctl import Current, CurrentArray
+from machines_controller.gauss_ctl import RANGE_RESOLUTION
+from machines_controller.timeline import PhaseTimeline, report as timeline_report
+
+if TYPE_CHECKING:
+    from jiwai.session import Session
+
+TIMELINE_SUFFIX = ".timeline.jsonl"  # ログと同じ名前で置くフェーズ毎のタイムライン
+SETTLE_POLL_SEC: float = 0.1  # lock_mode "settle" で磁界・電流を読む間隔
+
+logger = getLogger(__name__)
+
+
+class MeasureSetting:  #
+    force_demag: bool = False  # 測定前に消磁を強制するかどうか
+    demag_step: int = 15
+    control_mode: str = "oectl"  # 制御モード "oectl":磁界制御, "current":電流制御
+
+    measure_sequence: List[Sequence[Union[int, float]]] = [[]]  # 測定シークエンス
+
+    pre_lock_sec: float = 1.5  # 磁界設定後に状態を記録するまでの時間
+    post_lock_sec: float = 1.5  # 状態を記録してから状態をロックする時間
+    # "fixed":ロック時間だけ待つ, "settle":ロック時間を上限に磁界と電流が落ち着いたら記録する
+    lock_mode: str = "fixed"
+    settle_min_sec: float = 0.2  # "settle"のロック時間の下限
+    settle_field_tol: float = 1.0  # 落ち着いたとみなす読み取り間の磁界の変化[G] 表示分解能より細かくはしない
+    settle_current_tol: float = 2.0  # 落ち着いたとみなす読み取り間の出力電流の変化[mA]
+
+    pre_block_sec: float = 10  # 測定シークエンスを開始する前に0番目の設定磁界でブロックする時間
+    pre_block_td: datetime.timedelta = datetime.timedelta(seconds=10)
+    post_block_sec: float = 10  # 最後の測定条件で記録してからBG補正用に同じ測定条件でブロックする時間
+    post_block_td: datetime.timedelta = datetime.timedelta(seconds=10)
+    blocking_monitoring_sec: float = 5  # ブロック動作を行っているときにモニタリングを行う間隔
+    blocking_monitoring_td: datetime.timedelta = datetime.timedelta(seconds=5)
+
+    autorange: bool = False
+    use_cache: bool = False
+    transition_tolerance: float = 0  # サブシークエンス境界を連続とみなす設定値の差
+    drift_correction: bool = True  # サブシークエンスごとにプリ・ポストブロックからBG補正したログを書き出す
+
+    # 以下状態管理変数
+    verified: bool = False  # 測定シークエンスが検証済みか
+    have_error: bool = False
+    filepath: str = None
+    seq_hash: str = None
+
+    is_cached: bool = False
+    # 検証時に制御した電流[mA]とレンジ サブシークエンスごと 差し替えのみで書き換えない
+    cached_sequence: Tuple[CurrentArray, ...] = ()
+    cached_range: Tuple[List[int], ...] = ()
+
+    @staticmethod
+    def log_key_notfound(key: str, level: int = DEBUG) -> None:
+        logger.log(level, "[{0}] キーが見つかりません".format(key))
+        return
+
+    @staticmethod
+    def log_invalid_value(key: str, val: str, level: int = DEBUG) -> None:
+        logger.log(level, "[{0}] キーの設定値が不正 : 入力値 = {1}".format(key, val))
+        return
+
+    @staticmethod
+    def log_2small_value(key: str, val: Union[int, float], minimum: Union[int, float], level: int = DEBUG) -> None:
+        logger.log(level, "[{0}] キーの設定値が小さい : 最低値 = {2} ,入力値 = {1} = {1}".format(key, val, minimum))
+        return
+
+    @staticmethod
+    def log_use_default(key: str, val: Union[int, float, str]) -> None:
+        logger.warning("[{0}] キーが未定義 初期値を使用 : {1}".format(key, val))
+        return
+
+    def __init__(self, seq_dict: Dict[str, any] = None, filepath: str = None, session: "Session" = None):
+        self.session = session
+        if seq_dict is None:
+            return
+        if filepath:
+            self.filepath = filepath
+
+        # 必須項目
+        if (key := "connect_to") in seq_dict:
+            mode = seq_dict[key]
+            if not (mode in self.session.connect_magnet):
+                logger.error("設定ファイルと現在の接続先磁石が不一致")
+                self.have_error = True
+        else:
+            self.log_key_notfound(key, ERROR)
+            self.have_error = True
+
+        if (key := "seq") in seq_dict:
+            try:
+                self.measure_sequence = parse_sequence(seq_dict[key])
+            except ValueError as e:
+                logger.error(e)
+                self.log_invalid_value(key, seq_dict[key], ERROR)
+                self.have_error = True
+        else:
+            self.log_key_notfound(key, ERROR)
+            self.have_error = True
+
+        if (key := "control") in seq_dict:
+            mode = seq_dict[key]
+            if "oectl" in mode:
+                self.control_mode = "oectl"
+            elif "current" in mode:
+                self.control_mode = "current"
+            else:
+                self.log_invalid_value(key, seq_dict[key], ERROR)
+                self.have_error = True
+        else:
+            self.log_key_notfound(key, ERROR)
+            self.have_error = True
+
+        # options
+        if (key := "use_cache") in seq_dict:
+            try:
+                self.use_cache = bool(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+
+        if (key := "drift_correction") in seq_dict:
+            self.drift_correction = bool(seq_dict[key])
+
+        if (key := "transition_tolerance") in seq_dict:
+            try:
+                val = float(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+            else:
+                if val < 0:
+                    self.log_2small_value(key, val, 0, WARNING)
+                else:
+                    self.transition_tolerance = val
+
+        if (key := "autorange") in seq_dict:
+            try:
+                self.autorange = bool(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+        else:
+            if self.control_mode == "oectl":
+                self.log_use_default(key, self.pre_lock_sec)
+                self.verified = False
+
+        if (key := "demag") in seq_dict:
+            try:
+                self.force_demag = bool(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+        else:
+            self.log_use_default(key, self.force_demag)
+            self.verified = False
+
+        if (key := "demag_step") in seq_dict:
+            try:
+                self.demag_step = int(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+
+            if self.demag_step < 1:
+                self.log_invalid_value(key, seq_dict[key], ERROR)
+                self.have_error = True
+
+        if (key := "pre_lock_sec") in seq_dict:
+            try:
+                val = float(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+            else:
+                if val < 0:
+                    self.log_2small_value(key, val, 0, WARNING)
+                    self.verified = False
+                else:
+                    self.pre_lock_sec = val
+        else:
+            self.log_use_default(key, self.pre_lock_sec)
+
+        if (key := "post_lock_sec") in seq_dict:
+
+            try:
+                val = float(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+            else:
+                if val < 0:
+                    self.log_2small_value(key, val, 0, WARNING)
+                    self.verified = False
+                else:
+                    self.post_lock_sec = val
+        else:
+            self.log_use_default(key, self.post_lock_sec)
+
+        if (key := "lock_mode") in seq_dict:
+            if seq_dict[key] in ("fixed", "settle"):
+                self.lock_mode = seq_dict[key]
+            else:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+
+        for key in ("settle_min_sec", "settle_field_tol", "settle_current_tol"):
+            if key not in seq_dict:
+                continue
+            try:
+                val = float(seq_dict[key])
+            except (TypeError, ValueError):
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+            else:
+                if val < 0:
+                    self.log_2small_value(key, val, 0, WARNING)
+                    self.verified = False
+                else:
+                    setattr(self, key, val)
+
+        if (key := "pre_block_sec") in seq_dict:
+            minimum = 0.2
+            try:
+                val = float(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+            else:
+                if val < minimum:
+                    self.log_2small_value(key, val, minimum, WARNING)
+                    self.verified = False
+                else:
+                    self.pre_block_sec = val
+                    self.pre_block_td = datetime.timedelta(seconds=val)
+        else:
+            self.log_use_default(key, self.pre_block_sec)
+
+        if (key := "post_block_sec") in seq_dict:
+            minimum = 0.2
+            try:
+                val = float(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+            else:
+                if val < minimum:
+                    self.log_2small_value(key, val, minimum, WARNING)
+                    self.verified = False
+                else:
+                    self.post_block_sec = val
+                    self.post_block_td = datetime.timedelta(seconds=val)
+        else:
+            self.log_use_default(key, self.post_block_sec)
+
+        if (key := "blocking_monitoring_sec") in seq_dict:
+            minimum = 1
+            try:
+                val = float(seq_dict[key])
+            except ValueError:
+                self.log_invalid_value(key, seq_dict[key], WARNING)
+                self.verified = False
+            else:
+                if val < minimum:
+                    self.log_2small_value(key, val, minimum, WARNING)
+                    self.verified = False
+                else:
+                    self.blocking_monitoring_sec = val
+                    self.blocking_monitoring_td = datetime.timedelta(seconds=val)
+        else:
+            self.log_use_default(key, self.blocking_monitoring_sec)
+
+        return
+
+    def measure_lock_record(self, target: Union[float, int], pre_lock_time: float, post_lock_time: float,
+                            start_time: datetime.datetime, save_file: str = None, mes_range: int = None) -> Current:
+        self.session.check_cancel()
+        current = None
+        change_range = False
+        if not (mes_range is None):
+            change_range = True
+            now_range = self.session.gauss.range_fetch()
+            if mes_range < now_range:
+                self.session.gauss.range_set(mes_range)
+                change_range = False
+        if self.use_cache and self.control_mode == "oectl":
+            self.session.emit("cache_hit" if self.is_cached else "cache_miss", target=target)
+        if self.control_mode == "current" or (self.is_cached and self.use_cache):
+            current = Current(target, "mA")
+            self.session.power.set_iset(current)
+        elif self.control_mode == "oectl":
+            current = self.session.magnet_field_ctl(target, self.autorange)
+
+        if change_range:
+            self.session.gauss.range_set(mes_range)
+
+        with self.session.stats.phase("pre_lock"):
+            dwell = self.lock(pre_lock_time)
+        self.record_status(target, start_time, save_file, dwell)
+
+        if post_lock_time == 0:
+            return current
+        with self.session.stats.phase("post_lock"):
+            dwell = self.lock(post_lock_time)
+
+        self.record_status(target, start_time, save_file, dwell)
+        return current
+
+    def lock(self, lock_sec: float) -> Union[float, None]:
+        """
+        記録する前に状態をロックする
+
+        lock_modeが"settle"ならlock_secを上限,settle_min_secを下限として,SETTLE_POLL_SEC毎に読んだ
+        磁界と出力電流の変化が許容値以内になった時点で終える
+        :param lock_sec: ロック時間の設定値
+        :return: 実際にロックした時間[sec] ロックしない場合はNone
+        """
+        if lock_sec <= 0:
+            return None
+        start = time.perf_counter()
+        if self.lock_mode != "settle":
+            time.sleep(lock_sec)
+            return time.perf_counter() - start
+        field_tol = max(self.settle_field_tol, RANGE_RESOLUTION[self.session.gauss.range_fetch()])
+        time.sleep(max(0.0, min(self.settle_min_sec, lock_sec) - SETTLE_POLL_SEC))
+        last = self.session.load_status(iset=False, vout=False)
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed + SETTLE_POLL_SEC >= lock_sec:
+                time.sleep(max(0.0, lock_sec - elapsed))
+                return time.perf_counter() - start
+            time.sleep(SETTLE_POLL_SEC)
+            now = self.session.load_status(iset=False, vout=False)
+            if (abs(now.field - last.field) <= field_tol
+                    and abs(now.iout - last.iout) * 1000 <= self.settle_current_tol):
+                return time.perf_counter() - start
+            last = now
+
+    def record_status(self, target: Union[float, int], start_time: datetime.datetime, save_file: str = None,
+                      dwell: Union[float, None] = None) -> None:
+        """
+        制御を行わずに現在の状態を記録する
+
+        :param target: 記録する設定値
+        :param start_time: 測定基準時刻
+        :param save_file: ログファイル名
+        :param dwell: 記録までにロックした時間[sec] ログに併記する
+        """
+        with self.session.stats.phase("record"):
+            status = self.session.load_status()
+        status.set_origin_time(start_time)
+        status.target = target
+        status.dwell = dwell
+        self.session.publish_status(status)
+        if save_file:
+            with self.session.stats.phase("write"):
+                save_status(save_file, status)
+        return
+
+    def remove_cache(self):
+        self.cached_range = ()
+        self.cached_sequence = ()
+        self.is_cached = False
+        return
+
+    def measure_process(self, measure_seq: Sequence[Union[int, float]], start_time: datetime.datetime,
+                        save_file: str = None, cached_range: Union[List[int]] = None,
+                        transition: TransitionPlan = None, checkpoint: Checkpoint = None,
+                        start_index: int = 0) -> (CurrentArray, List[int]):
+        """
+        測定シークエンスに従って測定を実施する
+
+        :param cached_range:
+        :param measure_seq: 測定シークエンス intのリスト
+        :param start_time: 測定基準時刻
+        :param save_file: ログファイル名
+        :param transition: 直前のサブシークエンスからの遷移計画
+        :param checkpoint: 測定点ごとに進行状況を書き出すチェックポイント
+        :param start_index: 再開する測定点 0より大きい場合はプリブロックを行わず折り返し点を経由して再開する
+        """
+
+        res_current = CurrentArray()
+        res_range: List[int] = []
+        timeline = None
+        if save_file:
+            timeline = PhaseTimeline(os.path.splitext(save_file)[0] + TIMELINE_SUFFIX, self.session.stats)
+        try:
+            self.measure_points(measure_seq, start_time, save_file, cached_range, transition, checkpoint,
+                                start_index, timeline, res_current, res_range)
+        finally:
+            if timeline is not None:
+                timeline.close()
+        if timeline is not None:
+            print(timeline_report([timeline.filepath]))
+        return res_current, res_range
+
+    def measure_points(self, measure_seq: Sequence[Union[int, float]], start_time: datetime.datetime, save_file: str,
+                       cached_range: Union[List[int], None], transition: Union[TransitionPlan, None],
+                       checkpoint: Union[Checkpoint, None], start_index: int, timeline: Union[PhaseTimeline, None],
+                       res_current: CurrentArray, res_range: List[int]) -> None:
+        if start_index > 0:
+            if timeline is not None:
+                timeline.point("reapproach")
+            self.reapproach(measure_seq, start_index, start_time, cached_range,
+                            None if checkpoint is None else checkpoint.current)
+        else:
+            if timeline is not None:
+                timeline.point("pre_block", measure_seq[0])
+            with self.session.stats.phase("block"):
+                self.pre_block(measure_seq, start_time, save_file, cached_range, transition)
+            if checkpoint is not None:
+                self.update_checkpoint(checkpoint, -1, save_file)
+
+        lx = len(measure_seq)
+        points_start = datetime.datetime.now()
+        for loop, target in enumerate(itertools.islice(measure_seq, start_index, None), start_index):
+            point_start = datetime.datetime.now()
+            if timeline is not None:
+                timeline.point(loop, target)
+            if cached_range is None:
+                mes_range = None
+            else:
+                mes_range = cached_range[loop]
+            c: Current
+            if loop == 0:
+                c = self.measure_lock_record(target, 0, self.post_lock_sec, start_time, save_file, mes_range)
+            elif loop == lx - 1:
+                c = self.measure_lock_record(target, self.pre_lock_sec, 0, start_time, save_file, mes_range)
+            else:
+                c = self.measure_lock_record(target, self.pre_lock_sec, self.post_lock_sec, start_time, save_file,
+                                             mes_range)
+            res_current.append(c.mA())
+            res_range.append(self.session.gauss.range_fetch())
+            self.session.stats.count_event("point")
+            per_point = (datetime.datetime.now() - points_start).total_seconds() / (loop + 1 - start_index)
+            eta = per_point * (lx - 1 - loop) + self.post_block_sec
+            self.session.emit("point", index=loop, total=lx, target=target, current=c.mA(), range=res_range[-1],
+                              sec=round((datetime.datetime.now() - point_start).total_seconds(), 3),
+                              eta_sec=round(eta, 1))
+            if checkpoint is not None:
+                self.update_checkpoint(checkpoint, loop, save_file, c, res_range[-1])
+
+        if timeline is not None:
+            timeline.point("post_block", measure_seq[-1])
+        with self.session.stats.phase("block"):
+            self.post_block(measure_seq, start_time, save_file, cached_range)
+        if checkpoint is not None:
+            checkpoint.completed = True
+            self.update_checkpoint(checkpoint, lx - 1, save_file)
+        return
+
+    def update_checkpoint(self, checkpoint: Checkpoint, point_index: int, save_file: str = None,
+                          current: Current = None, gauss_range: int = None) -> None:
+        checkpoint.point_index = point_index
+        if current is not None:
+            checkpoint.current = current.mA()
+        if gauss_range is not None:
+            checkpoint.gauss_range = gauss_range
+        if save_file:
+            checkpoint.file_offset = os.path.getsize(save_file)
+        checkpoint.save(self.session.checkpoint_file)
+        return
+
+    def reapproach(self, measure_seq: Sequence[Union[int, float]], start_index: int, start_time: datetime.datetime,
+                   cached_range: Union[List[int]] = None, current: Union[int, None] = None) -> None:
+        """
+        中断した測定点の直前まで記録せずに安全に移動する
+
+        :param measure_seq: 測定シークエンス
+        :param start_index: 再開する測定点
+        :param start_time: 測定基準時刻
+        :param cached_range:
+        :param current: 中断前に最後に記録した点の電流[mA] 電源がまだこの電流を出していれば
+                        中断した枝に留まっているので経由点を通らずにそのまま再開する
+        """
+        if current is not None and self.session.power.iset_fetch().mA() == current:
+            logger.info("中断時の電流を保持しているため経由点を省略 : {0} mA".format(current))
+            return
+        waypoints = []
+        if (j := reapproach_index(measure_seq, start_index)) is not None:
+            waypoints.append(j)
+        if start_index - 1 not in waypoints:
+            waypoints.append(start_index - 1)
+        for j in waypoints:
+            mes_range = None if cached_range is None else cached_range[j]
+            logger.info("再開のため経由点へ移動 : index={0} target={1}".format(j, measure_seq[j]))
+            self.measure_lock_record(measure_seq[j], self.pre_lock_sec, 0, start_time, mes_range=mes_range)
+        return
+
+    def pre_block(self, measure_seq: Sequence[Union[int, float]], start_time: datetime.datetime, save_file: str = None,
+                  cached_range: Union[List[int]] = None, transition: TransitionPlan = None) -> None:
+        if transition is None:
+            transition = TransitionPlan()
+        pre_block_td = self.pre_block_td
+        if transition.pre_block_td is not None:
+            pre_block_td = min(pre_block_td, transition.pre_block_td)
+        pre_block_range = None
+        if cached_range is None:
+            pass
+        else:
+            pre_block_range = cached_range[0]
+        if transition.skip_approach:
+            logger.info("開始点への移動を省略 : {0}".format(transition))
+            self.record_status(measure_seq[0], start_time, save_file)
+        else:
+            self.measure_lock_record(measure_seq[0], self.pre_lock_sec, 0, start_time, save_file=save_file,
+                                     mes_range=pre_block_range)
+        origin_time = datetime.datetime.now()
+        next_time = origin_time + self.blocking_monitoring_td
+        pre_block_end_time = origin_time + pre_block_td
+        last_time = pre_block_end_time - self.blocking_monitoring_td
+
+        logger.debug("pre_block_end_time = {0}".format(pre_block_end_time))
+        logger.debug("last_time = {0}".format(last_time))
+        logger.debug("next_time = {0}".format(next_time))
+        while next_time < last_time:
+            logger.debug("next_time = {0}".format(next_time))
+            while datetime.datetime.now() < next_time:
+                time.sleep(0.2)
+            self.measure_lock_record(measure_seq[0], 0, 0, start_time, save_file=save_file, mes_range=pre_block_range)
+            next_time = next_time + self.blocking_monitoring_td
+        else:
+            while datetime.datetime.now() < pre_block_end_time:
+                time.sleep(0.2)
+            self.measure_lock_record(measure_seq[0], 0, 0, start_time, save_file)
+        return
+
+    def post_block(self, measure_seq: Sequence[Union[int, float]], start_time: datetime.datetime, save_file: str = None,
+                   cached_range: Union[List[int]] = None) -> None:
+        origin_time = datetime.datetime.now()
+        next_time = origin_time + self.blocking_monitoring_td
+        post_block_end_time = origin_time + self.post_block_td
+        last_time = post_block_end_time - self.blocking_monitoring_td
+
+        post_block_range = None
+        if cached_range is None:
+            pass
+        else:
+            post_block_range = cached_range[-1]
+        while next_time < last_time:
+            while datetime.datetime.now() < next_time:
+                time.sleep(0.2)
+            self.measure_lock_record(measure_seq[-1], 0, 0, start_time, save_file, post_block_range)
+            next_time = next_time + self.blocking_monitoring_td
+        else:
+            while datetime.datetime.now() < post_block_end_time:
+                time.sleep(0.2)
+            self.measure_lock_record(measure_seq[-1], 0, 0, start_time, save_file, post_block_range)
+        return
+
+    def correct_drift(self, save_file: str) -> None:
+        """
+        記録を終えたログのBG補正 失敗しても測定は続ける
+        """
+        if not self.drift_correction:
+            return
+        try:
+            slopes = correct_log(save_file)
+        except (OSError, ValueError) as e:
+            logger.warning("BG補正失敗 : {0} {1}".format(save_file, e))
+            return
+        print("BG補正 : " + ", ".join("{0} {1:+.4g}/sec".format(k, v) for k, v in slopes.items()))
+        return
+
+    def new_checkpoint(self, sequence_index: int, save_file: str, start_time: datetime.datetime) -> Checkpoint:
+        checkpoint = Checkpoint()
+        checkpoint.setting_path = self.filepath
+        checkpoint.seq_hash = self.seq_hash
+        checkpoint.log_file = save_file
+        checkpoint.start_time = start_time
+        checkpoint.sequence_index = sequence_index
+        return checkpoint
+
+    def resume_process(self, measure_seq: Sequence[Union[int, float]], checkpoint: Checkpoint,
+                       cached_range: Union[List[int]] = None) -> None:
+        """
+        チェックポイントから中断したサブシークエンスを再開する
+
+        ログには再開位置を示す行を書き込んで不連続点を明示する
+
+        :param measure_seq: 中断したサブシークエンス
+        :param checkpoint: 読み込んだチェックポイント
+        :param cached_range:
+        """
+        save_file = checkpoint.log_file
+        if not os.path.exists(save_file) or os.path.getsize(save_file) < checkpoint.file_offset:
+            logger.error("ログファイルがチェックポイントと一致しません : {0}".format(save_file))
+            raise ValueError
+        with open(save_file, mode='a', encoding="utf-8")as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow([RESUME_MARKER, datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'),
+                             checkpoint.point_index + 1])
+        start_index = checkpoint.point_index + 1
+        logger.info("測定再開 : {0}".format(checkpoint))
+        self.session.gauss.range_set(checkpoint.gauss_range)  # 電源を入れ直すとレンジが戻るので中断時のレンジにする
+        if start_index >= len(measure_seq):  # 全点記録済みならポストブロックのみやり直す
+            self.measure_lock_record(measure_seq[-1], self.pre_lock_sec, 0, checkpoint.start_time,
+                                     mes_range=None if cached_range is None else cached_range[-1])
+            self.post_block(measure_seq, checkpoint.start_time, save_file, cached_range)
+            checkpoint.completed = True
+            self.update_checkpoint(checkpoint, len(measure_seq) - 1, save_file)
+            return
+        self.measure_process(measure_seq, checkpoint.start_time, save_file, cached_range=cached_range,
+                             checkpoint=checkpoint, start_index=start_index)
+        return
+
+    def measure(self, resume: Checkpoint = None) -> None:
+        """
+        測定プログラム
+
+        :param resume: 中断した測定を再開する場合のチェックポイント
+        """
+        if not self.verified:
+            print("設定ファイルの検証を行ってください。")
+            return
+        if resume is not None and resume.seq_hash != self.seq_hash:
+            logger.error("チェックポイントと読み込み中の設定ファイルが不一致")
+            return
+        self.session.stats.reset()
+        if self.force_demag and resume is None:
+            oe_mode = True
+            if self.control_mode == "current":
+                oe_mode = False
+            print("消磁中")
+            self.session.demag(self.demag_step, oe_mode)
+            print("消磁完了")
+            self.session.beep_double()
+
+        if self.use_cache and self.is_cached:
+            sequence = self.cached_sequence
+        else:
+            sequence = self.measure_sequence
+        prev_seq = None
+        for i, seq in enumerate(sequence):
+            cached_range = None
+            if self.use_cache and self.is_cached and self.autorange:
+                cached_range = self.cached_range[i]
+            if resume is not None:
+                if i < resume.sequence_index or (i == resume.sequence_index and resume.completed):
+                    prev_seq = seq
+                    continue
+                if i == resume.sequence_index:
+                    self.resume_process(seq, resume, cached_range)
+                    self.correct_drift(resume.log_file)
+                    self.session.analyze_run(resume.log_file)
+                    prev_seq = seq
+                    print("測定完了")
+                    self.session.beep()
+                    continue
+            print("測定シーケンスに入ります Y/n s(kip)")
+            r = self.session.ask(">>>>>").lower()
+            if r == "n":
+                break
+            if r == "s":
+                continue
+            transition = plan_transition(prev_seq, seq, self.transition_tolerance, self.drift_correction)
+            file = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".log"
+            meta = {"sequence": os.path.basename(self.filepath or ""), "seq_hash": self.seq_hash,
+                    "magnet": self.session.connect_magnet, "control": self.control_mode, "sequence_index": i}
+            file, start_time = self.session.gen_csv_header(file, meta)
+            checkpoint = self.new_checkpoint(i, file, start_time)
+            self.measure_process(seq, start_time, save_file=file, cached_range=cached_range, transition=transition,
+                                 checkpoint=checkpoint)
+            self.correct_drift(file)
+            self.session.analyze_run(file)
+            prev_seq = seq
+            print("測定完了")
+            self.session.beep_double()
+
+        Checkpoint.remove(self.session.checkpoint_file)
+        self.session.gauss.range_set(0)
+        self.session.power.set_iset(Current(0, "mA"))
+        self.session.report_io_stats()
+        return
+
+    def measure_test(self, keep_output: bool = False) -> None:
+        """
+        測定設定ファイルを検証する
+
+        :param keep_output: 終了時のレンジ・電流のリセットを省略する(次の測定が連続する場合)
+        """
+        if self.have_error:
+            logger.error("設定ファイルに致命的な問題あり")
+            self.verified = False
+            return
+        self.session.stats.reset()
+        if self.force_demag:
+            oe_mode = True
+            if self.control_mode == "current":
+                oe_mode = False
+            print("消磁中")
+            self.session.demag(self.demag_step, oe_mode)
+            print("消磁完了")
+        sequence: Sequence[Sequence[Union[int, float]]]
+        cache_lr: List[List[int]] = []
+        cache_lc: List[CurrentArray] = []
+        if self.is_cached and self.use_cache:
+            print("cached")
+            sequence = self.cached_sequence
+        else:
+            sequence = self.measure_sequence
+        i = 0
+        prev_seq = None
+        for seq in sequence:
+            start_time = datetime.datetime.now()
+            print("測定開始:", start_time.strftime('%Y-%m-%d %H:%M:%S'))
+            transition = plan_transition(prev_seq, seq, self.transition_tolerance, self.drift_correction)
+            try:
+                if self.use_cache and self.is_cached and self.autorange:
+                    cache_c, cache_r = self.measure_process(seq, start_time, cached_range=self.cached_range[i],
+                                                            transition=transition)
+                else:
+                    cache_c, cache_r = self.measure_process(seq, start_time, transition=transition)
+            except ValueError:
+                logger.error("測定値指定が不正です")
+                self.verified = False
+                return
+            i += 1
+            prev_seq = seq
+            if self.use_cache and (not self.is_cached):
+                cache_lc.append(cache_c)
+                cache_lr.append(cache_r)
+
+        self.verified = True
+        if self.use_cache and (not self.is_cached):
+            self.is_cached = True
+            self.cached_sequence = tuple(cache_lc)
+            self.cached_range = tuple(cache_lr)
+
+        print("測定設定は検証されました。")
+        if keep_output:
+            logger.info("次の測定と連続するため出力を維持")
+            self.session.report_io_stats()
+            return
+        self.session.gauss.range_set(0)
+        self.session.power.set_iset(Current(0, "mA"))
+        self.session.report_io_stats()
+        return
+
+
+class SettingDB:
+    filepath: str = ""
+    db: Dict[str, int]
+    seq: MeasureSetting
+    now_hash: str = None
+    loading_setting_path: str = None
+
+    cached_seq: Dict[str, Tuple[CurrentArray, ...]]
+    cached_range: Dict[str, Tuple[List[int], ...]]
+
+    def __init__(self, filepath: str, session: "Session"):
+        self.filepath = filepath
+        self.session = session
+        self.db = dict()
+        self.seq = MeasureSetting(None, None, session)
+        # 測定設定は接続先の磁石を検証するので,接続先が変わったら読み直す
+        self.library = SequenceLibrary(session.sequence_dir, lambda d, p: MeasureSetting(d, p, session),
+                                       lambda: session.connect_magnet)
+        self.cached_seq = dict()
+        self.cached_range = dict()
+        self.load_db()
+        return
+
+    def load_db(self) -> None:
+        if not os.path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, "r") as f:
+                self.db = json.load(f)
+        except json.JSONDecodeError:
+            os.remove(self.filepath)
+            logger.warning("setting DB was broken!")
+            return
+        return
+
+    def save_db(self):
+        with open(self.filepath, mode='w', encoding="utf-8")as f:
+            json.dump(self.db, f)
+
+    def hash_check(self, filepath):
+        m = hashlib.sha512()
+        with open(filepath, 'rb') as f:
+            m.update(f.read())
+        self.now_hash = m.hexdigest()
+        return self.now_hash
+
+    def load_measure_sequence(self, filename: str, abspath: bool = False):
+        self.save_cache()
+        if not abspath:
+            json_path = os.path.join(self.session.sequence_dir, filename)
+            self.loading_setting_path = json_path
+        else:
+            json_path = filename
+
+        if not os.path.exists(json_path):
+            logger.error("File not found! : {0} ".format(filename))
+            return
+
+        entry = self.library.load(json_path)
+        if entry.error is not None:
+            logger.error("設定ファイルの読み込み失敗 JSONファイルの構造を確認 ")
+            return
+        self.seq = entry.new_setting()
+        self.seq.seq_hash = self.now_hash = entry.seq_hash
+        if (key := self.now_hash) in self.db:
+            if self.db[key]:
+                logger.info("検証済み設定ファイル {0}".format(json_path))
+                self.seq.verified = True
+            else:
+                logger.info("設定ファイルの変更検知 {0}".format(json_path))
+        else:
+            logger.info("新しい設定ファイル {0}".format(json_path))
+        if self.seq.verified:
+            print("設定ファイルは検証済み")
+            if self.seq.use_cache:
+                self.load_cache()
+        else:
+            print("設定ファイルに未検証の要素有り. test 実行必須")
+        return
+
+    def multi_load(self, args: List[str]):
+        if len(args) == 0:
+            print("引数が与えられていない")
+            return
+
+        self.library.prefetch(os.path.join(self.session.sequence_dir, p) for p in args)
+        for p in args:
+            print("loading : {0}".format(p))
+            self.load_measure_sequence(p)
+            if self.seq.have_error:
+                raise ValueError
+
+        for n, p in enumerate(args):
+            print("testing : {0}".format(p))
+            keep_output = n + 1 < len(args) and self.continues_to(args[n + 1])
+            self.load_measure_sequence(p)
+            if not self.seq.verified or (self.seq.use_cache and (not self.seq.is_cached)):
+                self.seq.measure_test(keep_output)
+
+            if not self.seq.verified:
+                raise ValueError
+            if not (key := self.now_hash) in self.db:
+                self.db[key] = True
+
+        print("読み込み完了")
+        self.session.beep_long()
+        return
+
+    def watch_sequences(self, interval: float = WATCH_INTERVAL_SEC) -> None:
+        """
+        測定設定ファイルのフォルダを監視し,編集されたファイルを裏で読み直して検証状態を知らせる
+        """
+        self.library.watch(self.__sequence_changed, interval)
+
+    def __sequence_changed(self, path: str, entry: LibraryEntry) -> None:
+        if entry.error is not None:
+            logger.warning("設定ファイルの読み込み失敗 : {0} {1}".format(path, entry.error))
+        elif entry.setting.have_error:
+            logger.warning("設定ファイルに致命的な問題あり : {0}".format(path))
+        elif self.db.get(entry.seq_hash):
+            logger.info("検証済み設定ファイル : {0}".format(path))
+        else:
+            logger.warning("設定ファイルの変更検知 test 実行必須 : {0}".format(path))
+        if self.loading_setting_path and path == os.path.abspath(self.loading_setting_path):
+            logger.warning("読み込み中の設定ファイルが変更された reload で読み直す : {0}".format(path))
+
+    def continues_to(self, filename: str) -> bool:
+        """
+        読み込み中の設定ファイルの終点から次の設定ファイルの始点へ連続して移れるかを判定する
+
+        :param filename: ./measure_sequence以下の次の設定ファイル名
+        """
+        json_path = os.path.join(self.session.sequence_dir, filename)
+        try:
+            entry = self.library.load(json_path)
+        except OSError:
+            return False
+        if entry.error is not None or entry.setting.have_error:
+            return False
+        next_setting = entry.setting
+        if next_setting.force_demag or next_setting.control_mode != self.seq.control_mode:
+            return False
+        next_sequence = next_setting.measure_sequence
+        if not next_sequence or not next_sequence[0] or not self.seq.measure_sequence[-1]:
+            return False
+        plan = plan_transition(self.seq.measure_sequence[-1], next_sequence[0], self.seq.transition_tolerance)
+        return plan.skip_approach
+
+    def resume_measure(self) -> None:
+        """
+        チェックポイントに記録された測定設定ファイルを読み込み,中断した測定を再開する
+        """
+        checkpoint = Checkpoint.load(self.session.checkpoint_file)
+        if checkpoint is None:
+            print("再開できる測定はありません")
+            return
+        print("再開 : {0}".format(checkpoint))
+        if self.seq.seq_hash != checkpoint.seq_hash:
+            self.load_measure_sequence(checkpoint.setting_path, True)
+        if self.seq.seq_hash != checkpoint.seq_hash:
+            logger.error("測定設定ファイルが中断時から変更されているため再開不能")
+            return
+        self.seq.measure(resume=checkpoint)
+        return
+
+    def reload_measure_sequence(self):
+        self.seq.remove_cache()
+        self.load_measure_sequence(self.loading_setting_path, True)
+        return
+
+    def seq_verified(self, b: bool):
+        self.seq.verified = b
+        self.db[self.now_hash] = b
+        self.save_db()
+        return
+
+    def save_cache(self):
+        if (not self.seq.verified) or (not self.seq.use_cache) or (not self.seq.is_cached):
+            return
+
+        self.cached_seq[self.now_hash] = self.seq.cached_sequence
+        self.cached_range[self.now_hash] = self.seq.cached_range
+        return
+
+    def load_cache(self):
+        if not self.seq.verified:
+            return
+        if not (self.now_hash in self.cached_seq):
+            return
+
+        self.seq.cached_sequence = self.cached_seq[self.now_hash]
+        self.seq.cached_range = self.cached_range[self.now_hash]
+        self.seq.is_cached = True
+        print("測定キャッシュ読み込み完了")
+        return
@@ -0,0 +1,36 @@
+import time
+from typing import Final
+
+BEEP_HZ: Final = 2000
+BEEP_SHORT: Final = 300
+BEEP_LONG: Final = 1000
+BEEP_DOT: Final = 100
+
+try:
+    import winsound
+except ImportError:  # Windows以外では音を鳴らさない
+    winsound = None
+
+
+def beep(duration: int = BEEP_DOT) -> None:
+    if winsound is None:
+        return
+    winsound.Beep(BEEP_HZ, duration)
+
+
+def beep_double() -> None:
+    beep()
+    time.sleep(BEEP_DOT / 1000)
+    beep()
+
+
+def beep_long() -> None:
+    beep(BEEP_LONG)
+
+
+def beep_s() -> None:
+    beep()
+    time.sleep(BEEP_DOT / 1000)
+    beep()
+    time.sleep(BEEP_DOT / 1000)
+    beep()
@@ -0,0 +1,108 @@
+import json
+import os
+from logging import getLogger
+from typing import Union, List, Dict, Any, Final
+
+from jiwai.session import Session
+from machines_controller.bipolar_power_ctl import BipolarPower
+from machines_controller.gauss_ctl import GaussMeter
+
+STATION_CONFIG_NAME: Final = "stations.json"
+
+logger = getLogger(__name__)
+
+
+class StationConfig:
+    """
+    1組の電源・ガウスメーターと磁石からなる測定ステーションの設定
+
+    設定ファイルの形式
+    {
+     "stations": [
+      {"name": "A", "power": "GPIB0::4::INSTR", "gauss": "ASRL3::INSTR", "magnet": "ELMG", "base_dir": "A"},
+      {"name": "B", "power": "GPIB0::5::INSTR", "gauss": "ASRL4::INSTR", "magnet": "HELM", "base_dir": "B"}
+     ]
+    }
+    base_dir は設定ファイルからの相対パスで,ステーションごとの setting.db, measure_sequence, logs を置く
+    """
+    name: str = "default"
+    power_address: str = "GPIB0::4::INSTR"
+    gauss_address: str = "ASRL3::INSTR"
+    magnet: Union[str, None] = None  # "ELMG" or "HELM" Noneなら抵抗値から推定する
+    base_dir: str = "."
+    watchdog: bool = True  # 監視スレッドを起動するか
+
+    def __init__(self, conf: Dict[str, Any] = None, config_dir: str = ".") -> None:
+        """
+        :raise ValueError: 設定値が不正
+        """
+        if conf is None:
+            return
+        if (key := "name") in conf:
+            self.name = str(conf[key])
+        if (key := "power") in conf:
+            self.power_address = str(conf[key])
+        if (key := "gauss") in conf:
+            self.gauss_address = str(conf[key])
+        if (key := "magnet") in conf:
+            if conf[key] not in {"ELMG", "HELM", None}:
+                raise ValueError("[{0}] キーの設定値が不正 : {1}".format(key, conf[key]))
+            self.magnet = conf[key]
+        self.base_dir = os.path.join(config_dir, str(conf.get("base_dir", self.name)))
+        if (key := "watchdog") in conf:
+            self.watchdog = bool(conf[key])
+        return
+
+    def __str__(self):
+        return "{0} power={1} gauss={2} magnet={3} base_dir={4}".format(self.name, self.power_address,
+                                                                       self.gauss_address, self.magnet, self.base_dir)
+
+    def create_session(self) -> Session:
+        """
+        このステーションの装置に接続するSessionを作る 装置は最初に使うときに開く
+        """
+        return Session(self.base_dir, power_factory=lambda: BipolarPower(self.power_address),
+                       gauss_factory=lambda: GaussMeter(self.gauss_address))
+
+
+def load_stations(filepath: str) -> List[StationConfig]:
+    """
+    ステーションの設定ファイルを読み込む
+
+    :raise ValueError: 設定ファイルが不正
+    """
+    with open(filepath, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            raise ValueError("ステーション設定ファイルの読み込み失敗 : {0}".format(filepath))
+    config_dir = os.path.dirname(os.path.abspath(filepath))
+    stations = [StationConfig(conf, config_dir) for conf in data.get("stations", [])]
+    if not stations:
+        raise ValueError("ステーションが定義されていない : {0}".format(filepath))
+    names = [s.name for s in stations]
+    if len(set(names)) != len(names):
+        raise ValueError("ステーション名が重複している : {0}".format(names))
+    return stations
+
+
+def start_station(config: StationConfig, session: Session = None) -> Session:
+    """
+    装置に接続し,磁石に合わせて設定して出力を0にする
+
+    :param config: ステーションの設定
+    :param session: 接続済みのSession 省略時は設定のアドレスに接続する
+    """
+    if session is None:
+        session = config.create_session()
+    session.gauss.range_set(0)
+    magnet = config.magnet
+    if not magnet:  # 電源投入直後・close後は出力が止まっていて抵抗を測れない
+        session.power.allow_output(True)
+        magnet = session.detect_magnet()
+    logger.info("ステーション起動 : {0} magnet={1}".format(config.name, magnet))
+    session.connect(magnet)
+    session.init()
+    if config.watchdog:
+        session.start_watchdog()
+    return session
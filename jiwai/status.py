@@ -0,0 +1,126 @@
+import csv
+import datetime
+import functools
+import time
+from typing import Dict, Iterator, List, Union, Final
+
+LOG_HEADER_END: Final = "#####"  # ログのヘッダとデータの区切り
+# out_tuple()の並び t_*は装置ごとの応答時刻 基準時刻からのns dwellは記録までにロックした時間
+LOG_COLUMNS: Final = ("elapsed", "iset", "iout", "field", "vout", "target", "t_iset", "t_iout", "t_field", "t_vout",
+                      "dwell")
+LOG_COLUMN_NAMES: Final = ("経過時間[sec]", "設定電流:ISET[A]", "出力電流:IOUT[A]", "磁界:H[Gauss]", "出力電圧:VOUT[V]",
+                           "設定値[G or I]", "ISET時刻[ns]", "IOUT時刻[ns]", "磁界時刻[ns]", "VOUT時刻[ns]",
+                           "ロック時間[sec]")  # ログの列名の行
+LEGACY_LOG_COLUMNS: Final = (6, 10)  # 応答時刻の列・ロック時間の列がない以前のログの列数
+STAMPED_COLUMNS: Final = ("iset", "iout", "field", "vout")  # 応答時刻を持つ値
+
+
+def stamp_ns() -> int:
+    """
+    装置の応答時刻 単調増加のns 壁時計の調整の影響を受けない
+    """
+    return time.monotonic_ns()
+
+
+@functools.lru_cache(maxsize=16)
+def origin_ns(start_time: datetime.datetime) -> int:
+    """
+    測定基準時刻をstamp_ns()の時計に換算する
+
+    測定基準時刻ごとに一度だけ換算するので,同じ測定の記録どうしの時間差は単調な時計だけで決まる
+    :param start_time: 測定基準時刻 再開時はチェックポイントから読んだもの
+    """
+    now_ns = stamp_ns()
+    return now_ns - round((datetime.datetime.now() - start_time).total_seconds() * 1e9)
+
+
+class StatusList:
+    iset: float = 0.0
+    iout: float = 0.0
+    field: float = 0.0
+    vout: float = 0.0
+    target: float = 0.0
+    diff_second: float = 0.0  # 最後に応答した装置の基準時刻からの経過時間
+    origin_ns: int = 0  # 基準時刻 stamp_ns()の時計
+    # 装置ごとの応答時刻 stamp_ns()の時計 読み取らなかった値はNone
+    iset_ns: Union[int, None] = None
+    iout_ns: Union[int, None] = None
+    field_ns: Union[int, None] = None
+    vout_ns: Union[int, None] = None
+    dwell: Union[float, None] = None  # 記録までにロックした時間[sec] ロックせずに記録した場合はNone
+
+    def __str__(self):
+        fm = "{:7.1f} sec, ISET= {:>+7.3f} A, IOUT= {:>+7.3f} A, Field= {:>+7.1f} G, VOUT= {:>+7.3f} V, Target= {:>+5}"
+        return fm.format(self.diff_second, self.iset, self.iout, self.field, self.vout, self.target)
+
+    def stamp(self, name: str) -> None:
+        """
+        値を読み取った直後に呼び,応答時刻を記録する
+
+        :param name: STAMPED_COLUMNSの値の名前
+        """
+        setattr(self, name + "_ns", stamp_ns())
+
+    def set_origin_time(self, start_time: datetime.datetime) -> None:
+        """
+        経過時間表示のための基準時刻を設定する
+
+        :param start_time: 基準時刻
+        """
+        self.origin_ns = origin_ns(start_time)
+        stamps = [t for t in self.stamps() if t is not None]
+        last_ns = max(stamps) if stamps else stamp_ns()
+        self.diff_second = (last_ns - self.origin_ns) / 1e9
+
+    def stamps(self) -> tuple:
+        """
+        STAMPED_COLUMNSの順の応答時刻
+        """
+        return self.iset_ns, self.iout_ns, self.field_ns, self.vout_ns
+
+    def elapsed_ns(self) -> tuple:
+        """
+        STAMPED_COLUMNSの順の基準時刻からの応答時刻[ns] 読み取らなかった値はNone
+        """
+        return tuple(None if t is None else t - self.origin_ns for t in self.stamps())
+
+    def out_tuple(self) -> tuple:
+        return (self.diff_second, self.iset, self.iout, self.field, self.vout, self.target) + self.elapsed_ns() + (
+            self.dwell,)
+
+
+def save_status(filename: str, status: StatusList) -> None:
+    """
+    ファイルにステータスを追記する
+
+    --------
+    :type status: StatusList
+    :param filename: 書き込むファイル名
+    :param status: 書き込むデータ
+    :return: None
+    """
+    result = status.out_tuple()
+
+    with open(filename, mode='a', encoding="utf-8")as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(result)
+    return
+
+
+def read_header(reader: Iterator[List[str]]) -> Dict[str, str]:
+    """
+    csv.readerからログのヘッダを読み,列名の行まで進める
+
+    :return: {項目名: 値} "開始時刻", "memo", gen_csv_header()のmetaの項目
+    :raise ValueError: 区切りの行がない
+    """
+    header = {}
+    for row in reader:
+        if not row:
+            continue
+        if row[0] == LOG_HEADER_END:
+            next(reader, None)  # 列名
+            return header
+        if len(row) > 1:
+            header[row[0]] = row[1]
+    raise ValueError("ログのヘッダが終わらない")
@@ -0,0 +1,151 @@
+"""
+測定の進行をTCPで配信するテレメトリ
+
+1行1イベントのJSONを接続中の全クライアントに送る.
+{"t": UNIX時刻, "station": ステーション名, "kind": 種類, ...}
+kind : "status" 記録した状態, "oectl" 磁界制御の反復, "point" 測定点の完了と残り時間,
+       "metrics" 終わったサブシークエンスの要約とループの指標, "phase_begin" / "phase_end" IOStatsのフェーズ
+
+クライアントごとに上限付きのキューを持ち,溢れたイベントは捨てるので制御ループは送信を待たない.
+
+    python -m jiwai.telemetry [--port 8766] [--phases]
+"""
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from logging import getLogger
+from typing import Any, List, Final
+
+TELEMETRY_HOST: Final = "127.0.0.1"
+TELEMETRY_PORT: Final = 8766
+CLIENT_QUEUE_SIZE: Final = 1000  # クライアントごとに溜めるイベント数 超えた分は捨てる
+
+logger = getLogger(__name__)
+
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    server: "_TelemetryServer"
+
+    def handle(self) -> None:
+        events: "queue.Queue[dict]" = queue.Queue(CLIENT_QUEUE_SIZE)
+        telemetry = self.server.telemetry
+        telemetry.add_client(events)
+        try:
+            while not telemetry.stopped.is_set():
+                try:
+                    event = events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+        finally:
+            telemetry.remove_client(events)
+
+
+class _TelemetryServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    telemetry: "Telemetry"
+
+
+class Telemetry:
+    """
+    テレメトリの配信サーバー
+
+    publish()はキューに入れるだけで戻る. 遅いクライアントの分は捨てて数をdroppedに残す.
+    """
+
+    def __init__(self, host: str = TELEMETRY_HOST, port: int = TELEMETRY_PORT) -> None:
+        self.host = host
+        self.port = port
+        self.dropped = 0
+        self.stopped = threading.Event()
+        self.__clients: List["queue.Queue[dict]"] = []
+        self.__lock = threading.Lock()
+        self.__server: _TelemetryServer = None
+        self.__thread: threading.Thread = None
+
+    def start(self) -> None:
+        self.__server = _TelemetryServer((self.host, self.port), _ClientHandler)
+        self.__server.telemetry = self
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="Telemetry", daemon=True)
+        self.__thread.start()
+        logger.info("テレメトリ配信開始 : {0}:{1}".format(self.host, self.port))
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+    def add_client(self, events: "queue.Queue[dict]") -> None:
+        with self.__lock:
+            self.__clients = self.__clients + [events]
+
+    def remove_client(self, events: "queue.Queue[dict]") -> None:
+        with self.__lock:
+            self.__clients = [c for c in self.__clients if c is not events]
+
+    def publish(self, event: dict) -> None:
+        for events in self.__clients:  # 差し替え式のリストなのでロック不要
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def channel(self, station: str = "default") -> "TelemetryChannel":
+        return TelemetryChannel(self, station)
+
+
+class TelemetryChannel:
+    """
+    1つのSessionからのイベントにステーション名を付けてTelemetryに渡す
+
+    IOStatsのリスナーとして登録するとフェーズの開始・終了も配信する
+    """
+
+    def __init__(self, telemetry: Telemetry, station: str) -> None:
+        self.telemetry = telemetry
+        self.station = station
+
+    def publish(self, kind: str, **fields: Any) -> None:
+        event = {"t": time.time(), "station": self.station, "kind": kind}
+        event.update(fields)
+        self.telemetry.publish(event)
+
+    def phase_begin(self, path: str, t_ns: int) -> None:
+        self.publish("phase_begin", phase=path)
+
+    def phase_end(self, path: str, t_ns: int) -> None:
+        self.publish("phase_end", phase=path)
+
+
+def watch(host: str = TELEMETRY_HOST, port: int = TELEMETRY_PORT, phases: bool = False) -> None:
+    """
+    テレメトリを受信して表示し続ける
+
+    :param phases: フェーズの開始・終了も表示するか
+    """
+    with socket.create_connection((host, port)) as sock:
+        for line in sock.makefile("r", encoding="utf-8"):
+            event = json.loads(line)
+            if not phases and event["kind"].startswith("phase"):
+                continue
+            print(event)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="テレメトリの表示")
+    parser.add_argument("--host", default=TELEMETRY_HOST)
+    parser.add_argument("--port", type=int, default=TELEMETRY_PORT)
+    parser.add_argument("--phases", action="store_true", help="フェーズの開始・終了も表示する")
+    args = parser.parse_args()
+    try:
+        watch(args.host, args.port, args.phases)
+    except KeyboardInterrupt:
+        pass
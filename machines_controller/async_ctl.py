@@ -0,0 +1,113 @@
+"""
+BipolarPower, GaussMeterのasyncio版
+
+VISAの通信は既定のスレッドプールで行い,ランプやレンジ切替の待ち時間はasyncio.sleepで待つ.
+待っている間は同じイベントループ上の他の処理(別の装置の読み取り,ログの書き込み,状態の応答)が進む.
+
+    power = AsyncBipolarPower(BipolarPower())
+    gauss = AsyncGaussMeter(GaussMeter())
+    await asyncio.gather(power.set_iset(Current(2000, "mA")), gauss.sample(0.5, 20))
+"""
+import asyncio
+import typing
+
+from machines_controller.bipolar_power_ctl import BipolarPower, Current
+from machines_controller.gauss_ctl import GaussMeter, GaussMeterOverRangeError, suitable_range
+
+
+class AsyncBipolarPower:
+    """
+    :param power: 接続済みのBipolarPower 同期版と同じ装置・設定・インターロックを共有する
+    """
+
+    def __init__(self, power: BipolarPower) -> None:
+        self.power = power
+        self.__ramp_lock = asyncio.Lock()
+
+    async def iout_fetch(self) -> Current:
+        return await asyncio.to_thread(self.power.iout_fetch)
+
+    async def iset_fetch(self) -> Current:
+        return await asyncio.to_thread(self.power.iset_fetch)
+
+    async def vout_fetch(self) -> float:
+        return await asyncio.to_thread(self.power.vout_fetch)
+
+    async def set_iset(self, current: Current) -> None:
+        """
+        同期版のset_isetと同じ刻みでランプする ステップ間の待ち時間は他の処理に譲る
+
+        :raise ValueError: 電源の出力制限を超える
+        :raise PowerInterlockError: 監視スレッドが異常を検知している
+        """
+        power = self.power
+        power.check_overload(current)
+        power.check_interlock(current)
+        async with self.__ramp_lock:
+            for step in power.ramp_steps(await self.iout_fetch(), current).currents():
+                power.check_interlock(current)
+                await asyncio.to_thread(self.__write_step, step)
+                await asyncio.sleep(power.step_delay())
+
+    def __write_step(self, current: Current) -> None:
+        with self.power.stats.phase("ramp"):
+            self.power.write_iset(current)
+
+    async def allow_output(self, operation: bool) -> None:
+        await asyncio.to_thread(self.power.allow_output, operation)
+
+
+class AsyncGaussMeter:
+    """
+    :param gauss: 接続済みのGaussMeter
+    """
+
+    def __init__(self, gauss: GaussMeter) -> None:
+        self.gauss = gauss
+        self.last_range_hops = 0
+
+    async def range_fetch(self) -> int:
+        return await asyncio.to_thread(self.gauss.range_fetch)
+
+    async def range_set(self, range_index: int) -> None:
+        await asyncio.to_thread(self.__write_range, range_index)
+        await asyncio.sleep(self.gauss.RANGE_SETTLE_SEC)
+
+    def __write_range(self, range_index: int) -> None:
+        with self.gauss.stats.phase("range"):
+            self.gauss.write_range(range_index)
+
+    async def magnetic_field_fetch(self, expected_field: typing.SupportsFloat = None) -> float:
+        """
+        同期版と同じ手順でオーバーレンジ時にレンジを切り替える 切替後の待ち時間は他の処理に譲る
+
+        :raise GaussMeterOverRangeError: 最大レンジでオーバーレンジした場合か切替回数の上限に達した場合
+        """
+        self.last_range_hops = 0
+        while True:
+            field = await asyncio.to_thread(self.gauss.field_probe)
+            if field is not None:
+                return field
+            if self.last_range_hops >= self.gauss.MAX_RANGE_HOPS:
+                raise GaussMeterOverRangeError()
+            next_range = await self.range_fetch() - 1
+            if expected_field is not None:
+                next_range = min(next_range, suitable_range(expected_field))
+            await self.range_set(max(next_range, 0))
+            self.last_range_hops += 1
+
+    async def sample(self, interval: float, count: int) -> typing.List[typing.Union[float, None]]:
+        """
+        一定間隔で磁界を読み取る オーバーレンジ時はNone
+
+        :param interval: 読み取り間隔[sec]
+        :param count: 読み取り回数
+        """
+        result = []
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        for _ in range(count):
+            result.append(await asyncio.to_thread(self.gauss.field_probe))
+            next_time += interval
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+        return result
@@ -1,82 +1,52 @@
+import threading
 import time
-import typing
 
-import pyvisa as visa
+from machines_controller.current import Current, CurrentArray
+from machines_controller.io_stats import STATS, IOStats
+from machines_controller.visa_trace import TraceRecorder
 
 
-class Current(object):
-    def __init__(self, current: typing.SupportsFloat = 0, unit: str = "mA"):
-
-        if unit in ["mA", "ma", "MA", "Ma"]:
-            self.__current = round(float(current))
-        elif unit in ["A", "a"]:
-            self.__current = round(float(current) * 1000)
-        else:
-            raise ValueError
-
-    def mA(self) -> int:
-        return self.__current
-
-    def A(self) -> float:
-        return float(self.__current) / 1000.0
-
-    def __add__(self, other):
-        return Current(current=self.mA() + int(other), unit="mA")
-
-    def __sub__(self, other):
-        return Current(current=self.mA() - int(other), unit="mA")
-
-    def __mul__(self, other):
-        return Current(current=round(self.mA() * float(other)), unit="mA")
-
-    def __int__(self):
-        return self.mA()
-
-    def set_mA(self, current: int):
-        self.__current = current
-
-    def set_A(self, current: float):
-        self.__current = float(current) * 1000
-
-    def __str__(self) -> str:
-        if abs(self.__current) >= 1000:
-            return str(self.A()) + " A"
-        else:
-            return str(self.mA()) + " mA"
-
-    def __lt__(self, other):
-        return self.mA() < int(other)
-
-    def __gt__(self, other):
-        return self.mA() > int(other)
-
-    def __le__(self, other):
-        return self.mA() <= int(other)
-
-    def __ge__(self, other):
-        return self.mA() >= int(other)
-
-    def __eq__(self, other):
-        return self.mA() == int(other)
-
-    def __abs__(self):
-        return abs(self.mA())
+class PowerInterlockError(Exception):
+    pass
 
 
 class BipolarPower:
-    def __init__(self):
-        self.__gs = visa.ResourceManager().open_resource("GPIB0::4::INSTR")  # linux "ASRL/dev/ttyUSB0::INSTR"
+    def __init__(self, address: str = "GPIB0::4::INSTR", resource=None, trace_path: str = None):
+        """
+        :param address: VISAアドレス linux "ASRL/dev/ttyUSB0::INSTR"
+        :param resource: 接続済みのリソース 指定した場合はaddressを開かない(トレース再生用)
+        :param trace_path: 指定した場合は通信をトレースファイルに記録する
+        """
+        if resource is None:
+            import pyvisa as visa  # 実機に接続するときだけ読み込む
+            resource = visa.ResourceManager().open_resource(address)
+        if trace_path:
+            resource = TraceRecorder(resource, trace_path, "BipolarPower")
+        self.__gs = resource
+        self.stats: IOStats = STATS  # 通信回数・応答時間の集計先
+        self.journal = None  # record(kind, **fields)を持つイベントの記録先
         self.CURRENT_CHANGE_LIMIT = Current(500, "mA")
         self.CURRENT_CHANGE_DELAY = 0.5
+        self.MONITORED_DELAY_RATIO = 0.3  # 監視スレッド稼働中はステップ待ち時間をこの割合に縮める
         self.MAGNET_RESISTANCE = 10  # ohm
+        self.monitored = False  # 監視スレッドが稼働中か
+        self.interlock = threading.Event()  # 監視スレッドが異常を検知するとセットされる
+        self.__io_lock = threading.RLock()
+        self.__ramp_lock = threading.RLock()
 
     def __query(self, command: str) -> str:
-        res = self.__gs.query(command)
+        with self.__io_lock:
+            start = time.monotonic_ns()
+            res = self.__gs.query(command)
+            self.stats.record("BipolarPower", command, time.monotonic_ns() - start)
         _, res = res.split()
         return res
 
     def __write(self, command: str) -> None:
-        self.__gs.write(command)
+        with self.__io_lock:
+            start = time.monotonic_ns()
+            self.__gs.write(command)
+            self.stats.record("BipolarPower", command, time.monotonic_ns() - start)
 
     def check_allow_output(self) -> bool:
         if int(self.__query("OUT?")) == 1:
@@ -102,27 +72,67 @@ class BipolarPower:
         current = float(self.__query("ISET?").rstrip("A"))
         return Current(current=current, unit="A")
 
-    def __set_iset(self, current: Current):
+    def write_iset(self, current: Current) -> None:
+        """
+        ランプせずに設定電流を書き込む 通常はset_isetを使う
+        """
         self.__write("ISET " + str(current))
+        if self.journal is not None:
+            self.journal.record("setpoint", mA=current.mA())
 
     def set_iset(self, current: Current):
+        self.check_overload(current)
+        self.check_interlock(current)
+        with self.__ramp_lock, self.stats.phase("ramp"):
+            self.__ramp(current, self.step_delay(), check_interlock=True)
+
+    def check_overload(self, current: Current) -> None:
+        """
+        :raise ValueError: 電源の出力制限を超える
+        """
         if abs(current) >= Current(10, "A") or current.A() * self.MAGNET_RESISTANCE >= 40:
             print("[Error]\t電源過負荷")
             print(self.MAGNET_RESISTANCE, current.A(), current.A() * self.MAGNET_RESISTANCE)
             raise ValueError
 
-        now_iout = self.iout_fetch()
-        if now_iout == current:
-            return
-        if current.mA() - now_iout.mA() > 0:
-            current_list = range(now_iout.mA(), current.mA(), self.CURRENT_CHANGE_LIMIT.mA())
-        else:
-            current_list = range(now_iout.mA(), current.mA(), -self.CURRENT_CHANGE_LIMIT.mA())
-        for i in current_list:
-            self.__set_iset(Current(i, "mA"))
-            time.sleep(self.CURRENT_CHANGE_DELAY)
-        self.__set_iset(current)
-        time.sleep(self.CURRENT_CHANGE_DELAY)
+    def check_interlock(self, current: Current) -> None:
+        """
+        監視スレッドが異常を検知した後は0 mAへの設定以外を拒否する
+        """
+        if self.interlock.is_set() and current != 0:
+            raise PowerInterlockError
+
+    def step_delay(self) -> float:
+        """
+        ランプの1ステップごとの待ち時間
+        """
+        if self.monitored:  # 磁石ごとのCURRENT_CHANGE_DELAYに対する割合で縮める
+            return self.CURRENT_CHANGE_DELAY * self.MONITORED_DELAY_RATIO
+        return self.CURRENT_CHANGE_DELAY
+
+    def ramp_steps(self, now: Current, current: Current) -> CurrentArray:
+        """
+        nowからcurrentまでCURRENT_CHANGE_LIMIT刻みで設定する電流の列 最後は必ずcurrent
+        """
+        return CurrentArray.ramp(now.mA(), current.mA(), self.CURRENT_CHANGE_LIMIT.mA())
+
+    def __ramp(self, current: Current, delay: float, check_interlock: bool) -> None:
+        for step in self.ramp_steps(self.iout_fetch(), current).currents():
+            if check_interlock:
+                self.check_interlock(current)
+            self.write_iset(step)
+            time.sleep(delay)
+
+    def emergency_ramp_down(self) -> None:
+        """
+        インターロックをセットして進行中のランプを止め,通常の待ち時間で0 mAまで下げる
+        """
+        self.interlock.set()
+        with self.__ramp_lock:
+            self.__ramp(Current(0, "mA"), self.CURRENT_CHANGE_DELAY, check_interlock=False)
+
+    def reset_interlock(self) -> None:
+        self.interlock.clear()
 
     def allow_output(self, operation: bool) -> None:
         now_output = self.check_allow_output()
@@ -131,7 +141,7 @@ class BipolarPower:
         iset = self.iset_fetch()
         if iset != 0:
             if not now_output:
-                self.__set_iset(Current(0, "mA"))
+                self.write_iset(Current(0, "mA"))
             else:
                 self.set_iset(Current(0, "mA"))
         time.sleep(0.1)
@@ -0,0 +1,161 @@
+from array import array
+import typing
+
+MA_UNITS: typing.Final = frozenset(("mA", "ma", "MA", "Ma"))
+A_UNITS: typing.Final = frozenset(("A", "a"))
+
+
+class Current(object):
+    """
+    mA単位の整数で持つ電流値 生成後は変更できない
+
+    演算・比較の結果は新しいCurrentかintで返す. 整数のmAから作るときは単位の解釈を省略する.
+    """
+    __slots__ = ("__current",)
+
+    def __init__(self, current: typing.SupportsFloat = 0, unit: str = "mA"):
+        if type(current) is int and unit == "mA":
+            value = current
+        elif unit in MA_UNITS:
+            value = round(float(current))
+        elif unit in A_UNITS:
+            value = round(float(current) * 1000)
+        else:
+            raise ValueError
+        _set_current(self, value)
+
+    @classmethod
+    def from_mA(cls, current: int) -> "Current":
+        """
+        整数のmAからそのまま作る 値の確認と変換を行わない
+        """
+        obj = object.__new__(cls)
+        _set_current(obj, current)
+        return obj
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Current is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Current is immutable")
+
+    def __reduce__(self):
+        return Current.from_mA, (self.__current,)
+
+    def mA(self) -> int:
+        return self.__current
+
+    def A(self) -> float:
+        return float(self.__current) / 1000.0
+
+    def __add__(self, other):
+        return Current.from_mA(self.__current + int(other))
+
+    def __sub__(self, other):
+        return Current.from_mA(self.__current - int(other))
+
+    def __mul__(self, other):
+        return Current.from_mA(round(self.__current * float(other)))
+
+    def __int__(self):
+        return self.__current
+
+    def __str__(self) -> str:
+        if abs(self.__current) >= 1000:
+            return str(self.A()) + " A"
+        else:
+            return str(self.__current) + " mA"
+
+    def __repr__(self) -> str:
+        return "Current({0}, 'mA')".format(self.__current)
+
+    def __lt__(self, other):
+        return self.__current < int(other)
+
+    def __gt__(self, other):
+        return self.__current > int(other)
+
+    def __le__(self, other):
+        return self.__current <= int(other)
+
+    def __ge__(self, other):
+        return self.__current >= int(other)
+
+    def __eq__(self, other):
+        return self.__current == int(other)
+
+    def __hash__(self):
+        return hash(self.__current)
+
+    def __abs__(self):
+        return abs(self.__current)
+
+
+# __setattr__を通らずにスロットへ書き込む 生成時だけ使う
+_set_current = Current._Current__current.__set__
+
+
+class CurrentArray(object):
+    """
+    mA単位の電流の列 array('q')に詰めて持ち,要素ごとにCurrentを作らない
+
+    添字・反復はmA単位のintを返す Currentが必要なときはcurrent(i)
+    """
+    __slots__ = ("__data",)
+
+    def __init__(self, currents: typing.Iterable[typing.SupportsInt] = ()):
+        if isinstance(currents, (range, array)):
+            self.__data = array("q", currents)
+        else:
+            self.__data = array("q", map(int, currents))
+
+    @classmethod
+    def ramp(cls, now: int, target: int, step: int) -> "CurrentArray":
+        """
+        nowからtargetまでstep刻みの列 nowを含み,最後は必ずtarget nowとtargetが等しければ空
+
+        :param step: 刻み[mA] 正の値
+        """
+        if now == target:
+            return cls()
+        result = cls(range(now, target, step if target > now else -step))
+        result.append(target)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CurrentArray(self.__data[index])
+        return self.__data[index]
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(self.__data)
+
+    def __eq__(self, other):
+        if isinstance(other, CurrentArray):
+            return self.__data == other.__data
+        return list(self.__data) == list(other)
+
+    def __repr__(self) -> str:
+        return "CurrentArray({0})".format(self.__data.tolist())
+
+    def current(self, index: int) -> Current:
+        return Current.from_mA(self.__data[index])
+
+    def currents(self) -> typing.Iterator[Current]:
+        for value in self.__data:
+            yield Current.from_mA(value)
+
+    def append(self, current: typing.SupportsInt) -> None:
+        self.__data.append(int(current))
+
+    def mA(self) -> array:
+        """
+        中身のarray('q') 書き換えないこと
+        """
+        return self.__data
+
+    def tolist(self) -> typing.List[int]:
+        return self.__data.tolist()
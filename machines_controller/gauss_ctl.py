@@ -1,44 +1,129 @@
+import threading
 import time
+import typing
 
-import pyvisa as visa
+from machines_controller.io_stats import STATS, IOStats
+from machines_controller.visa_trace import TraceRecorder
+
+
+# レンジごとの表示分解能[Gauss] 4桁表示
+RANGE_RESOLUTION: typing.Final = (10.0, 1.0, 0.1, 0.01)
 
 
 class GaussMeterOverRangeError(Exception):
     pass
 
 
+def suitable_range(field: typing.SupportsFloat) -> int:
+    """磁界の値を測定できる最も細かいレンジを返す
+
+    :param field: 磁界の値(Gauss)
+    :return: レンジのindex
+    """
+    field = abs(float(field))
+    if field >= 2700:
+        return 0
+    elif field >= 270:
+        return 1
+    elif field >= 27:
+        return 2
+    else:
+        return 3
+
+
 class GaussMeter:
-    def __init__(self) -> None:
-        self.__gs = visa.ResourceManager().open_resource("ASRL3::INSTR")  # linux "ASRL/dev/ttyUSB0::INSTR"
+    def __init__(self, address: str = "ASRL3::INSTR", resource=None, trace_path: str = None) -> None:
+        """
+        :param address: VISAアドレス linux "ASRL/dev/ttyUSB0::INSTR"
+        :param resource: 接続済みのリソース 指定した場合はaddressを開かない(トレース再生用)
+        :param trace_path: 指定した場合は通信をトレースファイルに記録する
+        """
+        if resource is None:
+            import pyvisa as visa  # 実機に接続するときだけ読み込む
+            resource = visa.ResourceManager().open_resource(address)
+        if trace_path:
+            resource = TraceRecorder(resource, trace_path, "GaussMeter")
+        self.__gs = resource
+        self.stats: IOStats = STATS  # 通信回数・応答時間の集計先
+        self.journal = None  # record(kind, **fields)を持つイベントの記録先
+        self.__io_lock = threading.RLock()
+        self.MAX_RANGE_HOPS = 3  # 1回の読み取りで許すレンジ切替回数
+        self.RANGE_SETTLE_SEC = 0.2  # レンジ切替後に表示が安定するまでの時間
+        self.last_range_hops = 0  # 直前の読み取りでオーバーレンジにより切り替えた回数
 
     def __query(self, command: str) -> str:
-        res = self.__gs.query(command)
+        with self.__io_lock:
+            start = time.monotonic_ns()
+            res = self.__gs.query(command)
+            self.stats.record("GaussMeter", command, time.monotonic_ns() - start)
         return res.strip("\r\n")
 
     def __write(self, command: str) -> None:
-        self.__gs.write(command)
+        with self.__io_lock:
+            start = time.monotonic_ns()
+            self.__gs.write(command)
+            self.stats.record("GaussMeter", command, time.monotonic_ns() - start)
 
-    def magnetic_field_fetch(self) -> float:
+    def magnetic_field_fetch(self, expected_field: typing.SupportsFloat = None) -> float:
         """磁界の値を測定機器に問い合わせ,Gauss単位で返す
 
+        オーバーレンジ時は予想磁界から求めたレンジへ直接切り替える.
+        予想磁界がないか予想が外れた場合は1段ずつ広いレンジへ切り替える.
+        切り替えた回数はlast_range_hopsに残す.
+
+        :param expected_field: 指令値から予想される磁界(Gauss)
         :return: 磁界の値(Gauss)
         :rtype float
+        :raise GaussMeterOverRangeError: 最大レンジでオーバーレンジした場合か切替回数の上限に達した場合
         """
-        try:
-            res = float(self.__query("FIELD?"))
-        except ValueError:  # オーバーレンジ発生時の挙動
-            plobe_range = self.range_fetch()
-            if range == 0:  # 30kOe以上の挙動
+        self.last_range_hops = 0
+        while True:
+            with self.__io_lock:  # 表示値と乗数の組を監視スレッドに割り込ませない
+                try:
+                    res = float(self.__query("FIELD?"))
+                except ValueError:  # オーバーレンジ発生時の挙動
+                    plobe_range = self.range_fetch()
+                else:
+                    multiplier = self.__query("FIELDM?")
+                    break
+            # レンジの切替と安定待ちはロックの外で行い,その間も監視スレッドが読めるようにする
+            if plobe_range == 0:  # 30kOe以上の挙動
                 raise GaussMeterOverRangeError()
-            self.range_set(plobe_range - 1)
-            return self.magnetic_field_fetch()
-        multiplier = self.__query("FIELDM?")
+            if self.last_range_hops >= self.MAX_RANGE_HOPS:
+                raise GaussMeterOverRangeError()
+            next_range = plobe_range - 1
+            if expected_field is not None:
+                next_range = min(next_range, suitable_range(expected_field))
+            self.range_set(next_range)
+            self.last_range_hops += 1
         if multiplier == "m":
             res = float(res) * 10 ** (-3)
         elif multiplier == "k":
             res = float(res) * 1000
         else:
             pass
+        if self.journal is not None:
+            self.journal.record("field_read", field=res, hops=self.last_range_hops)
+        return res
+
+    def field_probe(self) -> typing.Union[float, None]:
+        """レンジを変更せずに磁界の値を取得する 監視スレッド用
+
+        :return: 磁界の値(Gauss) オーバーレンジ時はNone
+        :raise GaussMeterOverRangeError: 最大レンジでオーバーレンジした場合
+        """
+        with self.__io_lock:  # 表示値と乗数の組を他スレッドに割り込ませない
+            try:
+                res = float(self.__query("FIELD?"))
+            except ValueError:
+                if self.range_fetch() == 0:
+                    raise GaussMeterOverRangeError()
+                return None
+            multiplier = self.__query("FIELDM?")
+        if multiplier == "m":
+            res = res * 10 ** (-3)
+        elif multiplier == "k":
+            res = res * 1000
         return res
 
     def readable_magnetic_field_fetch(self) -> str:
@@ -47,7 +132,8 @@ class GaussMeter:
         :return: 磁界の値
         :rtype str
         """
-        field_str = self.__query("FIELD?") + self.__query("FIELDM?") + self.__query("UNIT?")
+        with self.__io_lock:
+            field_str = self.__query("FIELD?") + self.__query("FIELDM?") + self.__query("UNIT?")
         return field_str
 
     def range_set(self, range_index: int) -> None:
@@ -60,11 +146,20 @@ class GaussMeter:
         :param range_index:
         :return:
         """
+        with self.stats.phase("range"):
+            self.write_range(range_index)
+            time.sleep(self.RANGE_SETTLE_SEC)
+        return
+
+    def write_range(self, range_index: int) -> None:
+        """
+        安定を待たずにレンジを書き込む 通常はrange_setを使う
+        """
         if range_index < 0 or range_index > 3:
             range_index = 0
         self.__write("RANGE " + str(range_index))
-        time.sleep(0.2)
-        return
+        if self.journal is not None:
+            self.journal.record("range_change", range=range_index)
 
     def range_fetch(self) -> int:
         return int(self.__query("RANGE?"))
@@ -0,0 +1,183 @@
+import contextlib
+import json
+import threading
+import time
+import typing
+
+# 応答時間ヒストグラムの区切り[ms] 最後の区間は上限なし
+LATENCY_BUCKETS_MS: typing.Final = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def command_key(command: str) -> str:
+    """
+    引数を除いたSCPIコマンド名 "ISET 1.5 A" -> "ISET"
+    """
+    return command.split(" ", 1)[0]
+
+
+class CommandStat:
+    """
+    コマンド1種類・フェーズ1種類あたりの呼び出し回数と応答時間
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, latency_ns: int) -> None:
+        self.count += 1
+        self.total_ns += latency_ns
+        self.max_ns = max(self.max_ns, latency_ns)
+        latency_ms = latency_ns / 1e6
+        for i, edge in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms < edge:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def merge(self, other: "CommandStat") -> None:
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def mean_ms(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return self.total_ns / self.count / 1e6
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {"count": self.count, "total_ms": self.total_ns / 1e6, "mean_ms": self.mean_ms(),
+                "max_ms": self.max_ns / 1e6, "histogram": self.histogram}
+
+
+class IOStats:
+    """
+    装置との通信回数と応答時間をコマンドと呼び出し元のフェーズごとに集計する
+
+    フェーズはphase()でスレッドごとに入れ子にでき,"oectl/ramp"のようなパスで集計される
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__stats: typing.Dict[typing.Tuple[str, str, str], CommandStat] = {}
+        self.__events: typing.Dict[str, int] = {}
+        self.__listeners: typing.List[typing.Any] = []
+
+    def add_listener(self, listener) -> None:
+        """
+        フェーズの開始・終了をphase_begin(path, t_ns)/phase_end(path, t_ns)で受け取るオブジェクトを登録する
+        """
+        with self.__lock:
+            self.__listeners = self.__listeners + [listener]
+
+    def remove_listener(self, listener) -> None:
+        with self.__lock:
+            self.__listeners = [x for x in self.__listeners if x is not listener]
+
+    def __stack(self) -> typing.List[str]:
+        if not hasattr(self.__local, "stack"):
+            self.__local.stack = []
+        return self.__local.stack
+
+    def current_phase(self) -> str:
+        stack = self.__stack()
+        if stack:
+            return "/".join(stack)
+        thread = threading.current_thread()
+        if thread is threading.main_thread():
+            return "other"
+        return thread.name  # 監視スレッドなどはスレッド名で分ける
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        stack = self.__stack()
+        stack.append(name)
+        listeners = self.__listeners
+        if listeners:
+            path = "/".join(stack)
+            t_ns = time.monotonic_ns()
+            for listener in listeners:
+                listener.phase_begin(path, t_ns)
+        try:
+            yield
+        finally:
+            if listeners:
+                t_ns = time.monotonic_ns()
+                for listener in listeners:
+                    listener.phase_end(path, t_ns)
+            stack.pop()
+
+    def record(self, instrument: str, command: str, latency_ns: int) -> None:
+        key = (instrument, command_key(command), self.current_phase())
+        with self.__lock:
+            if key not in self.__stats:
+                self.__stats[key] = CommandStat()
+            self.__stats[key].add(latency_ns)
+
+    def count_event(self, name: str, n: int = 1) -> None:
+        """
+        測定点数やoectlの反復回数など,通信回数の分母になる事象を数える
+        """
+        with self.__lock:
+            self.__events[name] = self.__events.get(name, 0) + n
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__stats = {}
+            self.__events = {}
+
+    def by_command(self) -> typing.Dict[typing.Tuple[str, str], CommandStat]:
+        result: typing.Dict[typing.Tuple[str, str], CommandStat] = {}
+        with self.__lock:
+            for (instrument, command, _), stat in self.__stats.items():
+                result.setdefault((instrument, command), CommandStat()).merge(stat)
+        return result
+
+    def by_phase(self) -> typing.Dict[str, CommandStat]:
+        result: typing.Dict[str, CommandStat] = {}
+        with self.__lock:
+            for (_, _, phase), stat in self.__stats.items():
+                result.setdefault(phase, CommandStat()).merge(stat)
+        return result
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        with self.__lock:
+            detail = [{"instrument": instrument, "command": command, "phase": phase, **stat.to_dict()}
+                      for (instrument, command, phase), stat in self.__stats.items()]
+            events = dict(self.__events)
+        return {"latency_buckets_ms": list(LATENCY_BUCKETS_MS), "events": events, "detail": detail}
+
+    def export_json(self, filepath: str) -> None:
+        with open(filepath, mode='w', encoding="utf-8")as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        return
+
+    def summary(self) -> str:
+        lines = ["{:<14}{:<9}{:>7}{:>11}{:>9}{:>9}".format("instrument", "command", "calls", "total[ms]",
+                                                           "mean", "max")]
+        commands = sorted(self.by_command().items(), key=lambda x: x[1].total_ns, reverse=True)
+        for (instrument, command), stat in commands:
+            lines.append("{:<14}{:<9}{:>7}{:>11.0f}{:>9.1f}{:>9.1f}".format(
+                instrument, command, stat.count, stat.total_ns / 1e6, stat.mean_ms(), stat.max_ns / 1e6))
+        lines.append("")
+        lines.append("{:<30}{:>7}{:>11}".format("phase", "calls", "total[ms]"))
+        for phase, stat in sorted(self.by_phase().items(), key=lambda x: x[1].total_ns, reverse=True):
+            lines.append("{:<30}{:>7}{:>11.0f}".format(phase, stat.count, stat.total_ns / 1e6))
+        with self.__lock:
+            events = dict(self.__events)
+        if events.get("point"):
+            total_calls = sum(stat.count for phase, stat in self.by_phase().items() if phase != "watchdog")
+            lines.append("")
+            lines.append("points = {0}, round trips per point = {1:.1f}".format(
+                events["point"], total_calls / events["point"]))
+        for name, n in sorted(events.items()):
+            if name != "point":
+                lines.append("{0} = {1}".format(name, n))
+        return "\n".join(lines)
+
+
+STATS = IOStats()  # 装置ドライバが既定で使う集計先
@@ -0,0 +1,208 @@
+import datetime
+import math
+import random
+import time
+import types
+import typing
+
+# レンジごとの最大値[Gauss]と表示の桁
+GAUSS_RANGE_MAX: typing.Final = (30000.0, 3000.0, 300.0, 30.0)
+GAUSS_RANGE_RESOLUTION: typing.Final = (10.0, 1.0, 0.1, 0.01)
+
+
+class VirtualClock:
+    """
+    sleepで時間を進める仮想時計 シミュレーション中の待ち時間を実時間で待たずに済ませる
+    """
+
+    def __init__(self, start: float = None) -> None:
+        if start is None:
+            start = time.time()
+        self.__now = start
+
+    def time(self) -> float:
+        return self.__now
+
+    def time_ns(self) -> int:
+        return round(self.__now * 1e9)
+
+    def monotonic_ns(self) -> int:
+        return self.time_ns()
+
+    def perf_counter(self) -> float:
+        return self.__now
+
+    def strftime(self, format: str, t: tuple = None) -> str:
+        return time.strftime(format, time.localtime(self.__now) if t is None else t)
+
+    def sleep(self, sec: float) -> None:
+        if sec > 0:
+            self.__now += sec
+
+    def time_module(self):
+        """
+        仮想時刻を返すtimeモジュールの代替 応答時刻・ロック時間の記録に使う
+        """
+        return types.SimpleNamespace(time=self.time, time_ns=self.time_ns, monotonic_ns=self.monotonic_ns,
+                                     perf_counter=self.perf_counter, strftime=self.strftime, sleep=self.sleep)
+
+    def datetime_module(self):
+        """
+        now()が仮想時刻を返すdatetimeモジュールの代替
+        """
+        clock = self
+
+        class VirtualDatetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return cls.fromtimestamp(clock.time(), tz)
+
+        return types.SimpleNamespace(datetime=VirtualDatetime, timedelta=datetime.timedelta, date=datetime.date)
+
+
+class SimulatedMagnet:
+    """
+    電源・磁石・ガウスメーターの物理モデル
+
+    電流に対して幅のあるバックラッシュでヒステリシスを与え,tanhで飽和させ,
+    一次遅れで磁界が追従する. 読み取り値には表示分解能に対するノイズを乗せる.
+    """
+
+    def __init__(self, clock: VirtualClock, seed: int = 0, magnet: str = "ELMG") -> None:
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.magnet = magnet
+        if magnet == "ELMG":
+            self.gain = 1.04  # Gauss/mA
+            self.saturation = 4600.0  # Gauss
+            self.backlash = 12.0  # mA
+            self.resistance = 6.0  # ohm
+            self.tau = 0.4  # sec
+        else:
+            self.gain = 20.960 / 1000 * 1.02
+            self.saturation = 1e9
+            self.backlash = 0.0
+            self.resistance = 2.0
+            self.tau = 0.05
+        self.noise_lsb = 0.3  # 表示分解能に対するノイズの標準偏差
+        self.output = False
+        self.iset = 0.0  # mA
+        self.__play = 0.0  # バックラッシュ後の電流[mA]
+        self.__field = 0.0
+        self.__updated = clock.time()
+        self.gauss_range = 0
+
+    def steady_field(self) -> float:
+        current = self.iset if self.output else 0.0
+        if current - self.__play > self.backlash:
+            self.__play = current - self.backlash
+        elif self.__play - current > self.backlash:
+            self.__play = current + self.backlash
+        return self.saturation * math.tanh(self.gain * self.__play / self.saturation)
+
+    def true_field(self) -> float:
+        now = self.clock.time()
+        dt = now - self.__updated
+        self.__updated = now
+        target = self.steady_field()
+        self.__field = target + (self.__field - target) * math.exp(-dt / self.tau)
+        return self.__field
+
+    def iout(self) -> float:
+        return self.iset if self.output else 0.0
+
+    def read_field(self) -> typing.Union[float, None]:
+        """
+        表示分解能で丸めた読み取り値 オーバーレンジ時はNone
+        """
+        field = self.true_field()
+        resolution = GAUSS_RANGE_RESOLUTION[self.gauss_range]
+        field += self.rng.gauss(0, self.noise_lsb * resolution)
+        if abs(field) > GAUSS_RANGE_MAX[self.gauss_range]:
+            return None
+        return round(field / resolution) * resolution
+
+
+class SimulatedPowerResource:
+    """
+    バイポーラ電源のVISAリソースの代替
+    """
+
+    def __init__(self, magnet: SimulatedMagnet, latency: float = 0.008) -> None:
+        self.magnet = magnet
+        self.latency = latency  # 1往復の所要時間[sec]
+
+    def write(self, command: str) -> None:
+        self.magnet.clock.sleep(self.latency)
+        name, _, arg = command.partition(" ")
+        if name == "ISET":
+            value, _, unit = arg.partition(" ")
+            current = float(value)
+            if unit.strip() == "A":
+                current *= 1000
+            self.magnet.true_field()  # 変更前の状態まで磁界を進めておく
+            self.magnet.iset = current
+        elif name == "OUT":
+            self.magnet.true_field()
+            self.magnet.output = arg.strip() == "1"
+        return
+
+    def query(self, command: str) -> str:
+        self.magnet.clock.sleep(self.latency)
+        if command == "ISET?":
+            return "ISET {0:+.3f}A".format(self.magnet.iset / 1000)
+        if command == "IOUT?":
+            return "IOUT {0:+.3f}A".format(self.magnet.iout() / 1000)
+        if command == "VOUT?":
+            return "VOUT {0:+.2f}V".format(self.magnet.iout() / 1000 * self.magnet.resistance)
+        if command == "OUT?":
+            return "OUT {0}".format(1 if self.magnet.output else 0)
+        raise ValueError(command)
+
+    def close(self) -> None:
+        return
+
+
+class SimulatedGaussResource:
+    """
+    ガウスメーターのVISAリソースの代替
+
+    FIELD?とFIELDM?は同じ読み取りの表示値と乗数を返す
+    """
+
+    def __init__(self, magnet: SimulatedMagnet, latency: float = 0.03) -> None:
+        self.magnet = magnet
+        self.latency = latency  # 1往復の所要時間[sec] シリアル接続を想定
+        self.__multiplier = ""
+
+    def write(self, command: str) -> None:
+        self.magnet.clock.sleep(self.latency)
+        name, _, arg = command.partition(" ")
+        if name == "RANGE":
+            self.magnet.gauss_range = int(arg)
+        return
+
+    def query(self, command: str) -> str:
+        self.magnet.clock.sleep(self.latency)
+        if command == "FIELD?":
+            field = self.magnet.read_field()
+            if field is None:
+                self.__multiplier = ""
+                return "OL\r\n"
+            if self.magnet.gauss_range <= 1:
+                self.__multiplier = "k"
+                digits = 2 if self.magnet.gauss_range == 0 else 3
+                return "{0:.{1}f}\r\n".format(field / 1000, digits)
+            self.__multiplier = ""
+            digits = 1 if self.magnet.gauss_range == 2 else 2
+            return "{0:.{1}f}\r\n".format(field, digits)
+        if command == "FIELDM?":
+            return self.__multiplier + "\r\n"
+        if command == "UNIT?":
+            return "G\r\n"
+        if command == "RANGE?":
+            return "{0}\r\n".format(self.magnet.gauss_range)
+        raise ValueError(command)
+
+    def close(self) -> None:
+        return
@@ -0,0 +1,99 @@
+import json
+import sys
+import threading
+import time
+import typing
+
+from machines_controller.io_stats import IOStats, STATS
+
+
+class PhaseTimeline:
+    """
+    IOStats.phase()の開始と終了を測定点ごとに記録するタイムライン
+
+    1行1フェーズのJSONで書き出す
+    {"point": 測定点, "target": 設定値, "phase": フェーズのパス, "start_ns": 開始時刻, "end_ns": 終了時刻}
+    時刻は作成時からの経過時間[ns]
+    """
+
+    def __init__(self, filepath: str, stats: IOStats = STATS) -> None:
+        self.filepath = filepath
+        self.__stats = stats
+        self.__thread = threading.current_thread()  # 測定スレッド以外のフェーズは記録しない
+        self.__origin = time.monotonic_ns()
+        self.__open: typing.List[typing.Tuple[str, int]] = []
+        self.__point: typing.Union[int, str, None] = None
+        self.__target: typing.Union[int, float, None] = None
+        self.__file = open(filepath, mode='a', encoding="utf-8", buffering=1)
+        stats.add_listener(self)
+
+    def point(self, point: typing.Union[int, str], target: typing.Union[int, float] = None) -> None:
+        """
+        以降のフェーズを指定した測定点に割り当てる
+
+        :param point: 測定点のindex または "pre_block" などの区間名
+        :param target: 設定値
+        """
+        self.__point = point
+        self.__target = target
+
+    def phase_begin(self, path: str, t_ns: int) -> None:
+        if threading.current_thread() is not self.__thread:
+            return
+        self.__open.append((path, t_ns))
+
+    def phase_end(self, path: str, t_ns: int) -> None:
+        if threading.current_thread() is not self.__thread or not self.__open:
+            return
+        open_path, start = self.__open.pop()
+        line = json.dumps({"point": self.__point, "target": self.__target, "phase": open_path,
+                           "start_ns": start - self.__origin, "end_ns": t_ns - self.__origin},
+                          separators=(",", ":"))
+        self.__file.write(line + "\n")
+
+    def close(self) -> None:
+        self.__stats.remove_listener(self)
+        self.__file.close()
+
+
+def aggregate(filepaths: typing.Iterable[str]) -> typing.Dict[str, typing.Dict[str, float]]:
+    """
+    タイムラインファイルを読み込み,フェーズごとの合計時間を集計する
+
+    :return: フェーズのパス -> {"count", "points", "total_sec", "mean_sec", "max_sec"}
+    """
+    result: typing.Dict[str, typing.Dict[str, float]] = {}
+    points: typing.Dict[str, set] = {}
+    for filepath in filepaths:
+        with open(filepath, mode='r', encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                sec = (entry["end_ns"] - entry["start_ns"]) / 1e9
+                stat = result.setdefault(entry["phase"], {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+                stat["count"] += 1
+                stat["total_sec"] += sec
+                stat["max_sec"] = max(stat["max_sec"], sec)
+                points.setdefault(entry["phase"], set()).add((filepath, entry["point"]))
+    for phase, stat in result.items():
+        stat["points"] = len(points[phase])
+        stat["mean_sec"] = stat["total_sec"] / stat["count"]
+    return result
+
+
+def report(filepaths: typing.Iterable[str]) -> str:
+    """
+    フェーズごとの合計時間を多い順に並べた表
+    """
+    result = aggregate(filepaths)
+    lines = ["{:<36}{:>7}{:>8}{:>11}{:>9}{:>9}".format("phase", "count", "points", "total[s]", "mean", "max")]
+    for phase, stat in sorted(result.items(), key=lambda x: x[1]["total_sec"], reverse=True):
+        lines.append("{:<36}{:>7}{:>8}{:>11.1f}{:>9.2f}{:>9.2f}".format(
+            phase, stat["count"], stat["points"], stat["total_sec"], stat["mean_sec"], stat["max_sec"]))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # python -m machines_controller.timeline logs/20201010/*.timeline.jsonl
+    print(report(sys.argv[1:]))
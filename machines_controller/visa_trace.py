@@ -0,0 +1,117 @@
+import datetime
+import json
+import threading
+import time
+import typing
+
+TRACE_VERSION = 1
+
+
+class TraceMismatchError(Exception):
+    pass
+
+
+class TraceRecorder:
+    """
+    VISAリソースをラップしてwrite/queryを時刻と応答時間付きでトレースファイルに記録する
+
+    1行目はヘッダ,以降は1呼び出し1行のJSON配列
+    [開始からの経過時間[ns], スレッド名, "w" or "q", コマンド, 応答, 応答時間[ns]]
+    """
+
+    def __init__(self, resource, trace_path: str, instrument: str = "") -> None:
+        self.__resource = resource
+        self.__lock = threading.Lock()
+        self.__file = open(trace_path, mode='a', encoding="utf-8", buffering=1)  # 異常終了しても行単位で残す
+        self.__origin = time.monotonic_ns()
+        header = {"version": TRACE_VERSION, "instrument": instrument,
+                  "start": datetime.datetime.now().isoformat()}
+        self.__file.write(json.dumps(header) + "\n")
+
+    def __record(self, op: str, command: str, response: typing.Union[str, None], start: int, end: int) -> None:
+        line = json.dumps([start - self.__origin, threading.current_thread().name, op, command, response,
+                           end - start], ensure_ascii=False, separators=(",", ":"))
+        with self.__lock:
+            self.__file.write(line + "\n")
+
+    def write(self, command: str):
+        start = time.monotonic_ns()
+        res = self.__resource.write(command)
+        self.__record("w", command, None, start, time.monotonic_ns())
+        return res
+
+    def query(self, command: str) -> str:
+        start = time.monotonic_ns()
+        res = self.__resource.query(command)
+        self.__record("q", command, res, start, time.monotonic_ns())
+        return res
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__file.close()
+        if hasattr(self.__resource, "close"):
+            self.__resource.close()
+
+
+class ReplayResource:
+    """
+    トレースファイルの応答を記録順に返すVISAリソースの代替
+
+    strict=Trueでは記録と異なるコマンドが来るとTraceMismatchErrorを投げる.
+    strict=Falseでは同じコマンドの次の記録を探し,なければ最後の応答を返すので
+    制御コードを変更した後でも実機の応答を元に動作させられる.
+    realtime=Trueで記録された応答時間だけ待つ.
+    """
+
+    def __init__(self, trace_path: str, strict: bool = True, realtime: bool = False) -> None:
+        self.strict = strict
+        self.realtime = realtime
+        self.header: typing.Dict[str, typing.Any] = {}
+        self.__entries: typing.Dict[str, typing.List[list]] = {}  # スレッド名ごとの記録
+        self.__cursor: typing.Dict[str, int] = {}
+        self.__last_response: typing.Dict[str, str] = {}
+        self.__lock = threading.Lock()
+        with open(trace_path, mode='r', encoding="utf-8") as f:
+            self.header = json.loads(f.readline())
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.__entries.setdefault(entry[1], []).append(entry)
+
+    def __next(self, op: str, command: str) -> list:
+        thread = threading.current_thread().name
+        entries = self.__entries.get(thread, [])
+        with self.__lock:
+            cursor = self.__cursor.get(thread, 0)
+            if cursor < len(entries) and entries[cursor][2] == op and entries[cursor][3] == command:
+                self.__cursor[thread] = cursor + 1
+                return entries[cursor]
+            if self.strict:
+                expected = entries[cursor][2:4] if cursor < len(entries) else "end of trace"
+                raise TraceMismatchError("{0} {1} : expected {2}".format(op, command, expected))
+            for i in range(cursor, len(entries)):
+                if entries[i][2] == op and entries[i][3] == command:
+                    self.__cursor[thread] = i + 1
+                    return entries[i]
+        if command in self.__last_response:
+            return [0, thread, op, command, self.__last_response[command], 0]
+        if op == "w":
+            return [0, thread, op, command, None, 0]
+        raise TraceMismatchError("{0} {1} : not found in trace".format(op, command))
+
+    def write(self, command: str) -> None:
+        entry = self.__next("w", command)
+        if self.realtime:
+            time.sleep(entry[5] / 1e9)
+        return
+
+    def query(self, command: str) -> str:
+        entry = self.__next("q", command)
+        self.__last_response[command] = entry[4]
+        if self.realtime:
+            time.sleep(entry[5] / 1e9)
+        return entry[4]
+
+    def close(self) -> None:
+        return
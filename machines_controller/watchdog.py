@@ -0,0 +1,116 @@
+import threading
+import time
+import typing
+
+from machines_controller.bipolar_power_ctl import BipolarPower, Current
+from machines_controller.gauss_ctl import GaussMeter, GaussMeterOverRangeError
+
+
+class Watchdog:
+    """
+    電源出力と磁界を一定周期で監視し,異常時に出力を0まで下げる監視スレッド
+
+    稼働中は電源のランプ待ち時間が短縮される
+    """
+
+    def __init__(self, power: BipolarPower, gauss: GaussMeter, interval: float = 0.1) -> None:
+        self.power = power
+        self.gauss = gauss
+        self.interval = interval  # 監視周期[sec]
+        self.CURRENT_LIMIT = Current(10, "A")
+        self.VOLTAGE_LIMIT = 40  # V
+        self.OPEN_CIRCUIT_CURRENT = Current(100, "mA")  # これ以上のISETでIOUTが出ない場合に断線とみなす
+        self.OPEN_CIRCUIT_RATIO = 0.1
+        self.field_limit: typing.Union[float, None] = None  # 暴走とみなす磁界[Gauss] Noneで監視しない
+        self.TRIP_COUNT = 3  # 断線・暴走はこの回数連続で検知したら異常とする
+        self.reason: typing.Union[str, None] = None  # 異常検知の理由
+        self.__stop = threading.Event()
+        self.__thread: typing.Union[threading.Thread, None] = None
+        self.__counts: typing.Dict[str, int] = {}
+
+    @property
+    def tripped(self) -> bool:
+        return self.reason is not None
+
+    def start(self) -> None:
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name="watchdog", daemon=True)
+        self.__thread.start()
+        self.power.monitored = True
+        return
+
+    def stop(self) -> None:
+        self.power.monitored = False
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        return
+
+    def reset(self) -> None:
+        """
+        異常の原因を取り除いた後に監視状態を初期化する
+        """
+        self.reason = None
+        self.__counts = {}
+        self.power.reset_interlock()
+        return
+
+    def __run(self) -> None:
+        while not self.__stop.wait(self.interval):
+            if self.tripped:
+                continue
+            try:
+                reason = self.check()
+            except GaussMeterOverRangeError:
+                reason = "ガウスメーターが最大レンジでオーバーレンジ"
+            except Exception as e:  # 通信異常でも出力は下げる
+                reason = "監視中の通信異常 : {0}".format(e)
+            if reason is not None:
+                self.trip(reason)
+        return
+
+    def __persist(self, key: str, detected: bool) -> bool:
+        if not detected:
+            self.__counts[key] = 0
+            return False
+        self.__counts[key] = self.__counts.get(key, 0) + 1
+        return self.__counts[key] >= self.TRIP_COUNT
+
+    def check(self) -> typing.Union[str, None]:
+        """
+        1回分の監視を行う
+
+        :return: 異常があればその理由 なければNone
+        """
+        iout = self.power.iout_fetch()
+        vout = self.power.vout_fetch()
+        if abs(iout) >= abs(self.CURRENT_LIMIT) or abs(vout) >= self.VOLTAGE_LIMIT:
+            return "電源過負荷 IOUT={0} VOUT={1}V".format(iout, vout)
+
+        iset = self.power.iset_fetch()
+        open_circuit = abs(iset) >= abs(self.OPEN_CIRCUIT_CURRENT) and abs(iout) < abs(iset) * self.OPEN_CIRCUIT_RATIO
+        if self.__persist("open_circuit", open_circuit):
+            return "断線 ISET={0} IOUT={1}".format(iset, iout)
+
+        if self.field_limit is None:
+            return None
+        field = self.gauss.field_probe()
+        runaway = field is not None and abs(field) > self.field_limit
+        if self.__persist("runaway", runaway):
+            return "磁界暴走 Field={0} G".format(field)
+        return None
+
+    def trip(self, reason: str) -> None:
+        self.reason = reason
+        print("[Error]\t" + reason)
+        start = time.time()
+        try:
+            self.power.emergency_ramp_down()
+        except Exception as e:
+            print("[Error]\t出力停止失敗 : {0}".format(e))
+            return
+        print("[Error]\t出力停止完了 {0:.1f} sec".format(time.time() - start))
+        return
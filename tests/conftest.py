@@ -0,0 +1,99 @@
+"""
+装置を使わずに実行できるテスト
+
+    python -m pytest -q
+"""
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import pytest  # noqa: E402
+
+from machines_controller import simulator  # noqa: E402
+from machines_controller.bipolar_power_ctl import BipolarPower, Current  # noqa: E402
+from machines_controller.gauss_ctl import GaussMeter  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch) -> simulator.VirtualClock:
+    """
+    time.sleepを仮想時計で置き換える ランプ・安定待ちを実時間で待たない
+    """
+    virtual = simulator.VirtualClock()
+    monkeypatch.setattr("time.sleep", virtual.sleep)
+    return virtual
+
+
+@pytest.fixture
+def rig(clock) -> simulator.SimulatedMagnet:
+    return simulator.SimulatedMagnet(clock, seed=0, magnet="ELMG")
+
+
+@pytest.fixture
+def power(rig) -> BipolarPower:
+    return BipolarPower(resource=simulator.SimulatedPowerResource(rig))
+
+
+@pytest.fixture
+def gauss(rig) -> GaussMeter:
+    return GaussMeter(resource=simulator.SimulatedGaussResource(rig))
+
+
+@pytest.fixture
+def make_session(tmp_path, clock):
+    """
+    シミュレーション装置につないだSessionを作る関数 benchmarks/bench_control.pyのsetup_rigと同じ初期設定
+    """
+    from jiwai.session import Session
+    sessions = []
+
+    def make(magnet: str = "ELMG", seed: int = 0):
+        rig = simulator.SimulatedMagnet(clock, seed, magnet)
+        session = Session(str(tmp_path),
+                          power_factory=lambda: BipolarPower(resource=simulator.SimulatedPowerResource(rig)),
+                          gauss_factory=lambda: GaussMeter(resource=simulator.SimulatedGaussResource(rig)),
+                          ask=lambda prompt: "")
+        session.connect_magnet = magnet
+        session.echo_status = False
+        session.power.MAGNET_RESISTANCE = rig.resistance
+        session.power.allow_output(True)
+        if magnet == "ELMG":
+            session.power.CURRENT_CHANGE_LIMIT = Current(200, "mA")
+            session.gauss.range_set(0)
+        else:
+            session.power.CURRENT_CHANGE_DELAY = 0.3
+            session.gauss.range_set(2)
+        sessions.append(session)
+        return session, rig
+
+    yield make
+    for s in sessions:
+        s.close()
+
+
+def write_log(filepath: str, rows, header: dict = None, end: str = "\n") -> str:
+    """
+    Session.gen_csv_headerと同じ形式のログを書く
+
+    :param rows: LOG_COLUMNSの並びの値の行 短い行はそのまま書く
+    :param end: 最後の行の終わり 途中で切れたログを作るときは""
+    """
+    from jiwai.status import LOG_COLUMN_NAMES, LOG_HEADER_END
+    lines = ["開始時刻,2020-10-10_12-00-00", "memo,sample"]
+    lines += ["{0},{1}".format(k, v) for k, v in (header or {}).items()]
+    lines += [LOG_HEADER_END, ",".join(LOG_COLUMN_NAMES)]
+    lines += [",".join("" if v is None else str(v) for v in row) for row in rows]
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, mode='w', encoding="utf-8") as f:
+        f.write("\n".join(lines) + end)
+    return filepath
+
+
+def loop_rows(currents, slope: float = 1000.0, offset: float = 0.0):
+    """
+    電流制御で測ったループの行 磁界 = slope * 電流[A] + offset
+    """
+    return [[float(i), a, a, slope * a + offset, a * 6, a * 1000, "", "", "", "", ""]
+            for i, a in enumerate(currents)]
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from machines_controller.async_ctl import AsyncBipolarPower, AsyncGaussMeter
+from machines_controller.bipolar_power_ctl import Current, PowerInterlockError
+from machines_controller.io_stats import IOStats
+
+
+@pytest.fixture
+def fast(power, gauss):
+    """
+    asyncio.sleepは仮想時計で進まないので待ち時間を0にする
+    """
+    power.CURRENT_CHANGE_DELAY = 0.0
+    gauss.RANGE_SETTLE_SEC = 0.0
+    return AsyncBipolarPower(power), AsyncGaussMeter(gauss)
+
+
+def test_set_iset_ramps_like_sync(fast, rig, power):
+    async_power, _ = fast
+    rig.output = True
+    power.stats = IOStats()
+    asyncio.run(async_power.set_iset(Current(1200, "mA")))
+    assert rig.iset == 1200
+    writes = power.stats.by_command()[("BipolarPower", "ISET")].count
+    assert writes == len(power.ramp_steps(Current(0, "mA"), Current(1200, "mA")))
+
+
+def test_set_iset_respects_interlock(fast, power):
+    async_power, _ = fast
+    power.interlock.set()
+    with pytest.raises(PowerInterlockError):
+        asyncio.run(async_power.set_iset(Current(100, "mA")))
+
+
+def test_field_fetch_and_sample_run_together(fast, rig, power, gauss, clock):
+    async_power, async_gauss = fast
+    rig.output = True
+    power.set_iset(Current(1000, "mA"))
+    clock.sleep(5)
+    gauss.range_set(3)
+
+    async def run():
+        return await asyncio.gather(async_gauss.magnetic_field_fetch(1000), async_gauss.sample(0.0, 3))
+
+    field, samples = asyncio.run(run())
+    assert 900 < field < 1200
+    assert async_gauss.last_range_hops >= 1
+    assert len(samples) == 3
@@ -0,0 +1,107 @@
+import datetime
+
+import pytest
+
+import jiwai.setting
+import jiwai.status
+from jiwai.checkpoint import Checkpoint
+from jiwai.sequence import reapproach_index
+from jiwai.setting import MeasureSetting
+from machines_controller.bipolar_power_ctl import Current
+
+
+def test_reapproach_index_returns_turning_point():
+    seq = [0, 100, 200, 100, 0, -100]
+    assert reapproach_index(seq, 4) == 2  # 下降区間の始点200から辿り直す
+    assert reapproach_index(seq, 5) == 2
+    assert reapproach_index(seq, 2) == 0
+
+
+def test_reapproach_index_skips_repeated_points():
+    seq = [0, 100, 100, 200, 300]
+    assert reapproach_index(seq, 4) == 0
+
+
+def test_reapproach_index_first_point():
+    assert reapproach_index([0, 100], 0) is None
+
+
+def test_checkpoint_round_trip(tmp_path):
+    filepath = str(tmp_path / "state" / "checkpoint.json")
+    checkpoint = Checkpoint()
+    checkpoint.setting_path = "measure_sequence/a.json"
+    checkpoint.seq_hash = "abc"
+    checkpoint.log_file = "logs/a.log"
+    checkpoint.start_time = datetime.datetime(2026, 1, 2, 3, 4, 5)
+    checkpoint.sequence_index = 1
+    checkpoint.point_index = 7
+    checkpoint.current = -1200
+    checkpoint.gauss_range = 2
+    checkpoint.file_offset = 4096
+    checkpoint.save(filepath)
+
+    loaded = Checkpoint.load(filepath)
+    assert str(loaded) == str(checkpoint)
+    assert loaded.start_time == checkpoint.start_time
+    assert (loaded.current, loaded.gauss_range, loaded.file_offset) == (-1200, 2, 4096)
+
+    Checkpoint.remove(filepath)
+    assert Checkpoint.load(filepath) is None
+
+
+def test_checkpoint_broken_file(tmp_path):
+    filepath = tmp_path / "checkpoint.json"
+    filepath.write_text('{"setting_path": "a.json"', encoding="utf-8")
+    assert Checkpoint.load(str(filepath)) is None
+
+
+@pytest.fixture
+def resume_rig(make_session, clock, monkeypatch, tmp_path):
+    """
+    降下区間の3番目(500)まで記録して中断した測定と,記録した目標値の一覧
+    """
+    monkeypatch.setattr(jiwai.setting, "time", clock.time_module())
+    monkeypatch.setattr(jiwai.setting, "datetime", clock.datetime_module())
+    monkeypatch.setattr(jiwai.status, "time", clock.time_module())
+    session, rig = make_session("ELMG")
+    setting = MeasureSetting(None, None, session)
+    setting.pre_lock_sec = 0.1
+    setting.post_lock_sec = 0
+    setting.post_block_td = datetime.timedelta(seconds=1)
+    setting.blocking_monitoring_td = datetime.timedelta(seconds=0.5)
+    targets = []
+    record = setting.measure_lock_record
+
+    def spy(target, *args, **kwargs):
+        targets.append(target)
+        return record(target, *args, **kwargs)
+
+    monkeypatch.setattr(setting, "measure_lock_record", spy)
+    checkpoint = Checkpoint()
+    checkpoint.log_file, checkpoint.start_time = session.gen_csv_header("a.log")
+    checkpoint.point_index = 3
+    checkpoint.current = 600
+    checkpoint.gauss_range = 1
+    return setting, checkpoint, targets
+
+
+SEQ = [0, 500, 1000, 500, 0, -500]
+
+
+def test_resume_reapproaches_through_turning_point(resume_rig):
+    setting, checkpoint, targets = resume_rig
+    setting.resume_process(SEQ, checkpoint)
+    assert targets[:3] == [1000, 500, 0]  # 降下区間の始点から同じ枝を辿る
+
+
+def test_resume_keeps_branch_when_current_is_held(resume_rig):
+    setting, checkpoint, targets = resume_rig
+    setting.session.power.set_iset(Current(checkpoint.current, "mA"))
+    setting.session.gauss.range_set(0)
+    range_set = []
+    gauss_range_set = setting.session.gauss.range_set
+    setting.session.gauss.range_set = lambda r: (range_set.append(r), gauss_range_set(r))
+    setting.resume_process(SEQ, checkpoint)
+    assert range_set[0] == checkpoint.gauss_range  # 中断時のレンジに戻してから動かす
+    assert targets[:2] == [0, -500]
+    assert checkpoint.completed
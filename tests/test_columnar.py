@@ -0,0 +1,79 @@
+import math
+import os
+
+import pytest
+
+from conftest import loop_rows, write_log
+from jiwai.checkpoint import RESUME_MARKER
+from jiwai.columnar import ColumnarFile, build_monthly, convert_log, parse_log
+from jiwai.status import LOG_COLUMNS
+
+
+def test_parse_log(tmp_path):
+    path = write_log(str(tmp_path / "a.log"), loop_rows([0.0, 1.0, 2.0]), {"magnet": "ELMG"})
+    header, columns, report = parse_log(path)
+    assert header == {"開始時刻": "2020-10-10_12-00-00", "memo": "sample", "magnet": "ELMG"}
+    assert list(columns["field"]) == [0.0, 1000.0, 2000.0]
+    assert math.isnan(columns["dwell"][0])  # 空欄はnan
+    assert report == {"skipped": 0, "partial": False}
+
+
+def test_partial_last_line_is_dropped(tmp_path):
+    rows = loop_rows([0.0, 1.0, 2.0])
+    path = write_log(str(tmp_path / "a.log"), rows[:2] + [rows[2][:4]], end="")  # 書き込み中に止まった
+    _, columns, report = parse_log(path)
+    assert list(columns["iout"]) == [0.0, 1.0]
+    assert report == {"skipped": 0, "partial": True}
+
+
+def test_partial_last_line_with_all_columns_is_dropped(tmp_path):
+    rows = loop_rows([0.0, 1.0, 2.0])
+    path = write_log(str(tmp_path / "a.log"), rows, end="")  # 最後の値の桁が欠けているかもしれない
+    _, columns, report = parse_log(path)
+    assert len(columns["iout"]) == 2
+    assert report["partial"]
+
+
+def test_corrupt_rows_are_skipped(tmp_path):
+    rows = loop_rows([0.0, 1.0, 2.0, 3.0])
+    rows[1][3] = "x?"
+    rows.insert(3, [RESUME_MARKER])
+    path = write_log(str(tmp_path / "a.log"), rows + [[1.0, 2.0, 3.0]])
+    _, columns, report = parse_log(path)
+    assert list(columns["iout"]) == [0.0, 2.0, 3.0]
+    assert report == {"skipped": 2, "partial": False}
+
+
+def test_legacy_rows_are_padded(tmp_path):
+    path = write_log(str(tmp_path / "a.log"), [[0.0, 1.0, 1.0, 1000.0, 6.0, 1000.0]])
+    _, columns, report = parse_log(path)
+    assert columns["target"][0] == 1000.0
+    assert math.isnan(columns["t_iset"][0]) and math.isnan(columns["dwell"][0])
+    assert report["skipped"] == 0
+
+
+def test_broken_header(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_text("開始時刻,2020-10-10_12-00-00\n0.0,1.0\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        parse_log(str(path))
+    assert convert_log(str(path), str(tmp_path / "a.jwc"))["error"] is not None
+
+
+def test_convert_and_build_monthly(tmp_path):
+    out = str(tmp_path / "columnar")
+    for name, currents in (("a", [0.0, 1.0]), ("b", [2.0, 3.0, 4.0])):
+        src = write_log(str(tmp_path / "logs" / "20201010" / (name + ".log")), loop_rows(currents))
+        report = convert_log(src, os.path.join(out, "20201010", name + ".jwc"))
+        assert report["error"] is None and report["rows"] == len(currents)
+
+    (dataset,) = build_monthly(out)
+    data = ColumnarFile(dataset)
+    try:
+        assert data.columns == LOG_COLUMNS
+        iout = data.column("iout")
+        assert list(iout) == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert [(r["offset"], r["rows"]) for r in data.runs] == [(0, 2), (2, 3)]
+        iout.release()
+    finally:
+        data.close()
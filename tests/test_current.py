@@ -0,0 +1,55 @@
+import pickle
+from array import array
+
+import pytest
+
+from machines_controller.current import Current, CurrentArray
+
+
+def test_units():
+    assert Current(1.5, "A").mA() == 1500
+    assert Current(250.4, "ma").mA() == 250
+    assert Current(-2, "A").A() == -2.0
+    with pytest.raises(ValueError):
+        Current(1, "V")
+
+
+def test_immutable_and_hashable():
+    current = Current(100)
+    with pytest.raises(AttributeError):
+        current.x = 1
+    with pytest.raises(AttributeError):
+        del current._Current__current
+    assert {Current(100): "a"}[Current.from_mA(100)] == "a"
+    assert pickle.loads(pickle.dumps(current)) == current
+
+
+def test_arithmetic_returns_new_values():
+    current = Current(1000)
+    assert (current + 200).mA() == 1200
+    assert (current - Current(300)).mA() == 700
+    assert (current * 0.5).mA() == 500
+    assert current.mA() == 1000
+    assert str(current) == "1.0 A"
+    assert str(Current(-20)) == "-20 mA"
+    assert Current(-5) < 0 <= Current(0)
+
+
+def test_ramp():
+    assert CurrentArray.ramp(0, 500, 200).tolist() == [0, 200, 400, 500]
+    assert CurrentArray.ramp(500, -100, 200).tolist() == [500, 300, 100, -100]
+    assert CurrentArray.ramp(0, 400, 200).tolist() == [0, 200, 400]
+    assert len(CurrentArray.ramp(100, 100, 200)) == 0
+
+
+def test_current_array():
+    values = CurrentArray([0, Current(200), 400.0])
+    assert values == [0, 200, 400]
+    assert values == CurrentArray(array("q", [0, 200, 400]))
+    assert values[1] == 200 and isinstance(values[1], int)
+    assert values[1:].tolist() == [200, 400]
+    assert values.current(2) == Current(400)
+    assert [c.mA() for c in values.currents()] == [0, 200, 400]
+    values.append(Current(-100))
+    assert values.mA().tolist() == [0, 200, 400, -100]
+    assert repr(values) == "CurrentArray([0, 200, 400, -100])"
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from jiwai.daemon import DaemonAPI, JobQueue, parse_value
+
+
+def wait_idle(q: JobQueue, timeout: float = 10.0) -> None:
+    waiter = threading.Event()  # time.sleepは仮想時計に置き換えてあるので実時間で待つ
+    for _ in range(int(timeout / 0.01)):
+        if all(job.state not in {"queued", "running"} for job in q.jobs.values()):
+            return
+        waiter.wait(0.01)
+    raise TimeoutError
+
+
+def test_jobs_run_by_priority_then_order(make_session):
+    session, _ = make_session()
+    q = JobQueue(session)
+    order = []
+    q.execute = lambda job: order.append(job.job_id)
+    low = q.submit("oectl", [100], priority=20)
+    first = q.submit("oectl", [200])
+    second = q.submit("oectl", [300])
+    cancelled = q.submit("oectl", [400])
+    assert q.cancel(cancelled)
+    q.start()
+    try:
+        wait_idle(q)
+    finally:
+        q.stop()
+    assert order == [first, second, low]
+    assert q.jobs[cancelled].state == "cancelled"
+    assert not q.cancel(cancelled)
+
+
+def test_failed_job_keeps_error(make_session):
+    session, _ = make_session()
+    q = JobQueue(session)
+    job_id = q.submit("measure")  # 検証していない設定では測定しない
+    q.start()
+    try:
+        wait_idle(q)
+    finally:
+        q.stop()
+    assert q.jobs[job_id].state == "failed"
+    assert "setting is not verified" in q.jobs[job_id].error
+
+
+def test_status_serves_last_record_without_io(make_session):
+    session, _ = make_session()
+    q = JobQueue(session)
+    api = DaemonAPI({"A": q})
+    assert api.status()["A"]["field"] is None
+
+    q.start()
+    try:
+        api.submit("current", [500])
+        wait_idle(q)
+    finally:
+        q.stop()
+    calls = sum(stat.count for stat in session.stats.by_command().values())
+    status = api.status()["A"]
+    assert sum(stat.count for stat in session.stats.by_command().values()) == calls  # 装置に問い合わせない
+    assert status["iset"] == 0.5
+    assert status["connect_magnet"] == "ELMG"
+    assert status["queued"] == 0
+
+
+def test_station_is_required_with_several_queues(make_session):
+    session_a, _ = make_session()
+    session_b, _ = make_session()
+    api = DaemonAPI({"A": JobQueue(session_a, "A"), "B": JobQueue(session_b, "B")})
+    with pytest.raises(ValueError):
+        api.submit("oectl", [100])
+    with pytest.raises(ValueError):
+        api.submit("unknown", station="A")
+    job_id = api.submit("oectl", [100], station="B")
+    assert api.job(job_id)["station"] == "B"
+    assert [j["job_id"] for j in api.jobs()] == [job_id]
+
+
+@pytest.mark.parametrize("kind, args", [("oectl", [100, "false"]), ("oectl", [100, 0]), ("demag", [15, "0"])])
+def test_flag_arguments_must_be_bool(make_session, kind, args):
+    session, _ = make_session()
+    q = JobQueue(session)
+    with pytest.raises(ValueError):
+        q.submit(kind, args)
+    assert q.jobs == {}
+    assert q.submit(kind, args[:1] + [False]) in q.jobs
+
+
+def test_parse_value():
+    assert [parse_value(t) for t in ("1000", "1.5", "True", "false", "a.json")] == [1000, 1.5, True, False, "a.json"]
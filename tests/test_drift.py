@@ -0,0 +1,66 @@
+import math
+
+import pytest
+
+from conftest import write_log
+from jiwai.columnar import parse_log
+from jiwai.drift import DRIFT_MIN_HOLD_SEC, correct_log, fit_drift, hold_blocks
+from jiwai.sequence import TRANSITION_MIN_BLOCK_TD
+
+DRIFT = 0.5  # G/sec
+
+
+def test_hold_blocks():
+    assert hold_blocks([0, 0, 0, 100, 200, 100, 0, 0]) == [(0, 3), (6, 8)]
+    assert hold_blocks([5, 5, 5]) == [(0, 3)]
+    assert hold_blocks([]) == []
+
+
+def test_fit_drift_shares_slope_between_blocks():
+    times = [0, 1, 2, 3, 10, 11, 12]
+    offsets = [100, 100, 100, 100, -50, -50, -50]  # 区間ごとに値の水準が違っても傾きだけを求める
+    values = [o + DRIFT * t for o, t in zip(offsets, times)]
+    assert math.isclose(fit_drift(times, values, [(0, 4), (4, 7)]), DRIFT)
+    assert fit_drift([1, 1], [0, 5], [(0, 2)]) == 0.0
+
+
+def drifting_rows(targets, interval: float = DRIFT_MIN_HOLD_SEC / 2):
+    rows = []
+    for i, target in enumerate(targets):
+        t = i * interval
+        rows.append([t, target / 1000, target / 1000, target + DRIFT * t, 0.0, target, "", "", "", "", ""])
+    return rows
+
+
+def test_correct_log_removes_linear_drift(tmp_path):
+    targets = [0, 0, 0, 500, 1000, 500, 0, -500, -1000, -1000, -1000]
+    path = write_log(str(tmp_path / "a.log"), drifting_rows(targets))
+    slopes = correct_log(path)
+    assert math.isclose(slopes["field"], DRIFT)
+    assert math.isclose(slopes["iout"], 0.0, abs_tol=1e-12)
+
+    header, data, _ = parse_log(str(tmp_path / "a.bg.csv"))
+    assert float(header["drift_field"]) == DRIFT
+    assert all(math.isclose(f, t, abs_tol=1e-9) for f, t in zip(data["field"], targets))
+
+
+def test_correct_log_prefers_reply_stamps(tmp_path):
+    targets = [0, 0, 0, 1000, 1000, 1000]
+    rows = drifting_rows(targets)
+    for row in rows:
+        stamp = int(row[0] * 2e9)  # 磁界の応答時刻は経過時間の2倍の時間軸
+        row[6:10] = [stamp] * 4
+    path = write_log(str(tmp_path / "a.log"), rows)
+    assert math.isclose(correct_log(path)["field"], DRIFT / 2)
+
+
+def test_correct_log_rejects_shortened_pre_block(tmp_path):
+    # 連続境界でプリブロックを短縮したログ : 開始点の記録,プリブロック終了,0番目の測定点
+    pre_block = TRANSITION_MIN_BLOCK_TD.total_seconds()
+    times = [0.0, pre_block, pre_block + 1.5, 10.0, 20.0, 30.0, 40.0]
+    targets = [0, 0, 0, 1000, 2000, 2000, 2000]
+    rows = [[t, v / 1000, v / 1000, v + DRIFT * t, 0.0, v, "", "", "", "", ""] for t, v in zip(times, targets)]
+    path = write_log(str(tmp_path / "a.log"), rows)
+    with pytest.raises(ValueError):
+        correct_log(path)
+    assert not (tmp_path / "a.bg.csv").exists()
@@ -0,0 +1,71 @@
+import pytest
+
+from machines_controller.bipolar_power_ctl import Current
+from machines_controller.gauss_ctl import GaussMeter, GaussMeterOverRangeError, suitable_range
+
+
+class OverRangeResource:
+    """
+    どのレンジでもオーバーレンジを返すガウスメーター
+    """
+
+    def __init__(self, gauss_range: int) -> None:
+        self.gauss_range = gauss_range
+
+    def write(self, command: str) -> None:
+        self.gauss_range = int(command.split()[1])
+
+    def query(self, command: str) -> str:
+        if command == "RANGE?":
+            return "{0}\r\n".format(self.gauss_range)
+        return "OL\r\n"
+
+
+def test_suitable_range():
+    assert suitable_range(3000) == 0
+    assert suitable_range(-2700) == 0
+    assert suitable_range(1000) == 1
+    assert suitable_range(100) == 2
+    assert suitable_range(0) == 3
+
+
+def test_fetch_applies_multiplier(power, gauss, rig):
+    rig.output = True
+    power.set_iset(Current(1000, "mA"))
+    gauss.range_set(1)
+    field = gauss.magnetic_field_fetch()
+    assert 900 < field < 1200  # 表示は"k"付きのkG単位
+    assert gauss.last_range_hops == 0
+
+
+def test_overrange_jumps_to_expected_range(power, gauss, rig):
+    rig.output = True
+    power.set_iset(Current(1000, "mA"))
+    gauss.range_set(3)
+    field = gauss.magnetic_field_fetch(1000)
+    assert gauss.last_range_hops == 1
+    assert gauss.range_fetch() == 1
+    assert 900 < field < 1200
+
+
+def test_overrange_widens_one_range_at_a_time(power, gauss, rig):
+    rig.output = True
+    power.set_iset(Current(1000, "mA"))
+    gauss.range_set(3)
+    gauss.magnetic_field_fetch()
+    assert gauss.last_range_hops == 2
+    assert gauss.range_fetch() == 1
+
+
+def test_overrange_at_widest_range_raises():
+    gauss = GaussMeter(resource=OverRangeResource(0))
+    with pytest.raises(GaussMeterOverRangeError):
+        gauss.magnetic_field_fetch()
+
+
+def test_overrange_hops_are_bounded(clock):
+    gauss = GaussMeter(resource=OverRangeResource(3))
+    gauss.MAX_RANGE_HOPS = 2
+    with pytest.raises(GaussMeterOverRangeError):
+        gauss.magnetic_field_fetch()
+    assert gauss.last_range_hops == 2
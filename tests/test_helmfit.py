@@ -0,0 +1,84 @@
+import pytest
+
+from jiwai import helmfit
+from jiwai.helmfit import HelmholtzFit
+from jiwai.session import HELM_TRIM_DEADBAND_OE, HELM_TRIM_MAX_OE
+from machines_controller.bipolar_power_ctl import Current
+
+NOMINAL = 0.02  # 校正値[Oe/mA]
+
+
+def test_fit_recovers_linear_relation():
+    fit = HelmholtzFit(None, NOMINAL)
+    for current in range(-4000, 4001, 500):
+        fit.add(current, 0.021 * current + 0.5)
+    assert fit.fitted
+    assert fit.slope == pytest.approx(0.021)
+    assert fit.offset == pytest.approx(0.5)
+    assert fit.current_for(fit.field_for(1234)) == pytest.approx(1234)
+
+
+def test_small_spread_fits_offset_only():
+    fit = HelmholtzFit(None, NOMINAL)
+    for current in (1000, 1010, 990, 1000, 1005):
+        fit.add(current, 0.03 * current + 1.0)
+    assert not fit.fitted
+    assert fit.slope == NOMINAL
+    assert fit.field_for(1000) == pytest.approx(31.0, abs=0.1)
+
+
+def test_slope_outside_tolerance_is_rejected():
+    fit = HelmholtzFit(None, NOMINAL)
+    for current in range(-4000, 4001, 500):
+        fit.add(current, NOMINAL * (1 + 2 * helmfit.FIT_SLOPE_TOLERANCE) * current)
+    assert not fit.fitted
+    assert fit.slope == NOMINAL
+
+
+def test_window_forgets_old_readings():
+    fit = HelmholtzFit(None, NOMINAL)
+    for i in range(int(helmfit.FIT_WINDOW) * 5):
+        current = -4000 + (i % 9) * 1000
+        fit.add(current, (0.019 if i < helmfit.FIT_WINDOW else 0.021) * current)
+    assert fit.n <= helmfit.FIT_WINDOW
+    assert fit.slope == pytest.approx(0.021, rel=0.01)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "fit" / "helm_fit.json")
+    fit = HelmholtzFit(path, NOMINAL)
+    for current in range(-4000, 4001, 1000):
+        fit.add(current, 0.021 * current - 0.3)
+    fit.save()
+    loaded = HelmholtzFit.load(path, NOMINAL)
+    assert loaded.fitted
+    assert loaded.slope == pytest.approx(fit.slope)
+    assert loaded.offset == pytest.approx(fit.offset)
+    assert loaded.n == fit.n
+
+
+@pytest.mark.parametrize("content", ["{broken", '{"slope": 0, "offset": 0, "sums": [1, 0, 0, 0, 0]}', '{"slope": 1}'])
+def test_load_falls_back_to_nominal(tmp_path, content):
+    path = tmp_path / "helm_fit.json"
+    path.write_text(content, encoding="utf-8")
+    fit = HelmholtzFit.load(str(path), NOMINAL)
+    assert not fit.fitted
+    assert fit.slope == NOMINAL
+    assert fit.n == 0
+
+
+@pytest.mark.parametrize("field, expected_error", [
+    (100.0 - 10.0, HELM_TRIM_MAX_OE),  # 上限で切る
+    (100.0 + 10.0, -HELM_TRIM_MAX_OE),
+    (100.0 - 1.0, 1.0),
+    (100.0 - HELM_TRIM_DEADBAND_OE / 2, 0.0),  # 不感帯の中は補正しない
+])
+def test_helmholtz_trim_is_clipped(make_session, monkeypatch, field, expected_error):
+    session, rig = make_session("HELM")
+    monkeypatch.setattr(session.gauss, "magnetic_field_fetch", lambda target: field)
+    current = Current(5000, "mA")
+    session.power.set_iset(current)
+    trimmed = session.helmholtz_trim(100, current)
+    expected = current + Current(expected_error / session.helm_fit.slope, "mA")
+    assert trimmed == expected
+    assert session.power.iset_fetch() == trimmed
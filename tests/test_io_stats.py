@@ -0,0 +1,76 @@
+import threading
+
+from machines_controller.io_stats import CommandStat, IOStats, LATENCY_BUCKETS_MS, command_key
+
+
+def test_command_key():
+    assert command_key("ISET 1.5 A") == "ISET"
+    assert command_key("FIELD?") == "FIELD?"
+
+
+def test_histogram_buckets():
+    stat = CommandStat()
+    stat.add(500_000)  # 0.5 ms
+    stat.add(7_000_000)  # 7 ms
+    stat.add(5_000_000_000)  # 上限なしの区間
+    assert stat.histogram[0] == 1
+    assert stat.histogram[LATENCY_BUCKETS_MS.index(10)] == 1
+    assert stat.histogram[-1] == 1
+    assert stat.count == 3
+    assert stat.max_ns == 5_000_000_000
+
+
+def test_nested_phases():
+    stats = IOStats()
+    with stats.phase("oectl"):
+        stats.record("GaussMeter", "FIELD?", 1_000_000)
+        with stats.phase("ramp"):
+            stats.record("BipolarPower", "ISET 0.5 A", 2_000_000)
+            stats.record("BipolarPower", "ISET 1.0 A", 2_000_000)
+    stats.record("GaussMeter", "FIELD?", 1_000_000)
+
+    assert {phase: stat.count for phase, stat in stats.by_phase().items()} == {"oectl": 1, "oectl/ramp": 2,
+                                                                                "other": 1}
+    assert stats.by_command()[("BipolarPower", "ISET")].total_ns == 4_000_000
+    assert stats.by_command()[("GaussMeter", "FIELD?")].count == 2
+
+
+def test_other_threads_use_thread_name():
+    stats = IOStats()
+    thread = threading.Thread(target=stats.record, args=("GaussMeter", "FIELD?", 1), name="watchdog")
+    thread.start()
+    thread.join()
+    assert list(stats.by_phase()) == ["watchdog"]
+
+
+def test_listener_sees_phase_paths():
+    class Listener:
+        def __init__(self):
+            self.events = []
+
+        def phase_begin(self, path, t_ns):
+            self.events.append(("begin", path))
+
+        def phase_end(self, path, t_ns):
+            self.events.append(("end", path))
+
+    stats = IOStats()
+    listener = Listener()
+    stats.add_listener(listener)
+    with stats.phase("point"), stats.phase("settle"):
+        pass
+    stats.remove_listener(listener)
+    with stats.phase("point"):
+        pass
+    assert listener.events == [("begin", "point"), ("begin", "point/settle"), ("end", "point/settle"),
+                               ("end", "point")]
+
+
+def test_summary_reports_round_trips_per_point():
+    stats = IOStats()
+    stats.count_event("point", 2)
+    for _ in range(6):
+        stats.record("BipolarPower", "IOUT?", 1_000_000)
+    assert "round trips per point = 3.0" in stats.summary()
+    stats.reset()
+    assert stats.to_dict()["detail"] == []
@@ -0,0 +1,51 @@
+import logging
+
+from jiwai import journal
+from jiwai.journal import Journal
+
+
+def test_journal_writes_in_order_and_filters(tmp_path):
+    filepath = str(tmp_path / "journal.jsonl")
+    j = Journal(filepath, "A")
+    j.record("setpoint", mA=100)
+    j.record("field_read", field=98.5, hops=0)
+    j.record("setpoint", mA=200)
+    j.close()
+
+    events = list(journal.load([filepath]))
+    assert [e["kind"] for e in events] == ["setpoint", "field_read", "setpoint"]
+    assert all(e["station"] == "A" for e in events)
+    assert [e["mA"] for e in journal.load([filepath], ["setpoint"])] == [100, 200]
+    assert journal.summarize(events) == {"setpoint": 2, "field_read": 1}
+
+
+def test_error_handler_records_errors_only(tmp_path):
+    filepath = str(tmp_path / "journal.jsonl")
+    j = Journal(filepath)
+    lg = logging.getLogger("jiwai.test_journal")
+    handler = j.error_handler()
+    lg.addHandler(handler)
+    try:
+        lg.warning("not recorded")
+        lg.error("broken %s", "file")
+    finally:
+        lg.removeHandler(handler)
+    j.close()
+    events = list(journal.load([filepath]))
+    assert [(e["kind"], e["message"], e["logger"]) for e in events] == [("error", "broken file", "jiwai.test_journal")]
+
+
+def test_slow_points_counts_events_per_station():
+    events = [
+        {"station": "A", "kind": "oectl"},
+        {"station": "B", "kind": "oectl"},
+        {"station": "A", "kind": "range_change"},
+        {"station": "A", "kind": "oectl"},
+        {"station": "A", "kind": "point", "index": 0, "sec": 40.0},
+        {"station": "A", "kind": "oectl"},
+        {"station": "A", "kind": "point", "index": 1, "sec": 5.0},
+        {"station": "B", "kind": "point", "index": 0, "sec": 31.0},
+    ]
+    slow = journal.slow_points(events, 30)
+    assert [(p["station"], p["index"], p["oectl"], p["range_change"]) for p in slow] == [("A", 0, 2, 1),
+                                                                                          ("B", 0, 1, 0)]
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+
+from jiwai.library import SequenceLibrary
+
+
+def write_setting(path, **fields) -> str:
+    data = {"connect_to": "ELMG", "control": "oectl", "demag": False, "autorange": False,
+            "seq": [[0, 100, 200]]}
+    data.update(fields)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', encoding="utf-8") as f:
+        json.dump(data, f)
+    return path
+
+
+def counting_library(sequence_dir: str, context=lambda: None):
+    calls = []
+    return SequenceLibrary(sequence_dir, lambda d, p: calls.append(p) or d, context), calls
+
+
+def test_cache_hits_until_file_changes(tmp_path):
+    path = write_setting(str(tmp_path / "a.json"))
+    library, calls = counting_library(str(tmp_path))
+    entry = library.load(path)
+    assert library.load(path) is entry
+    assert len(calls) == 1
+
+    write_setting(path, seq=[[0, 100, 200, 300]])
+    changed = library.load(path)
+    assert changed is not entry
+    assert changed.seq_hash != entry.seq_hash
+    assert len(calls) == 2
+
+
+def test_context_change_reparses(tmp_path):
+    path = write_setting(str(tmp_path / "a.json"))
+    state = {"magnet": ""}
+    library, calls = counting_library(str(tmp_path), lambda: state["magnet"])
+    library.load(path)
+    state["magnet"] = "ELMG"
+    assert library.load(path).context == "ELMG"
+    assert len(calls) == 2
+
+
+def test_broken_json_is_reported(tmp_path):
+    path = tmp_path / "a.json"
+    path.write_text("{broken", encoding="utf-8")
+    library, calls = counting_library(str(tmp_path))
+    entry = library.load(str(path))
+    assert entry.error is not None and entry.setting is None
+    assert calls == []
+
+
+def failing_factory(data, path):
+    if os.path.basename(path) == "bad.json":
+        raise KeyError("seq")
+    return data
+
+
+def test_factory_error_is_reported_per_file(tmp_path):
+    good = write_setting(str(tmp_path / "a.json"))
+    bad = write_setting(str(tmp_path / "bad.json"))
+    library = SequenceLibrary(str(tmp_path), failing_factory)
+    entries = library.prefetch()
+    assert entries[good].error is None
+    assert entries[bad].error is not None and entries[bad].setting is None
+
+
+def test_watch_survives_errors(tmp_path):
+    path = write_setting(str(tmp_path / "a.json"))
+    write_setting(str(tmp_path / "bad.json"))
+    library = SequenceLibrary(str(tmp_path), failing_factory)
+    events = [threading.Event(), threading.Event()]
+    changed = []
+
+    def on_change(p, entry):
+        changed.append(entry)
+        events[min(len(changed), 2) - 1].set()
+        if len(changed) == 1:
+            raise RuntimeError("on_change")  # 呼び出し先の例外でも監視を続ける
+
+    library.watch(on_change, interval=0.01)
+    try:
+        write_setting(str(tmp_path / "bad.json"), seq=[[0, 1]])
+        assert events[0].wait(5)
+        write_setting(path, seq=[[0, 1, 2]])
+        assert events[1].wait(5)
+    finally:
+        library.stop_watch()
+    assert changed[0].error is not None
+
+
+def test_new_setting_is_a_copy(tmp_path):
+    path = write_setting(str(tmp_path / "a.json"))
+    library = SequenceLibrary(str(tmp_path), lambda d, p: type("Setting", (), {"verified": False})())
+    entry = library.load(path)
+    setting = entry.new_setting()
+    setting.verified = True
+    assert entry.new_setting().verified is False
+
+
+def test_watch_reports_edits(tmp_path):
+    path = write_setting(str(tmp_path / "a.json"))
+    library, _ = counting_library(str(tmp_path))
+    changed = []
+    edited = threading.Event()
+    library.watch(lambda p, e: (changed.append(p), edited.set()), interval=0.01)
+    try:
+        write_setting(path, seq=[[0, 1]])
+        assert edited.wait(5)
+    finally:
+        library.stop_watch()
+    assert changed[0] == os.path.abspath(path)
+
+
+def test_setting_db_revalidates_after_connect(make_session):
+    session, _ = make_session()
+    write_setting(os.path.join(session.sequence_dir, "a.json"))
+    session.connect_magnet = ""
+    db = session.db
+    db.load_measure_sequence("a.json")
+    assert db.seq.have_error  # 接続前は接続先が一致しない
+    session.connect_magnet = "ELMG"
+    db.load_measure_sequence("a.json")
+    assert not db.seq.have_error
+
+
+def test_continues_to_uses_library(make_session):
+    session, _ = make_session()
+    write_setting(os.path.join(session.sequence_dir, "a.json"), seq=[[0, 100, 200]])
+    write_setting(os.path.join(session.sequence_dir, "b.json"), seq=[[200, 100, 0]])
+    write_setting(os.path.join(session.sequence_dir, "c.json"), seq=[[0, 100]])
+    db = session.db
+    db.load_measure_sequence("a.json")
+    factory = db.library.factory
+    parsed = []
+    db.library.factory = lambda d, p: parsed.append(os.path.basename(p)) or factory(d, p)
+
+    assert db.continues_to("b.json")
+    assert not db.continues_to("c.json")
+    assert not db.continues_to("missing.json")
+    db.load_measure_sequence("b.json")
+    assert parsed == ["b.json", "c.json"]  # 判定で読んだ結果を読み込みで再利用する
@@ -0,0 +1,32 @@
+import math
+
+from jiwai.loopmetrics import METRIC_COLUMNS, loop_metrics, zero_crossings
+
+
+def test_zero_crossings_interpolates():
+    assert zero_crossings([0.0, 1.0, 2.0], [-1.0, 1.0, 3.0]) == [0.5]
+    assert zero_crossings([0.0, 1.0], [0.0, 1.0]) == [0.0]
+    assert zero_crossings([0.0, 1.0], [1.0, 2.0]) == []
+
+
+def test_square_loop():
+    # 保磁力1 A,残留磁界100 Gの平行四辺形のループ
+    iout = [2.0, 0.0, -1.0, -2.0, 0.0, 1.0, 2.0]
+    field = [300.0, 100.0, 0.0, -300.0, -100.0, 0.0, 300.0]
+    metrics = loop_metrics(iout, field, field, True)
+    assert metrics["coercive_current"] == 1.0
+    assert metrics["remanence_field"] == 100.0
+    assert metrics["saturation_field"] == 300.0
+    assert math.isclose(metrics["loop_area"], 600.0)
+    assert metrics["field_error_max"] == 0.0
+
+
+def test_field_error_only_for_field_control():
+    metrics = loop_metrics([0.0, 1.0], [3.0, 96.0], [0.0, 100.0], True)
+    assert metrics["field_error_max"] == 4.0
+    assert math.isclose(metrics["field_error_rms"], math.sqrt((9 + 16) / 2))
+    assert loop_metrics([0.0, 1.0], [3.0, 96.0], [0.0, 1.0], False)["field_error_max"] is None
+
+
+def test_empty_log():
+    assert loop_metrics([], [], [], True) == dict.fromkeys(METRIC_COLUMNS)
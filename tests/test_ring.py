@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import REPO_DIR
+from jiwai.ring import HEADER, RECORD, SampleRing, format_record
+
+
+@pytest.fixture
+def ring(request):
+    writer = SampleRing.create("jiwai_test_{0}_{1}".format(os.getpid(), request.node.name)[:30], capacity=4)
+    yield writer
+    writer.close()
+
+
+def append(ring: SampleRing, values) -> None:
+    for v in values:
+        ring.append(v, 0.0, 0.0, float(v), 0.0, float(v))
+
+
+def attach_and_read(name: str) -> subprocess.CompletedProcess:
+    """
+    別プロセスから取り付けて全記録の時刻を読む
+    """
+    code = ("import sys; from jiwai.ring import SampleRing; ring = SampleRing.attach(sys.argv[1]); "
+            "print([r[0] for r in ring.read_since(0)[0]]); ring.close()")
+    return subprocess.run([sys.executable, "-c", code, name], cwd=REPO_DIR, capture_output=True, text=True)
+
+
+def test_read_since_returns_new_records(ring):
+    append(ring, range(3))
+    records, cursor, lost = ring.read_since(0)
+    assert [r[0] for r in records] == [0, 1, 2]
+    assert (cursor, lost) == (3, 0)
+    assert ring.read_since(cursor) == ([], 3, 0)
+
+
+def test_reader_in_other_process(ring):
+    append(ring, range(6))
+    assert attach_and_read(ring.name).stdout.strip() == "[2, 3, 4, 5]"
+
+
+def test_wraparound_counts_lost_records(ring):
+    append(ring, range(3))
+    _, cursor, _ = ring.read_since(0)
+    append(ring, range(3, 10))
+    records, cursor, lost = ring.read_since(cursor)
+    assert [r[0] for r in records] == [6, 7, 8, 9]  # 容量4を超えた分は上書きされている
+    assert (cursor, lost) == (10, 3)
+
+
+def test_slot_being_overwritten_is_dropped(ring):
+    append(ring, range(8))
+    # 書き込み側が最も古いスロット(4番目の記録)を上書きしている途中
+    RECORD.pack_into(ring.shm.buf, HEADER.size + RECORD.size * (4 % ring.capacity), 0, 99, 0, 0, 0, 0, 0)
+    assert ring.record(4) is None
+    records, cursor, lost = ring.read_since(4)
+    assert [r[0] for r in records] == [5, 6, 7]
+    assert (cursor, lost) == (8, 1)
+
+
+def test_attach_rejects_other_layout(ring):
+    HEADER.pack_into(ring.shm.buf, 0, b"XXXX", RECORD.size, ring.capacity, 0)
+    assert "not a sample ring" in attach_and_read(ring.name).stderr
+
+
+def test_format_record():
+    text = format_record((0, 1.5, 1.5, 1000.0, 9.0, 1000.0))
+    assert "ISET=  +1.500 A" in text
+    assert "Field= +1000.0 G" in text
@@ -0,0 +1,71 @@
+import os
+
+from conftest import loop_rows, write_log
+from jiwai.runindex import RunIndex, index_run
+
+CURRENTS = [0.0, 1.0, 2.0, 1.0, 0.0, -1.0, -2.0, -1.0, 0.0]
+
+
+def make_run(record_base_dir: str, name: str, magnet: str, memo: str = "sample") -> str:
+    return write_log(os.path.join(record_base_dir, "20201010", name), loop_rows(CURRENTS, offset=50.0),
+                     {"sequence": "test_seq.json", "seq_hash": "abcdef", "magnet": magnet, "control": "current"})
+
+
+def test_update_reads_only_changed_logs(tmp_path):
+    logs = str(tmp_path / "logs")
+    first = make_run(logs, "2020-10-10_12-00-00.log", "ELMG")
+    make_run(logs, "2020-10-10_13-00-00.log", "HELM")
+    index = RunIndex(logs)
+    try:
+        assert index.update() == 2
+        assert index.update() == 0  # 変わっていなければ読み直さない
+
+        with open(first, mode='a', encoding="utf-8") as f:
+            f.write("9.0,1.0,1.0,1050.0,6.0,1000.0,,,,,\n")
+        assert index.update() == 1
+        (run,) = index.query(magnet="ELMG")
+        assert run["records"] == len(CURRENTS) + 1
+
+        os.remove(first)
+        assert index.update() == 0
+        assert [r["magnet"] for r in index.query()] == ["HELM"]
+    finally:
+        index.close()
+
+
+def test_run_summary_and_metrics(tmp_path):
+    logs = str(tmp_path / "logs")
+    run = index_run(logs, make_run(logs, "2020-10-10_12-00-00.log", "ELMG"))
+    assert run["path"] == os.path.join("20201010", "2020-10-10_12-00-00.log")
+    assert (run["sequence"], run["magnet"], run["control"]) == ("test_seq.json", "ELMG", "current")
+    assert run["points"] == len(CURRENTS)
+    assert (run["field_min"], run["field_max"]) == (-1950.0, 2050.0)
+    assert run["remanence_field"] == 50.0
+    assert run["field_error_max"] is None  # 電流制御では誤差を求めない
+
+
+def test_query_filters(tmp_path):
+    logs = str(tmp_path / "logs")
+    make_run(logs, "2020-10-10_12-00-00.log", "ELMG")
+    index = RunIndex(logs)
+    try:
+        index.update()
+        assert len(index.query(seq_hash="abc", memo="samp", since="2020-10-10", until="2020-10-11")) == 1
+        assert index.query(memo="other") == []
+        assert index.query(since="2020-10-11") == []
+    finally:
+        index.close()
+
+
+def test_broken_log_is_skipped(tmp_path):
+    logs = str(tmp_path / "logs")
+    path = os.path.join(logs, "20201010", "2020-10-10_12-00-00.log")
+    os.makedirs(os.path.dirname(path))
+    with open(path, mode='w', encoding="utf-8") as f:
+        f.write("開始時刻,2020-10-10_12-00-00\n1.0,2.0\n")  # 区切りの行がない
+    index = RunIndex(logs)
+    try:
+        assert index.update() == 0
+        assert index.query() == []
+    finally:
+        index.close()
@@ -0,0 +1,51 @@
+import pytest
+
+from jiwai.sequence import LinearSegment, LogSegment, SegmentSequence, parse_sequence, parse_sub_sequence
+
+
+def test_linear_segment():
+    assert list(LinearSegment(4000, -4000, 2000)) == [4000, 2000, 0, -2000, -4000]
+    assert list(LinearSegment(0, 250, 100)) == [0, 100, 200]  # 刻みに乗らない終点は含まない
+    assert list(LinearSegment(0.0, 0.3, 0.1)) == [0.0, 0.1, 0.2, 0.3]
+    with pytest.raises(ValueError):
+        LinearSegment(0, 100, 0)
+
+
+def test_log_segment():
+    assert list(LogSegment(1000, 10, 3)) == [1000, 100, 10]
+    crossing = LogSegment(100, -100, 2, 10)
+    assert list(crossing) == [100, 10, 0, -10, -100]
+    assert crossing[-1] == -100
+    with pytest.raises(ValueError):
+        LogSegment(100, -100, 3)  # 符号が変わるのにminがない
+
+
+def test_segment_sequence_indexing_matches_iteration():
+    seq = parse_sub_sequence([0, {"start": 100, "stop": 300, "step": 100}, 0,
+                              {"repeat": [10, -10], "times": 2}])
+    assert isinstance(seq, SegmentSequence)
+    expanded = [0, 100, 200, 300, 0, 10, -10, 10, -10]
+    assert list(seq) == expanded
+    assert [seq[i] for i in range(len(seq))] == expanded
+    assert seq[-1] == -10
+    assert seq[2:5] == [200, 300, 0]
+    with pytest.raises(IndexError):
+        seq[len(expanded)]
+
+
+def test_literal_lists_are_kept_as_is():
+    spec = [0, 100, 0]
+    assert parse_sub_sequence(spec) is spec
+    assert list(parse_sub_sequence({"start": 0, "stop": 2, "step": 1})) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("spec", [
+    "seq",
+    [[{"start": 0, "stop": 100}]],
+    [[{"repeat": [0, 1], "times": 0}]],
+    [[True, {"start": 0, "stop": 2, "step": 1}]],
+    [["100", {"start": 0, "stop": 2, "step": 1}]],
+])
+def test_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        parse_sequence(spec)
@@ -0,0 +1,52 @@
+from jiwai.sequence import TRANSITION_MIN_BLOCK_TD, plan_transition, sequence_direction
+
+
+def test_sequence_direction():
+    assert sequence_direction([0, 100, 200]) == 1
+    assert sequence_direction([200, 100, 100]) == -1  # 終端の同じ値は飛ばす
+    assert sequence_direction([100, 100]) == 0
+    assert sequence_direction([100]) == 0
+
+
+def test_plan_transition_same_point_skips_approach():
+    plan = plan_transition([0, 100, 200], [200, 100, 0])
+    assert plan.skip_approach
+    assert plan.pre_block_td == TRANSITION_MIN_BLOCK_TD
+
+
+def test_plan_transition_gap_beyond_tolerance():
+    plan = plan_transition([0, 100, 200], [210, 300], tolerance=5)
+    assert not plan.skip_approach
+    assert plan.pre_block_td is None
+
+
+def test_plan_transition_gap_within_tolerance_same_direction():
+    plan = plan_transition([0, 100, 200], [204, 300], tolerance=5)
+    assert not plan.skip_approach  # 開始点へは移動する
+    assert plan.pre_block_td == TRANSITION_MIN_BLOCK_TD
+
+
+def test_plan_transition_reversal_keeps_block():
+    # 増加方向で終わったシークエンスから下へ戻るとヒステリシスの枝が変わる
+    plan = plan_transition([0, 100, 200], [196, 100], tolerance=5)
+    assert not plan.skip_approach
+    assert plan.pre_block_td is None
+
+
+def test_plan_transition_unknown_direction_keeps_block():
+    plan = plan_transition([200, 200], [204], tolerance=5)
+    assert plan.pre_block_td is None
+
+
+def test_plan_transition_keeps_pre_block_for_drift_correction():
+    plan = plan_transition([0, 100, 200], [200, 100, 0], keep_pre_block=True)
+    assert plan.skip_approach
+    assert plan.pre_block_td is None
+    plan = plan_transition([0, 100, 200], [204, 300], tolerance=5, keep_pre_block=True)
+    assert plan.pre_block_td is None
+
+
+def test_plan_transition_empty():
+    plan = plan_transition([], [0, 100])
+    assert not plan.skip_approach
+    assert plan.pre_block_td is None
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+from conftest import REPO_DIR
+from jiwai.session import MeasureCancelledError, Session
+
+
+def test_package_import_is_lazy():
+    # python -m jiwai.<module> の起動時に実行モジュールを先に読み込まないこと
+    code = "import sys, jiwai; print('jiwai.session' in sys.modules); print(jiwai.Session.__module__)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "jiwai.session"]
+
+
+def test_session_opens_instruments_on_first_use(tmp_path):
+    opened = []
+    session = Session(str(tmp_path), power_factory=lambda: opened.append("power"),
+                      gauss_factory=lambda: opened.append("gauss"))
+    assert opened == []
+    assert session.sequence_dir.startswith(str(tmp_path))
+
+
+def test_magnet_field_ctl_reaches_target(make_session, clock):
+    session, rig = make_session("ELMG")
+    session.magnet_field_ctl(1000)
+    clock.sleep(2.0)
+    resolution = 10.0  # レンジ0の表示分解能
+    assert abs(rig.true_field() - 1000) < 2 * resolution
+    status = session.load_status()
+    assert abs(status.field - rig.true_field()) < 3 * resolution
+    assert status.iset == session.power.iset_fetch().A()
+
+
+def test_demag_waveform_alternates_and_decays():
+    waveform = Session.demag_waveform(4000, 4).tolist()
+    assert waveform == [-4000, 2250, -1000, 250]
+
+
+def test_check_cancel(tmp_path):
+    session = Session(str(tmp_path))
+    session.check_cancel()
+    session.cancel_request.set()
+    with pytest.raises(MeasureCancelledError):
+        session.check_cancel()
+    session.check_cancel()  # 一度投げたら要求は消える
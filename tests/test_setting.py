@@ -0,0 +1,41 @@
+import pytest
+
+import jiwai.setting
+import jiwai.status
+from jiwai.setting import SETTLE_POLL_SEC, MeasureSetting
+
+
+@pytest.fixture
+def virtual_setting(make_session, clock, monkeypatch):
+    """
+    ロック時間を仮想時計で測るMeasureSetting
+    """
+    monkeypatch.setattr(jiwai.setting, "time", clock.time_module())
+    monkeypatch.setattr(jiwai.status, "time", clock.time_module())
+    session, rig = make_session("ELMG")
+    return MeasureSetting(None, None, session)
+
+
+def test_fixed_lock_returns_measured_dwell(virtual_setting):
+    assert virtual_setting.lock(1.5) == pytest.approx(1.5)
+
+
+@pytest.mark.parametrize("mode", ["fixed", "settle"])
+def test_no_lock_returns_none(virtual_setting, mode):
+    virtual_setting.lock_mode = mode
+    assert virtual_setting.lock(0) is None
+
+
+def test_settle_lock_ends_early_when_stable(virtual_setting):
+    virtual_setting.lock_mode = "settle"
+    dwell = virtual_setting.lock(5.0)
+    assert virtual_setting.settle_min_sec <= dwell + 1e-9
+    assert dwell < virtual_setting.settle_min_sec + 3 * SETTLE_POLL_SEC
+
+
+def test_settle_lock_is_bounded_by_lock_sec(virtual_setting):
+    virtual_setting.lock_mode = "settle"
+    virtual_setting.settle_current_tol = -1.0  # 落ち着いたとみなさない
+    dwell = virtual_setting.lock(1.0)
+    # 最後の読み取りの分だけは超えうる
+    assert 1.0 <= dwell < 1.0 + SETTLE_POLL_SEC
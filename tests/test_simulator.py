@@ -0,0 +1,61 @@
+import math
+
+from machines_controller import simulator
+
+
+def test_virtual_clock():
+    clock = simulator.VirtualClock(1000.0)
+    clock.sleep(1.5)
+    clock.sleep(-1)
+    assert clock.time() == 1001.5
+    assert clock.monotonic_ns() == clock.time_ns() == 1001_500_000_000
+    assert clock.perf_counter() == 1001.5
+    assert clock.datetime_module().datetime.now().timestamp() == 1001.5
+
+
+def test_field_follows_with_first_order_lag(clock):
+    magnet = simulator.SimulatedMagnet(clock, magnet="HELM")
+    magnet.output = True
+    magnet.iset = 1000.0
+    steady = magnet.steady_field()
+    clock.sleep(magnet.tau)
+    assert math.isclose(magnet.true_field(), steady * (1 - math.exp(-1)), rel_tol=1e-6)
+    clock.sleep(magnet.tau * 20)
+    assert math.isclose(magnet.true_field(), steady, rel_tol=1e-6)
+
+
+def test_backlash_gives_hysteresis(clock):
+    magnet = simulator.SimulatedMagnet(clock)
+    magnet.output = True
+    magnet.iset = 1000.0
+    rising = magnet.steady_field()
+    magnet.iset = 2000.0
+    magnet.steady_field()
+    magnet.iset = 1000.0
+    assert magnet.steady_field() > rising  # 下降側の枝は上昇側より高い
+
+
+def test_gauss_resource_reports_overrange_and_multiplier(clock):
+    magnet = simulator.SimulatedMagnet(clock)
+    magnet.output = True
+    magnet.iset = 1000.0
+    clock.sleep(10)
+    resource = simulator.SimulatedGaussResource(magnet)
+    resource.write("RANGE 3")
+    assert resource.query("FIELD?") == "OL\r\n"
+    resource.write("RANGE 1")
+    value = float(resource.query("FIELD?"))
+    assert resource.query("FIELDM?") == "k\r\n"
+    assert 0.9 < value < 1.2
+    assert resource.query("RANGE?") == "1\r\n"
+
+
+def test_power_resource(clock):
+    magnet = simulator.SimulatedMagnet(clock)
+    resource = simulator.SimulatedPowerResource(magnet)
+    resource.write("OUT 1")
+    resource.write("ISET 1.5 A")
+    assert resource.query("ISET?") == "ISET +1.500A"
+    assert resource.query("IOUT?") == "IOUT +1.500A"
+    assert resource.query("VOUT?") == "VOUT +9.00V"
+    assert resource.query("OUT?") == "OUT 1"
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+from jiwai.station import StationConfig, load_stations, start_station
+
+
+def write_config(tmp_path, data) -> str:
+    path = tmp_path / "stations.json"
+    path.write_text(json.dumps(data) if isinstance(data, dict) else data, encoding="utf-8")
+    return str(path)
+
+
+def test_load_stations(tmp_path):
+    path = write_config(tmp_path, {"stations": [
+        {"name": "A", "power": "GPIB0::4::INSTR", "magnet": "ELMG"},
+        {"name": "B", "gauss": "ASRL4::INSTR", "magnet": "HELM", "base_dir": "helm", "watchdog": False}]})
+    a, b = load_stations(path)
+    assert (a.name, a.magnet, a.base_dir) == ("A", "ELMG", os.path.join(str(tmp_path), "A"))
+    assert (b.gauss_address, b.base_dir, b.watchdog) == ("ASRL4::INSTR", os.path.join(str(tmp_path), "helm"), False)
+    assert b.power_address == StationConfig.power_address
+
+
+@pytest.mark.parametrize("data", [
+    "{broken",
+    {"stations": []},
+    {"stations": [{"name": "A"}, {"name": "A"}]},
+    {"stations": [{"name": "A", "magnet": "BIG"}]},
+])
+def test_load_stations_rejects_bad_config(tmp_path, data):
+    with pytest.raises(ValueError):
+        load_stations(write_config(tmp_path, data))
+
+
+def test_start_station_connects_and_zeroes(make_session):
+    session, rig = make_session("HELM")
+    config = StationConfig({"name": "B", "magnet": "HELM", "watchdog": False})
+    assert start_station(config, session) is session
+    assert session.connect_magnet == "HELM"
+    assert rig.iset == 0
+    assert session.watchdog is None
+
+
+@pytest.mark.parametrize("magnet", ["ELMG", "HELM"])
+def test_start_station_detects_magnet_with_output_off(make_session, magnet):
+    session, rig = make_session(magnet)
+    session.power.allow_output(False)
+    config = StationConfig({"name": "A", "watchdog": False})
+    start_station(config, session)
+    assert session.connect_magnet == magnet
+    assert rig.iset == 0
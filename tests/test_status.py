@@ -0,0 +1,67 @@
+import datetime
+import math
+
+import pytest
+
+import jiwai.status
+from conftest import write_log
+from jiwai.columnar import parse_log
+from jiwai.status import LOG_COLUMNS, StatusList, origin_ns, save_status
+
+
+@pytest.fixture
+def virtual_status_clock(clock, monkeypatch):
+    """
+    応答時刻と基準時刻を仮想時計で進める
+    """
+    monkeypatch.setattr(jiwai.status, "time", clock.time_module())
+    monkeypatch.setattr(jiwai.status, "datetime", clock.datetime_module())
+    origin_ns.cache_clear()
+    yield clock
+    origin_ns.cache_clear()
+
+
+def test_stamps_and_elapsed(virtual_status_clock):
+    clock = virtual_status_clock
+    start_time = clock.datetime_module().datetime.now()
+    clock.sleep(2.0)
+    status = StatusList()
+    status.stamp("iout")
+    clock.sleep(0.5)
+    status.stamp("field")
+    status.set_origin_time(start_time)
+    assert status.diff_second == 2.5  # 最後に応答した装置の時刻
+    assert status.elapsed_ns() == (None, 2_000_000_000, 2_500_000_000, None)
+
+
+def test_origin_is_fixed_per_start_time(virtual_status_clock):
+    clock = virtual_status_clock
+    start_time = clock.datetime_module().datetime.now()
+    first = origin_ns(start_time)
+    clock.sleep(10.0)
+    assert origin_ns(start_time) == first
+
+
+def test_out_tuple_matches_log_columns(tmp_path, virtual_status_clock):
+    status = StatusList()
+    status.iset, status.iout, status.field, status.vout, status.target = 1.0, 1.0, 1040.0, 6.0, 1000
+    status.stamp("field")
+    status.set_origin_time(datetime.datetime.fromtimestamp(virtual_status_clock.time()))
+    status.dwell = 1.25
+    assert len(status.out_tuple()) == len(LOG_COLUMNS)
+
+    path = write_log(str(tmp_path / "a.log"), [])
+    save_status(path, status)
+    _, columns, report = parse_log(path)
+    assert columns["field"][0] == 1040.0
+    assert columns["t_field"][0] == 0.0
+    assert math.isnan(columns["t_iset"][0])  # 読み取らなかった値の時刻は空欄
+    assert columns["dwell"][0] == 1.25
+    assert report["skipped"] == 0
+
+
+def test_load_status_stamps_only_read_values(make_session):
+    session, _ = make_session()
+    status = session.load_status(iset=False, vout=False)
+    assert status.iset_ns is None and status.vout_ns is None
+    assert status.iout_ns is not None and status.field_ns is not None
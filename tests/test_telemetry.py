@@ -0,0 +1,54 @@
+import json
+import queue
+import select
+import socket
+
+from jiwai.telemetry import Telemetry
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_full_client_queue_drops_events():
+    telemetry = Telemetry()
+    events = queue.Queue(2)
+    telemetry.add_client(events)
+    for i in range(5):
+        telemetry.publish({"i": i})
+    assert events.qsize() == 2
+    assert telemetry.dropped == 3
+    telemetry.remove_client(events)
+    telemetry.publish({"i": 5})
+    assert telemetry.dropped == 3
+
+
+def test_channel_tags_station_and_phases():
+    telemetry = Telemetry()
+    events = queue.Queue()
+    telemetry.add_client(events)
+    channel = telemetry.channel("B")
+    channel.publish("oectl", target=100)
+    channel.phase_begin("oectl/ramp", 0)
+    first, second = events.get_nowait(), events.get_nowait()
+    assert (first["station"], first["kind"], first["target"]) == ("B", "oectl", 100)
+    assert (second["kind"], second["phase"]) == ("phase_begin", "oectl/ramp")
+
+
+def test_events_reach_tcp_client():
+    telemetry = Telemetry(port=free_port())
+    telemetry.start()
+    try:
+        with socket.create_connection((telemetry.host, telemetry.port), timeout=5) as sock:
+            reader = sock.makefile("r", encoding="utf-8")
+            channel = telemetry.channel()
+            for _ in range(500):  # クライアントが登録されるまで配信し続ける
+                channel.publish("status", field=1.0)
+                if select.select([sock], [], [], 0.01)[0]:
+                    break
+            event = json.loads(reader.readline())
+    finally:
+        telemetry.stop()
+    assert (event["station"], event["kind"], event["field"]) == ("default", "status", 1.0)
@@ -0,0 +1,52 @@
+import json
+import threading
+
+from machines_controller.io_stats import IOStats
+from machines_controller.timeline import PhaseTimeline, aggregate, report
+
+
+def test_timeline_records_phases_per_point(tmp_path):
+    stats = IOStats()
+    filepath = str(tmp_path / "run.timeline.jsonl")
+    timeline = PhaseTimeline(filepath, stats)
+    timeline.point("pre_block")
+    with stats.phase("block"):
+        pass
+    for i, target in enumerate((100, 200)):
+        timeline.point(i, target)
+        with stats.phase("oectl"), stats.phase("ramp"):
+            pass
+
+    def watchdog():
+        with stats.phase("watchdog"):  # 測定スレッド以外は記録しない
+            pass
+
+    thread = threading.Thread(target=watchdog)
+    thread.start()
+    thread.join()
+    timeline.close()
+
+    with open(filepath, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [(e["point"], e["phase"]) for e in entries] == [
+        ("pre_block", "block"), (0, "oectl/ramp"), (0, "oectl"), (1, "oectl/ramp"), (1, "oectl")]
+    assert entries[1]["target"] == 100
+    assert all(e["end_ns"] >= e["start_ns"] for e in entries)
+
+
+def test_aggregate_counts_points_across_files(tmp_path):
+    paths = []
+    for name in ("a", "b"):
+        path = tmp_path / "{0}.timeline.jsonl".format(name)
+        lines = [{"point": 0, "target": 0, "phase": "oectl", "start_ns": 0, "end_ns": 2_000_000_000},
+                 {"point": 0, "target": 0, "phase": "oectl", "start_ns": 0, "end_ns": 1_000_000_000}]
+        path.write_text("\n".join(json.dumps(x) for x in lines) + "\n\n", encoding="utf-8")
+        paths.append(str(path))
+
+    stat = aggregate(paths)["oectl"]
+    assert stat["count"] == 4
+    assert stat["points"] == 2  # ファイルごとに別の測定点
+    assert stat["total_sec"] == 6.0
+    assert stat["mean_sec"] == 1.5
+    assert stat["max_sec"] == 2.0
+    assert "oectl" in report(paths)
@@ -0,0 +1,44 @@
+import pytest
+
+from machines_controller import simulator
+from machines_controller.bipolar_power_ctl import BipolarPower, Current
+from machines_controller.visa_trace import ReplayResource, TraceMismatchError, TraceRecorder
+
+
+def record_session(trace_path: str, rig: simulator.SimulatedMagnet) -> list:
+    resource = TraceRecorder(simulator.SimulatedPowerResource(rig), trace_path, "BipolarPower")
+    power = BipolarPower(resource=resource)
+    rig.output = True
+    power.set_iset(Current(500, "mA"))
+    readings = [power.iout_fetch(), power.vout_fetch()]
+    resource.close()
+    return readings
+
+
+def test_replay_returns_recorded_responses(tmp_path, rig):
+    trace_path = str(tmp_path / "power.trace")
+    readings = record_session(trace_path, rig)
+
+    replay = ReplayResource(trace_path)
+    assert replay.header["instrument"] == "BipolarPower"
+    power = BipolarPower(resource=replay)
+    power.set_iset(Current(500, "mA"))
+    assert [power.iout_fetch(), power.vout_fetch()] == readings
+
+
+def test_strict_replay_rejects_other_commands(tmp_path, rig):
+    trace_path = str(tmp_path / "power.trace")
+    record_session(trace_path, rig)
+    power = BipolarPower(resource=ReplayResource(trace_path))
+    with pytest.raises(TraceMismatchError):
+        power.vout_fetch()  # 記録ではランプの前のIOUT?が先
+
+
+def test_loose_replay_skips_ahead_and_repeats(tmp_path, rig):
+    trace_path = str(tmp_path / "power.trace")
+    readings = record_session(trace_path, rig)
+    power = BipolarPower(resource=ReplayResource(trace_path, strict=False))
+    assert power.vout_fetch() == readings[1]
+    assert power.vout_fetch() == readings[1]  # 記録を使い切ったら最後の応答を返す
+    with pytest.raises(TraceMismatchError):
+        power.iset_fetch()
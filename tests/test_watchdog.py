@@ -0,0 +1,88 @@
+import pytest
+
+from machines_controller.bipolar_power_ctl import Current, PowerInterlockError
+from machines_controller.watchdog import Watchdog
+
+
+def test_quiet_output_passes(power, gauss, rig):
+    rig.output = True
+    power.set_iset(Current(500, "mA"))
+    watchdog = Watchdog(power, gauss)
+    watchdog.field_limit = 4000.0
+    assert watchdog.check() is None
+
+
+def test_overload(power, gauss, rig):
+    rig.output = True
+    rig.resistance = 100.0
+    rig.iset = 500.0  # 電源側の過負荷確認を通らずに流れている状態
+    assert Watchdog(power, gauss).check().startswith("電源過負荷")
+
+
+def test_open_circuit_needs_consecutive_detections(power, gauss, rig):
+    rig.output = False  # ISETを書いても電流が流れない
+    rig.iset = 500.0
+    watchdog = Watchdog(power, gauss)
+    assert watchdog.check() is None
+    assert watchdog.check() is None
+    assert watchdog.check().startswith("断線")
+
+
+def test_runaway_field(power, gauss, rig):
+    rig.output = True
+    power.set_iset(Current(1000, "mA"))
+    watchdog = Watchdog(power, gauss)
+    watchdog.field_limit = 500.0
+    results = [watchdog.check() for _ in range(watchdog.TRIP_COUNT)]
+    assert results[-1].startswith("磁界暴走")
+
+
+def test_trip_ramps_down_and_holds_interlock(power, gauss, rig):
+    rig.output = True
+    power.set_iset(Current(1000, "mA"))
+    watchdog = Watchdog(power, gauss)
+    watchdog.trip("test")
+    assert watchdog.tripped
+    assert rig.iset == 0
+    with pytest.raises(PowerInterlockError):
+        power.set_iset(Current(100, "mA"))
+    power.set_iset(Current(0, "mA"))  # 0 mAへの設定は許す
+
+    watchdog.reset()
+    assert not watchdog.tripped
+    power.set_iset(Current(100, "mA"))
+    assert rig.iset == 100
+
+
+def ramp_delays(power, clock, monkeypatch, current: Current) -> set:
+    """
+    set_isetのランプでステップごとに待った時間
+    """
+    delays = set()
+    monkeypatch.setattr("time.sleep", lambda sec: (delays.add(sec), clock.sleep(sec)))
+    power.set_iset(current)
+    return delays
+
+
+def test_start_shortens_ramp_delay(power, gauss, rig, clock, monkeypatch):
+    rig.output = True
+    watchdog = Watchdog(power, gauss, interval=0.01)
+    watchdog.start()
+    try:
+        delays = ramp_delays(power, clock, monkeypatch, Current(1000, "mA"))
+    finally:
+        watchdog.stop()
+    assert delays == {power.CURRENT_CHANGE_DELAY * power.MONITORED_DELAY_RATIO}
+    assert ramp_delays(power, clock, monkeypatch, Current(0, "mA")) == {power.CURRENT_CHANGE_DELAY}
+
+
+def test_monitored_delay_keeps_helmholtz_ratio(power, gauss, rig, clock, monkeypatch):
+    rig.output = True
+    power.CURRENT_CHANGE_DELAY = 0.3  # 接続時にヘルムホルツコイル用に設定される値
+    watchdog = Watchdog(power, gauss, interval=0.01)
+    watchdog.start()
+    try:
+        delays = ramp_delays(power, clock, monkeypatch, Current(1000, "mA"))
+    finally:
+        watchdog.stop()
+    assert delays == {0.3 * power.MONITORED_DELAY_RATIO}